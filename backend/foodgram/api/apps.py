@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import cache, feed, recipe_index, units, utils  # noqa: F401
+        from .search import create_sqlite_search_index
+        post_migrate.connect(create_sqlite_search_index,
+                             sender=self.apps.get_app_config('recipes'))
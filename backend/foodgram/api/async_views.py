@@ -0,0 +1,52 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def call_view(view, request, *args, **kwargs):
+    '''Выполняет синхронную вьюху в текущем потоке вместе с отрисовкой
+       ответа и закрывает устаревшие соединения с базой этого потока.'''
+
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    '''Асинхронная вьюха для ASGI. Под ASGI Django 3.2 выполняет все
+       синхронные вьюхи процесса в одном общем потоке; чтения здесь
+       выполняются параллельно в пуле потоков, запись - как раньше.'''
+
+    read = sync_to_async(call_view, thread_sensitive=False)
+    write = sync_to_async(call_view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        run = read if request.method in READ_METHODS else write
+        return await run(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+recipe_list = async_view(RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'}))
+recipe_detail = async_view(RecipeViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+     'delete': 'destroy'}))
+tag_list = async_view(TagViewSet.as_view({'get': 'list'}))
+tag_detail = async_view(TagViewSet.as_view({'get': 'retrieve'}))
+ingredient_list = async_view(IngredientViewSet.as_view(
+    {'get': 'list', 'post': 'create'}))
+ingredient_detail = async_view(IngredientViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+     'delete': 'destroy'}))
@@ -0,0 +1,109 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import response
+from recipes.models import Ingredient, Tag
+
+CACHE_TIMEOUT = getattr(settings, 'API_CACHE_TIMEOUT', 300)
+# Кэш версий: общий для процессов, записи без срока хранения.
+VERSION_CACHE = 'versions'
+
+
+def version_key(model):
+    return f'api:version:{model._meta.label_lower}'
+
+
+def get_version(model):
+    '''Версия данных модели - время последнего изменения в микросекундах.
+       Версии не истекают, поэтому ETag и Last-Modified меняются только
+       с данными. Если версии ещё нет в кэше (первый запуск, очистка
+       кэша), считаем, что данные изменились сейчас.'''
+
+    versions = caches[VERSION_CACHE]
+    key = version_key(model)
+    version = versions.get(key)
+    if version is None:
+        versions.add(key, time.time_ns() // 1000, None)
+        version = versions.get(key)
+    return version
+
+
+def bump_version(*models):
+    '''Сбрасывает закэшированные ответы, построенные по данным моделей,
+       во всех процессах. Возвращает новую версию.'''
+
+    version = time.time_ns() // 1000
+    caches[VERSION_CACHE].set_many(
+        {version_key(model): version for model in models}, None)
+    return version
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_cached_responses(sender, *a, **kw):
+    '''Изменили справочник - меняем его версию после коммита.'''
+
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+def tag_map():
+    '''Соответствие слагов тегов их id, из кэша по версии тегов.'''
+
+    key = f'api:tag_map:{get_version(Tag)}'
+    tags = cache.get(key)
+    if tags is None:
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tags, CACHE_TIMEOUT)
+    return tags
+
+
+class VersionedCacheMixin:
+    '''Кэширует ответы list/retrieve по версии моделей из cache_models
+       и отвечает 304 Not Modified по ETag и Last-Modified.'''
+
+    cache_models = ()
+
+    def cached_response(self, request, view, *args, **kwargs):
+        versions = [get_version(model) for model in self.cache_models]
+        key = hashlib.sha1(
+            f'{versions}:{request.accepted_renderer.format}:'
+            f'{request.get_full_path()}'.encode()
+        ).hexdigest()
+        headers = {
+            'ETag': quote_etag(key),
+            'Last-Modified': http_date(max(versions) // 10 ** 6),
+        }
+        result = get_conditional_response(
+            request,
+            etag=headers['ETag'],
+            last_modified=max(versions) // 10 ** 6,
+        )
+        if result is None:
+            data = cache.get(f'api:response:{key}')
+            if data is None:
+                result = view(request, *args, **kwargs)
+                if result.status_code != 200:
+                    return result
+                data = result.data
+                cache.set(f'api:response:{key}', data, CACHE_TIMEOUT)
+            result = response.Response(data)
+        for header, value in headers.items():
+            result[header] = value
+        patch_cache_control(result, no_cache=True)
+        return result
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs)
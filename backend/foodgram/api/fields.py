@@ -0,0 +1,257 @@
+import base64
+import binascii
+import re
+import shutil
+import struct
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+# Размер части base64 при декодировании, кратен 4.
+CHUNK_SIZE = 64 * 1024
+IMAGE_MAX_BYTES = getattr(settings, 'IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+IMAGE_MAX_PIXELS = getattr(settings, 'IMAGE_MAX_PIXELS', 25_000_000)
+IMAGE_DECODE_WORKERS = getattr(settings, 'IMAGE_DECODE_WORKERS', 2)
+EXIF_ORIENTATION = 0x0112
+# Переводы строк и пробелы, которые допускаются внутри base64.
+BASE64_SPACES = re.compile(r'[ \t\r\n]+')
+# Метаданные, которые вырезаются из файла: маркеры JPEG APP1 (EXIF, XMP),
+# APP13 (IPTC) и COM, текстовые чанки PNG, чанки EXIF и XMP в WEBP.
+JPEG_STRIP = {0xE1, 0xED, 0xFE}
+PNG_STRIP = {b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'}
+WEBP_STRIP = {b'EXIF', b'XMP '}
+
+
+def copy_bytes(source, output, length):
+    while length:
+        data = source.read(min(length, CHUNK_SIZE))
+        if not data:
+            raise ValueError('Неожиданный конец файла.')
+        output.write(data)
+        length -= len(data)
+
+
+def read_jpeg_marker(source):
+    '''Читает маркер JPEG, пропуская байты-заполнители 0xFF перед ним.'''
+
+    byte = source.read(1)
+    if byte != b'\xff':
+        raise ValueError('Некорректный маркер JPEG.')
+    while byte == b'\xff':
+        byte = source.read(1)
+    if not byte:
+        raise ValueError('Неожиданный конец файла.')
+    return b'\xff' + byte
+
+
+def strip_jpeg(source, output, orientation):
+    '''Копирует JPEG без метаданных. Ориентация сохраняется в
+       минимальном EXIF, чтобы картинка не оказалась повёрнутой.'''
+
+    output.write(source.read(2))
+    pending = b''
+    if orientation and orientation != 1:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        exif = exif.tobytes()
+        pending = b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+    while True:
+        marker = read_jpeg_marker(source)
+        if marker[1] != 0xE0:
+            output.write(pending)
+            pending = b''
+        if marker[1] in (0xDA, 0xD9):
+            # Дальше сжатые данные - копируем как есть.
+            output.write(marker)
+            shutil.copyfileobj(source, output, CHUNK_SIZE)
+            return
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+            output.write(marker)
+            continue
+        head = source.read(2)
+        length = struct.unpack('>H', head)[0] - 2
+        if marker[1] in JPEG_STRIP:
+            source.seek(length, 1)
+            continue
+        output.write(marker + head)
+        copy_bytes(source, output, length)
+
+
+def strip_png(source, output, orientation):
+    output.write(source.read(8))
+    while True:
+        head = source.read(8)
+        length, chunk_type = struct.unpack('>I', head[:4])[0], head[4:]
+        if chunk_type in PNG_STRIP:
+            source.seek(length + 4, 1)
+            continue
+        output.write(head)
+        copy_bytes(source, output, length + 4)
+        if chunk_type == b'IEND':
+            return
+
+
+def strip_webp(source, output, orientation):
+    output.write(source.read(12))
+    while True:
+        head = source.read(8)
+        if not head:
+            break
+        chunk_type, length = head[:4], struct.unpack('<I', head[4:])[0]
+        length += length & 1
+        if chunk_type in WEBP_STRIP:
+            source.seek(length, 1)
+            continue
+        output.write(head)
+        if chunk_type == b'VP8X':
+            # Снимаем флаги наличия EXIF и XMP.
+            flags = source.read(1)
+            if not flags:
+                raise ValueError('Неожиданный конец файла.')
+            output.write(bytes([flags[0] & ~0x0C]))
+            length -= 1
+        copy_bytes(source, output, length)
+    size = output.tell() - 8
+    output.seek(4)
+    output.write(struct.pack('<I', size))
+    output.seek(0, 2)
+
+
+def copy_image(source, output, orientation):
+    shutil.copyfileobj(source, output, CHUNK_SIZE)
+
+
+# Формат Pillow: расширение, MIME-тип и функция копирования без метаданных.
+IMAGE_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg', strip_jpeg),
+    'PNG': ('png', 'image/png', strip_png),
+    'WEBP': ('webp', 'image/webp', strip_webp),
+    'GIF': ('gif', 'image/gif', copy_image),
+}
+
+# Одновременно обрабатывается не больше IMAGE_DECODE_WORKERS картинок,
+# остальные загрузки ждут очереди и не раздувают память процесса.
+decoder = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS,
+                             thread_name_prefix='decode')
+
+
+def decoded_size(data, start=0):
+    '''Размер данных после декодирования base64 с позиции start без
+       самого декодирования и копирования строки. Пробелы и переводы
+       строк не считаются.'''
+
+    spaces = sum(data.count(space, start) for space in ' \t\r\n')
+    padding = data.endswith('==') + data.endswith('=')
+    return (len(data) - start - spaces) // 4 * 3 - padding
+
+
+def decode_base64(data, start, output):
+    '''Декодирует base64 с позиции start частями в файл. Пробелы и
+       переводы строк между частями пропускаются, остаток части, не
+       кратный 4 символам, переносится в следующую.'''
+
+    rest = ''
+    for begin in range(start, len(data), CHUNK_SIZE):
+        chunk = rest + BASE64_SPACES.sub('', data[begin:begin + CHUNK_SIZE])
+        end = len(chunk) - len(chunk) % 4
+        output.write(base64.b64decode(chunk[:end], validate=True))
+        rest = chunk[end:]
+    if rest:
+        raise ValueError('Длина base64 не кратна 4.')
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    '''Картинка в base64, в том числе с заголовком data:...;base64,.
+       Размер проверяется до декодирования, base64 декодируется частями
+       во временный файл, размер в пикселях проверяется по заголовку
+       картинки, затем картинка проверяется целиком. Метаданные (EXIF,
+       XMP, IPTC) вырезаются без перекодирования в пуле потоков
+       ограниченного размера.'''
+
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение в base64.',
+        'invalid_type': 'Поддерживаются форматы JPEG, PNG, WEBP и GIF.',
+        'too_large': 'Размер картинки больше {max_bytes} байт.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+
+    def __init__(self, *args, max_bytes=IMAGE_MAX_BYTES,
+                 max_pixels=IMAGE_MAX_PIXELS, **kwargs):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail('invalid_image')
+        # Заголовок пропускается по позиции: срез скопировал бы всю
+        # строку.
+        header = data.rfind(';base64,')
+        begin = header + len(';base64,') if header >= 0 else 0
+        if decoded_size(data, begin) > self.max_bytes:
+            self.fail('too_large', max_bytes=self.max_bytes)
+        with TemporaryFile() as source:
+            try:
+                decode_base64(data, begin, source)
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
+            source.seek(0)
+            output, image_format = decoder.submit(
+                self.sanitize, source).result()
+        extension, content_type, _ = IMAGE_FORMATS[image_format]
+        size = output.tell()
+        output.seek(0)
+        return UploadedFile(output, name=f'{uuid.uuid4()}.{extension}',
+                            content_type=content_type, size=size)
+
+    def sanitize(self, source):
+        '''Проверяет формат и размер картинки по заголовку, затем
+           данные картинки целиком, и копирует её без метаданных.'''
+
+        try:
+            with Image.open(source) as image:
+                image_format = image.format
+                width, height = image.size
+                orientation = image.getexif().get(EXIF_ORIENTATION)
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        if image_format not in IMAGE_FORMATS:
+            self.fail('invalid_type')
+        if width * height > self.max_pixels:
+            self.fail('too_many_pixels', max_pixels=self.max_pixels)
+        source.seek(0)
+        if not self.verify(source):
+            self.fail('invalid_image')
+        _, _, strip = IMAGE_FORMATS[image_format]
+        source.seek(0)
+        output = TemporaryFile()
+        try:
+            strip(source, output, orientation)
+        except (ValueError, struct.error):
+            output.close()
+            self.fail('invalid_image')
+        return output, image_format
+
+    @staticmethod
+    def verify(source):
+        '''Проверяет, что данные картинки не обрезаны и не повреждены.
+           PNG проверяется по контрольным суммам чанков без распаковки
+           пикселей, JPEG декодируется в масштабе 1/8, остальные форматы -
+           целиком: размер уже ограничен max_pixels.'''
+
+        try:
+            with Image.open(source) as image:
+                if image.format == 'PNG':
+                    image.verify()
+                else:
+                    width, height = image.size
+                    image.draft(image.mode, (width // 8, height // 8))
+                    image.load()
+        except (OSError, SyntaxError, ValueError, struct.error):
+            return False
+        return True
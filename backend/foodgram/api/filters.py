@@ -1,17 +1,51 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Recipe, Ingredient
 from users.models import User
 
+from .cache import tag_map
+from .search import search_recipes
+
 
 # fmt: off
 class RecipeFilter(FilterSet):
     '''Фильтр для рецептов.'''
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in tag_map()],
+        method='filter_tags')
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='filter_ordering')
+
+    ORDERINGS = {
+        'popular': ('-favorites_count', '-id'),
+        'trending': ('-score', '-id'),
+    }
+
+    def filter_tags(self, queryset, name, value):
+        '''Рецепты с любым из тегов: подзапрос EXISTS вместо JOIN,
+           поэтому без дублей и без DISTINCT.'''
+
+        tags = tag_map()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[tags[slug] for slug in value if slug in tags],
+        )))
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        '''Сортировка по популярности (число добавлений в избранное) или
+           по рейтингу трендов, который пересчитывает update_scores.'''
+
+        return queryset.order_by(*self.ORDERINGS[value])
 
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
@@ -25,7 +59,8 @@ class RecipeFilter(FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
 
 
 class IngredientFilter(FilterSet):
@@ -0,0 +1,130 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+
+from .storage import content_hash, hash_from_name
+
+# Варианты картинки рецепта: название и размер стороны, в которую
+# вписывается картинка. Порядок - от большего к меньшему.
+VARIANTS = (
+    ('full', 1280),
+    ('card', 480),
+    ('thumb', 160),
+)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+VARIANTS_DIR = 'recipes/variants'
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 2)
+# Варианты лежат в том же хранилище, что и оригиналы: их видит и
+# удаляет collect_media.
+storage = Recipe._meta.get_field('image').storage
+
+
+def variant_name(image_hash, variant, extension):
+    return (f'{VARIANTS_DIR}/{image_hash[:2]}/{image_hash}/'
+            f'{variant}.{extension}')
+
+
+def variant_names(image_hash):
+    return [variant_name(image_hash, variant, extension)
+            for variant, _ in VARIANTS for extension, *_ in FORMATS]
+
+
+def image_variants(image_hash, request=None):
+    '''Ссылки на варианты картинки в духе srcset:
+       {вариант: {'size': размер, формат: ссылка}}.'''
+
+    if not image_hash:
+        return None
+    result = {}
+    for variant, size in VARIANTS:
+        result[variant] = {'size': size}
+        for extension, *_ in FORMATS:
+            url = storage.url(
+                variant_name(image_hash, variant, extension))
+            result[variant][extension] = (
+                request.build_absolute_uri(url) if request else url)
+    return result
+
+
+def render_variants(source):
+    '''Декодирует картинку один раз и кодирует все варианты, уменьшая
+       её последовательно от большего варианта к меньшему. JPEG
+       декодируется сразу в уменьшенном масштабе, файл не читается в
+       память целиком.'''
+
+    image = Image.open(source)
+    largest = VARIANTS[0][1]
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    for variant, size in VARIANTS:
+        image.thumbnail((size, size), Image.LANCZOS)
+        for extension, image_format, options in FORMATS:
+            output = BytesIO()
+            image.save(output, image_format, **options)
+            yield variant, extension, output.getvalue()
+
+
+def build_variants(recipe_id, force=False):
+    '''Строит варианты картинки рецепта и сохраняет их под именами по
+       хэшу содержимого. Одинаковые картинки делят одни файлы.'''
+
+    recipe = Recipe.objects.filter(id=recipe_id).only(
+        'id', 'image', 'image_hash').first()
+    if recipe is None or not recipe.image:
+        return None
+    image_hash = hash_from_name(recipe.image.name)
+    if len(image_hash) != 64:
+        # Файл загружен до хранилища по содержимому.
+        with storage.open(recipe.image.name) as image:
+            image_hash = content_hash(image)
+    if image_hash == recipe.image_hash and not force:
+        return image_hash
+    missing = [name for name in variant_names(image_hash)
+               if force or not storage.exists(name)]
+    if missing:
+        with storage.open(recipe.image.name) as image:
+            for variant, extension, content in render_variants(image):
+                name = variant_name(image_hash, variant, extension)
+                if name in missing:
+                    storage.write(name, ContentFile(content))
+    # Картинку могли заменить, пока строились варианты.
+    Recipe.objects.filter(id=recipe_id, image=recipe.image.name).update(
+        image_hash=image_hash)
+    return image_hash
+
+
+def schedule_variants(recipe):
+    '''Ставит новую картинку рецепта в очередь на построение вариантов:
+       пустой image_hash. Варианты строит команда build_image_variants
+       (постоянно - с --watch) вне веб-процесса, до этого API отдаёт
+       только оригинал.'''
+
+    if recipe.image_hash:
+        Recipe.objects.filter(id=recipe.id).update(image_hash='')
+        recipe.image_hash = ''
+
+
+def delete_variants(image_hash):
+    '''Удаляет варианты, если картинка больше ни у кого не используется.
+       Возвращает число освобождённых байт.'''
+
+    if not image_hash or Recipe.objects.filter(
+            image_hash=image_hash).exists():
+        return 0
+    freed = 0
+    for name in variant_names(image_hash):
+        if storage.exists(name):
+            freed += storage.size(name)
+            storage.delete(name)
+    return freed
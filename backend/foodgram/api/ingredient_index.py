@@ -0,0 +1,60 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+from .cache import get_version
+
+SEARCH_LIMIT = 50
+
+
+class IngredientIndex:
+    '''Индекс ингредиентов в памяти процесса для автодополнения.
+       Названия в нижнем регистре хранятся отсортированными, поэтому
+       поиск по префиксу - это бинарный поиск. Индекс строится при первом
+       обращении и сбрасывается при изменении ингредиентов, в том числе
+       в других процессах - по версии справочника в кэше.'''
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _load(self, version):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].casefold(), item['id'])
+        )
+        keys = [item['name'].casefold() for item in items]
+        return version, keys, items
+
+    def _get(self):
+        version = get_version(Ingredient)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == version:
+            return snapshot
+        # Индекс строит один поток, остальные дожидаются его.
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[0] != version:
+                snapshot = self._snapshot = self._load(version)
+        return snapshot
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        '''Ингредиенты, подходящие под запрос: сначала точное совпадение,
+           затем совпадения по началу названия, затем по подстроке.'''
+
+        _, keys, items = self._get()
+        query = query.casefold()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\U0010ffff', start)
+        result = items[start:min(end, start + limit)]
+        if len(result) < limit:
+            for position, key in enumerate(keys):
+                if query in key and not key.startswith(query):
+                    result.append(items[position])
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingredient_index = IngredientIndex()
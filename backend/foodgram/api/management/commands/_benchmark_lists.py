@@ -0,0 +1,206 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from recipes.models import (
+    Cart,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingListItem,
+)
+from users.models import Follow, User
+
+from api.management.commands._benchmark_seed import PASSWORD
+from api.pagination import RecipePagination
+from api.utils import recipes_ingredients, refresh_shopping_list
+
+# Авторов на странице списка подписок при замере по числу подписок.
+SUBSCRIPTIONS_PAGE = 100
+
+
+class ListsMixin:
+    '''Списки, которые растут вместе с данными: лента подписок, выгрузка
+       списка покупок и глубокие страницы списка рецептов.'''
+
+    def run_feed(self, feed_follows, options):
+        '''Задержка ленты подписок в зависимости от числа подписок: для
+           каждого числа - новый пользователь, подписанный на столько
+           авторов, замер первой страницы и страницы через пять, а также
+           списка подписок по SUBSCRIPTIONS_PAGE авторов на странице.'''
+
+        if not feed_follows:
+            return {}
+        rng = random.Random(options['seed'])
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'author{number}',
+                 email=f'author{number}@example.com',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for number in range(feed_follows[-1])
+        ], batch_size=1000)
+        authors = list(User.objects.filter(
+            username__startswith='author').order_by('id'))
+        image = Recipe.objects.values_list('image', flat=True).first()
+        Recipe.objects.bulk_create([
+            Recipe(name=f'Рецепт автора {number}', author=author,
+                   text='Описание', cooking_time=rng.randint(5, 120),
+                   image=image)
+            for author in authors
+            for number in range(options['feed_recipes_per_author'])
+        ], batch_size=1000)
+        results = {}
+        for follows in feed_follows:
+            reader = User.objects.create(
+                username=f'reader{follows}',
+                email=f'reader{follows}@example.com', password=password)
+            Follow.objects.bulk_create([
+                Follow(user=reader, author=author)
+                for author in authors[:follows]
+            ], batch_size=1000)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token '
+                               + Token.objects.create(user=reader).key)
+            path = '/api/recipes/feed/'
+            for _ in range(5):
+                next_page = client.get(path).data['next']
+                if next_page is None:
+                    break
+                path = next_page.replace('http://testserver', '')
+            results[str(follows)] = {
+                'follows': follows,
+                'first_page': self.measure(
+                    client, 'feed', lambda number: (
+                        'get', '/api/recipes/feed/', None),
+                    options['warmup']),
+                'deep_page': self.measure(
+                    client, 'feed', lambda number: ('get', path, None),
+                    options['warmup']),
+                'subscriptions': self.measure(
+                    client, 'subscriptions', lambda number: (
+                        'get', '/api/users/subscriptions/?limit='
+                        f'{SUBSCRIPTIONS_PAGE}&recipes_limit=3', None),
+                    options['warmup']),
+            }
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'feed {follows}: p50 '
+                    f'{results[str(follows)]["first_page"]["latency_ms"]}')
+        return results
+
+    def run_carts(self, cart_sizes, options):
+        '''Выгрузка списка покупок в зависимости от его размера: для
+           каждого числа - новый пользователь с таким числом рецептов в
+           списке покупок, замер выгрузки в txt, json и pdf. Недостающие
+           рецепты с ингредиентами создаются.'''
+
+        results = {}
+        recipe_ids = self.recipes_with_ingredients(
+            cart_sizes[-1] if cart_sizes else 0, options)
+        for size in cart_sizes:
+            buyer = User.objects.create(
+                username=f'buyer{size}', email=f'buyer{size}@example.com',
+                password=make_password(PASSWORD))
+            Cart.objects.bulk_create([
+                Cart(user=buyer, recipe_id=recipe_id)
+                for recipe_id in recipe_ids[:size]
+            ], batch_size=1000)
+            refresh_shopping_list([buyer.id],
+                                  recipes_ingredients(recipe_ids[:size]))
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token '
+                               + Token.objects.create(user=buyer).key)
+            results[str(size)] = {
+                'recipes': size,
+                'items': ShoppingListItem.objects.filter(user=buyer).count(),
+                **{
+                    export: self.measure(
+                        client, 'download', lambda number, export=export: (
+                            'get', '/api/recipes/download_shopping_cart/'
+                            f'?format={export}', None),
+                        options['warmup'])
+                    for export in ('txt', 'json', 'pdf')
+                },
+            }
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'cart {size}: p50 '
+                    f'{results[str(size)]["txt"]["latency_ms"]["p50"]} мс')
+        return results
+
+    def recipes_with_ingredients(self, count, options):
+        '''id count рецептов с ингредиентами: рецепты ленты и пагинации
+           создаются без них. Недостающие создаются как в seed.'''
+
+        with_ingredients = Recipe.objects.filter(
+            ingredient_list__isnull=False).distinct()
+        missing = count - with_ingredients.count()
+        if missing > 0:
+            rng = random.Random(options['seed'])
+            ingredient_ids = list(Ingredient.objects.values_list(
+                'id', flat=True))
+            image = Recipe.objects.values_list('image', flat=True).first()
+            start = Recipe.objects.count()
+            Recipe.objects.bulk_create([
+                Recipe(name=f'Рецепт для корзины {number}',
+                       author=self.user, text='Описание', cooking_time=10,
+                       image=image)
+                for number in range(missing)
+            ], batch_size=5000)
+            created = Recipe.objects.order_by('id')[start:]
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe_id=recipe_id,
+                                 ingredient_id=ingredient_id,
+                                 amount=rng.randint(1, 500))
+                for recipe_id in created.values_list('id', flat=True)
+                for ingredient_id in rng.sample(
+                    ingredient_ids, options['ingredients_per_recipe'])
+            ], batch_size=5000)
+        return list(with_ingredients.order_by('id').values_list(
+            'id', flat=True)[:count])
+
+    def run_deep_pages(self, options):
+        '''Первая и глубокая (--deep-page) страницы списка рецептов по
+           номеру страницы (OFFSET) и по курсору. Для глубокой страницы
+           создаются недостающие рецепты без ингредиентов и тегов.'''
+
+        page = options['deep_page']
+        if page < 1:
+            return {}
+        limit = RecipePagination.page_size
+        missing = page * limit - Recipe.objects.count()
+        if missing > 0:
+            image = Recipe.objects.values_list('image', flat=True).first()
+            Recipe.objects.bulk_create([
+                Recipe(name=f'Рецепт для пагинации {number}',
+                       author=self.user, text='Описание', cooking_time=10,
+                       image=image)
+                for number in range(missing)
+            ], batch_size=5000)
+        # Курсор на последний рецепт страницы page - 1 в порядке курсора.
+        before = Recipe.objects.order_by(
+            *RecipePagination.cursor_ordering)[(page - 1) * limit - 1]
+        paths = {
+            'page': {1: '/api/recipes/?page=1',
+                     page: f'/api/recipes/?page={page}'},
+            'cursor': {1: '/api/recipes/?cursor=',
+                       page: '/api/recipes/?cursor='
+                       + RecipePagination().encode_cursor(before)},
+        }
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        results = {}
+        for mode, pages in paths.items():
+            for number, path in pages.items():
+                results.setdefault(mode, {})[str(number)] = self.measure(
+                    client, 'deep_pages',
+                    lambda _, path=path: ('get', f'{path}&limit={limit}',
+                                          None),
+                    options['warmup'])
+                if self.verbosity > 1:
+                    self.stderr.write(
+                        f'{mode} {number}: p50 '
+                        f'{results[mode][str(number)]["latency_ms"]["p50"]}'
+                        f' мс')
+        return results
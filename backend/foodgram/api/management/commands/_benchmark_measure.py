@@ -0,0 +1,124 @@
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.management.commands._stats import percentile
+
+
+def peak_memory(call):
+    '''Пик памяти Python-объектов за вызов (tracemalloc), байт.'''
+
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class MeasureMixin:
+    '''Замеры бенчмарка: время, число SQL-запросов и пик памяти
+       запросов к API и вызовов функций, сравнение с прошлым запуском.'''
+
+    def time_calls(self, call, warmup, repeat=None):
+        '''Время и число SQL-запросов вызова функции без HTTP: прогрев
+           и repeat (по умолчанию --repeat) замеров.'''
+
+        if repeat is None:
+            repeat = self.iterations - 1 - warmup
+        latencies, queries = [], []
+        for number in range(warmup + repeat):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                call()
+                elapsed = time.perf_counter() - started
+            if number >= warmup:
+                latencies.append(elapsed)
+                queries.append(len(context.captured_queries))
+        return {'latency_ms': self.latency(latencies),
+                'queries': max(queries)}
+
+    def latency(self, latencies):
+        latencies = sorted(latencies)
+        return {
+            'min': self.ms(latencies[0]),
+            'p50': self.ms(percentile(latencies, 0.5)),
+            'p90': self.ms(percentile(latencies, 0.9)),
+            'max': self.ms(latencies[-1]),
+            'mean': self.ms(statistics.fmean(latencies)),
+        }
+
+    def measure(self, client, name, build, warmup):
+        '''Первый запрос - под tracemalloc для пика памяти, затем прогрев
+           и замеры времени и числа SQL-запросов.'''
+
+        latencies, queries, statuses = [], [], []
+        errors = 0
+        peak = None
+        for number in range(self.iterations):
+            method, path, data = build(number)
+            request = getattr(client, method)
+            if number == 0:
+                tracemalloc.start()
+                response = self.send(request, path, data)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = self.send(request, path, data)
+                    elapsed = time.perf_counter() - started
+                if number > warmup:
+                    latencies.append(elapsed)
+                    queries.append(len(context.captured_queries))
+                    statuses.append(response.status_code)
+            if response.status_code >= 400:
+                errors += 1
+            if name == 'recipes_create' and response.status_code == 201:
+                self.created[number] = response.data['id']
+        return {
+            'method': method.upper(),
+            'path': path,
+            'status': statistics.mode(statuses),
+            'errors': errors,
+            'latency_ms': self.latency(latencies),
+            'queries': max(queries),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    @staticmethod
+    def send(request, path, data):
+        '''Запрос с чтением потокового ответа: выгрузка выполняет SQL
+           по мере чтения, а не при вызове вьюхи.'''
+
+        response = request(path, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    @staticmethod
+    def ms(value):
+        return round(value * 1000, 2)
+
+    def compare(self, routes, baseline, threshold):
+        regressions = []
+        for name, result in routes.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            p50 = result['latency_ms']['p50']
+            previous_p50 = previous['latency_ms']['p50']
+            reasons = []
+            if previous_p50 and p50 > previous_p50 * (1 + threshold):
+                reasons.append(f'p50 {previous_p50} -> {p50} мс')
+            if result['queries'] > previous['queries']:
+                reasons.append(f'запросов {previous["queries"]} -> '
+                               f'{result["queries"]}')
+            if reasons:
+                regressions.append({'route': name, 'reasons': reasons})
+                self.stderr.write(self.style.WARNING(
+                    f'{name}: {", ".join(reasons)}'))
+        return regressions
@@ -0,0 +1,133 @@
+from rest_framework.test import APIClient
+
+from api.management.commands._benchmark_seed import PASSWORD
+
+# Рецептов в одном запросе пакетного добавления и удаления.
+BULK_SIZE = 20
+
+
+class RoutesMixin:
+    '''Замер каждого маршрута API на общем наборе данных.'''
+
+    def get_routes(self):
+        '''Маршруты в порядке замера: (имя, функция номер запроса ->
+           (метод, путь, данные)). Добавление и удаление из избранного,
+           списка покупок и подписок идут парами по одним и тем же
+           рецептам и авторам; созданные рецепты затем изменяются и
+           удаляются.'''
+
+        recipe = f'/api/recipes/{self.recipe_id}/'
+
+        def get(path):
+            return lambda number: ('get', path, None)
+
+        def toggle(method, suffix, pool):
+            return lambda number: (
+                method, f'/api/recipes/{pool[number]}/{suffix}/', None)
+
+        def subscribe(method):
+            return lambda number: (
+                method, f'/api/users/{self.free_authors[number]}/subscribe/',
+                None)
+
+        def bulk(method, suffix):
+            # Пакеты по BULK_SIZE рецептов с конца списка, чтобы не
+            # пересекаться с одиночными добавлениями.
+            return lambda number: (
+                method, f'/api/recipes/{suffix}/',
+                {'ids': self.free_recipes[::-1][
+                    number * BULK_SIZE:(number + 1) * BULK_SIZE]})
+
+        ids = ','.join(map(str, self.ingredient_ids))
+        return [
+            ('users_list', get('/api/users/')),
+            ('users_me', get('/api/users/me/')),
+            ('users_detail', get(f'/api/users/{self.author_id}/')),
+            ('users_create', lambda number: ('post', '/api/users/', {
+                'email': f'new{number}@example.com',
+                'username': f'new{number}',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': PASSWORD,
+            })),
+            ('token_login', lambda number: (
+                'post', '/api/auth/token/login/',
+                {'email': self.user.email, 'password': PASSWORD})),
+            ('subscriptions', get('/api/users/subscriptions/')),
+            ('subscribe', subscribe('post')),
+            ('unsubscribe', subscribe('delete')),
+            ('tags_list', get('/api/tags/')),
+            ('tags_detail', get(f'/api/tags/{self.tag_ids[0]}/')),
+            ('ingredients_list', get('/api/ingredients/')),
+            ('ingredients_search',
+             get(f'/api/ingredients/?name={self.ingredient_prefix}')),
+            ('ingredients_detail',
+             get(f'/api/ingredients/{self.ingredient_ids[0]}/')),
+            ('recipes_list', get('/api/recipes/')),
+            ('recipes_list_limit', get('/api/recipes/?limit=6')),
+            ('recipes_list_page', get('/api/recipes/?page=5&limit=6')),
+            ('recipes_list_cursor', get('/api/recipes/?limit=6&cursor=')),
+            ('recipes_list_tags',
+             get(f'/api/recipes/?tags={self.tag_slug}')),
+            ('recipes_list_author',
+             get(f'/api/recipes/?author={self.author_id}')),
+            ('recipes_list_is_favorited',
+             get('/api/recipes/?is_favorited=1')),
+            ('recipes_list_is_in_shopping_cart',
+             get('/api/recipes/?is_in_shopping_cart=1')),
+            ('recipes_list_popular', get('/api/recipes/?ordering=popular')),
+            ('recipes_list_trending',
+             get('/api/recipes/?ordering=trending')),
+            ('recipes_list_search',
+             get(f'/api/recipes/?search={self.search}')),
+            ('recipes_by_ingredients',
+             get(f'/api/recipes/by_ingredients/?ids={ids}')),
+            ('recipes_feed', get('/api/recipes/feed/')),
+            ('recipes_retrieve', get(recipe)),
+            ('recipes_create', lambda number: (
+                'post', '/api/recipes/', self.recipe_payload(number))),
+            ('recipes_patch', lambda number: (
+                'patch', f'/api/recipes/{self.created.get(number, 0)}/',
+                {**self.recipe_payload(number),
+                 'name': f'Изменённый рецепт {number}'})),
+            ('recipes_delete', lambda number: (
+                'delete', f'/api/recipes/{self.created.get(number, 0)}/',
+                None)),
+            ('favorite_add', toggle('post', 'favorite', self.free_recipes)),
+            ('favorite_remove',
+             toggle('delete', 'favorite', self.free_recipes)),
+            ('shopping_cart_add',
+             toggle('post', 'shopping_cart', self.free_recipes)),
+            ('shopping_cart_remove',
+             toggle('delete', 'shopping_cart', self.free_recipes)),
+            ('shopping_cart_summary',
+             get('/api/recipes/shopping_cart/summary/')),
+            ('download_shopping_cart_txt',
+             get('/api/recipes/download_shopping_cart/')),
+            ('download_shopping_cart_csv',
+             get('/api/recipes/download_shopping_cart/?format=csv')),
+            ('download_shopping_cart_json',
+             get('/api/recipes/download_shopping_cart/?format=json')),
+            ('download_shopping_cart_pdf',
+             get('/api/recipes/download_shopping_cart/?format=pdf')),
+            ('favorite_bulk_add', bulk('post', 'favorite')),
+            ('favorite_bulk_remove', bulk('delete', 'favorite')),
+            ('shopping_cart_bulk_add', bulk('post', 'shopping_cart')),
+            ('shopping_cart_bulk_remove', bulk('delete', 'shopping_cart')),
+        ]
+
+    def run_routes(self, options):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        results = {}
+        for name, build in self.get_routes():
+            if options['routes'] and not any(
+                    part in name for part in options['routes']):
+                continue
+            results[name] = self.measure(client, name, build,
+                                         options['warmup'])
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'{name}: p50 {results[name]["latency_ms"]["p50"]} мс, '
+                    f'запросов {results[name]["queries"]}')
+        return results
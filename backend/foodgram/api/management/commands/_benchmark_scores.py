@@ -0,0 +1,66 @@
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db.models.functions import Mod
+from django.utils import timezone
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+from api.management.commands._benchmark_seed import PASSWORD
+
+# Добавления в избранное для замера update_scores - за столько дней,
+# пересчёт замеряется столько раз.
+SCORE_DAYS = 90
+SCORE_REPEAT = 3
+
+
+class ScoresMixin:
+    '''Пересчёт рейтинга трендов командой update_scores.'''
+
+    def run_scores(self, sizes):
+        '''Пересчёт рейтинга трендов (update_scores) в зависимости от
+           числа добавлений в избранное: недостающие добавления делают
+           новые пользователи, даты добавлений распределяются по
+           последним SCORE_DAYS дням. Замеряются время и число запросов
+           пересчёта (SCORE_REPEAT раз) и пик памяти.'''
+
+        results = {}
+        recipe_ids = list(Recipe.objects.order_by('id').values_list(
+            'id', flat=True))
+        password = make_password(PASSWORD)
+        for size in sizes:
+            missing = size - Favorite.objects.count()
+            while missing > 0:
+                fan = User.objects.create(
+                    username=f'fan{size}-{missing}',
+                    email=f'fan{size}-{missing}@example.com',
+                    password=password)
+                Favorite.objects.bulk_create([
+                    Favorite(user=fan, recipe_id=recipe_id)
+                    for recipe_id in recipe_ids[:missing]
+                ], batch_size=5000)
+                missing -= len(recipe_ids)
+            now = timezone.now()
+            for day in range(SCORE_DAYS):
+                Favorite.objects.annotate(day=Mod('id', SCORE_DAYS)).filter(
+                    day=day).update(created=now - timedelta(days=day))
+
+            def update_scores():
+                call_command('update_scores', stdout=StringIO())
+            tracemalloc.start()
+            update_scores()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[str(size)] = {
+                'favorites': Favorite.objects.count(),
+                **self.time_calls(update_scores, 0, SCORE_REPEAT),
+                'peak_kib': round(peak / 1024, 1),
+            }
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'update_scores {size}: p50 '
+                    f'{results[str(size)]["latency_ms"]["p50"]} мс')
+        return results
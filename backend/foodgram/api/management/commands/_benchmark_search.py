@@ -0,0 +1,173 @@
+import random
+import time
+
+from django.db.models import Q
+from rest_framework.test import APIClient
+from recipes.models import Ingredient, Recipe
+
+from api.ingredient_index import SEARCH_LIMIT, ingredient_index
+from api.recipe_index import apply, build as build_index, rank
+
+# Синтетический индекс подбора по ингредиентам: число ингредиентов и
+# ингредиентов в рецепте, популярность ингредиентов - по закону Ципфа.
+INDEX_INGREDIENTS = 2000
+INDEX_RECIPE_SIZE = 8
+
+
+def orm_autocomplete(query, limit=SEARCH_LIMIT):
+    '''Автодополнение запросами к базе, как до индекса в памяти: начало
+       названия, затем подстрока.'''
+
+    fields = ('id', 'name', 'measurement_unit')
+    result = list(Ingredient.objects.filter(
+        name__istartswith=query).values(*fields)[:limit])
+    if len(result) < limit:
+        result += Ingredient.objects.filter(name__icontains=query).exclude(
+            name__istartswith=query).values(*fields)[:limit - len(result)]
+    return result
+
+
+class SearchMixin:
+    '''Поиск: полнотекстовый поиск рецептов, автодополнение
+       ингредиентов и индекс подбора рецептов по ингредиентам.'''
+
+    def run_search(self, options):
+        '''Полнотекстовый поиск ?search= на корпусе из --search-recipes
+           рецептов (описания - случайные названия ингредиентов) против
+           поиска подстроки через LIKE: частое слово, редкое слово, два
+           слова и начало слова.'''
+
+        total = options['search_recipes']
+        if total < 1:
+            return {}
+        rng = random.Random(options['seed'])
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        words = [word for name in names for word in name.split()
+                 if len(word) > 3 and word.isalpha()]
+        missing = total - Recipe.objects.count()
+        image = Recipe.objects.values_list('image', flat=True).first()
+        for start in range(0, max(missing, 0), 10000):
+            Recipe.objects.bulk_create([
+                Recipe(name=f'Рецепт поиска {number}', author=self.user,
+                       text=' '.join(rng.sample(names, 10)),
+                       cooking_time=10, image=image)
+                for number in range(start, min(start + 10000, missing))
+            ], batch_size=5000)
+        common = max(set(words), key=words.count)
+        rare = min(set(words), key=words.count)
+        queries = {
+            'common': common,
+            'rare': rare,
+            'two_words': f'{common} {rare}',
+            'prefix': common[:4],
+        }
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        results = {'recipes': Recipe.objects.count()}
+        for name, query in queries.items():
+            like = Recipe.objects.filter(
+                Q(name__icontains=query) | Q(text__icontains=query))
+            results[name] = {
+                'query': query,
+                'search': self.measure(
+                    client, 'search', lambda number, query=query: (
+                        'get', '/api/recipes/', {'search': query}),
+                    options['warmup']),
+                'like': self.time_calls(
+                    lambda like=like: (like.count(), list(like[:6])),
+                    options['warmup']),
+            }
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'search {query!r}: p50 '
+                    f'{results[name]["search"]["latency_ms"]["p50"]} мс, '
+                    f'LIKE {results[name]["like"]["latency_ms"]["p50"]} мс')
+        return results
+
+    def run_autocomplete(self, options):
+        '''Автодополнение ингредиентов: индекс в памяти против запросов
+           к базе на префиксах разной длины и на подстроке.'''
+
+        name = Ingredient.objects.order_by('id').values_list(
+            'name', flat=True).first()
+        queries = [name[:length] for length in (1, 2, 3)]
+        queries.append(name[1:4])
+        ingredient_index.search(queries[0])
+        results = {}
+        for query in queries:
+            index = self.time_calls(
+                lambda: ingredient_index.search(query), options['warmup'])
+            orm = self.time_calls(
+                lambda: orm_autocomplete(query), options['warmup'])
+            results[query] = {
+                'index': index,
+                'orm': orm,
+                'speedup': round(orm['latency_ms']['p50']
+                                 / max(index['latency_ms']['p50'], 0.001),
+                                 1),
+            }
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'autocomplete {query!r}: index '
+                    f'{index["latency_ms"]["p50"]} мс, orm '
+                    f'{orm["latency_ms"]["p50"]} мс')
+        return results
+
+    def run_recipe_index(self, sizes, options):
+        '''Индекс подбора рецептов по ингредиентам на синтетических
+           данных без базы: время построения и размер массивов, подбор
+           по редким, средним и популярным ингредиентам (без кэша
+           результатов) и обновление копированием для 1 и 100 изменённых
+           рецептов.'''
+
+        rng = random.Random(options['seed'])
+        weights = [1 / rank for rank in range(1, INDEX_INGREDIENTS + 1)]
+        scale = INDEX_RECIPE_SIZE / sum(weights)
+        queries = {
+            'rare_3': range(INDEX_INGREDIENTS - 3, INDEX_INGREDIENTS),
+            'middle_8': range(100, 108),
+            'popular_10': range(10),
+        }
+        results = {}
+        for size in sizes:
+            data = [
+                (ingredient_id, sorted(rng.sample(
+                    range(size), min(size, round(size * weight * scale)))))
+                for ingredient_id, weight in enumerate(weights)
+            ]
+            rows = ((ingredient_id, recipe_id)
+                    for ingredient_id, recipe_ids in data
+                    for recipe_id in recipe_ids)
+            started = time.perf_counter()
+            postings, sizes_ = build_index(rows)
+            build_seconds = time.perf_counter() - started
+            del data
+            result = {
+                'postings': sum(map(len, postings.values())),
+                'build_seconds': round(build_seconds, 2),
+                'arrays_mib': round((
+                    sum(len(ids) * ids.itemsize for ids in postings.values())
+                    + len(sizes_) * sizes_.itemsize) / 2 ** 20, 1),
+            }
+            for name, ingredient_ids in queries.items():
+                result[name] = self.time_calls(
+                    lambda: rank(postings, sizes_, ingredient_ids),
+                    options['warmup'])
+                result[name]['matches'] = len(
+                    rank(postings, sizes_, ingredient_ids))
+            for changed in (1, 100):
+                recipes = {
+                    recipe_id: rng.sample(range(INDEX_INGREDIENTS),
+                                          INDEX_RECIPE_SIZE)
+                    for recipe_id in rng.sample(range(size), changed)
+                }
+                result[f'apply_{changed}'] = self.time_calls(
+                    lambda: apply(postings, sizes_, recipes),
+                    options['warmup'])
+            results[str(size)] = result
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'recipe_index {size}: построение {build_seconds:.2f} с, '
+                    f'middle_8 p50 '
+                    f'{result["middle_8"]["latency_ms"]["p50"]} мс')
+        return results
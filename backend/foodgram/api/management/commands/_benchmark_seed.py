@@ -0,0 +1,149 @@
+import base64
+import random
+from io import BytesIO, StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from recipes.models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Tag,
+)
+from users.models import Follow, User
+
+PASSWORD = 'benchmark-password'
+
+
+def png_base64(size=64):
+    output = BytesIO()
+    Image.new('RGB', (size, size), 'orange').save(output, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(output.getvalue()).decode())
+
+
+class SeedMixin:
+    '''Синтетические данные бенчмарка во временной базе.'''
+
+    def seed(self, options):
+        '''Синтетические данные: ингредиенты из data/ingredients.csv,
+           пользователи, теги, рецепты, избранное, списки покупок и
+           подписки. Пользователь, от имени которого идут запросы, -
+           первый, с токеном.'''
+
+        rng = random.Random(options['seed'])
+        call_command('load_csv', stdout=StringIO())
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        if len(ingredients) < options['ingredients_per_recipe']:
+            raise CommandError('Недостаточно ингредиентов в ingredients.csv.')
+        password = make_password(PASSWORD)
+        # SQLite не возвращает id из bulk_create, поэтому созданные
+        # записи перечитываются.
+        User.objects.bulk_create([
+            User(username=f'user{number}', email=f'user{number}@example.com',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for number in range(options['users'])
+        ])
+        users = list(User.objects.order_by('id'))
+        self.user = users[0]
+        self.token = Token.objects.create(user=self.user).key
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {number}', color=f'#{number:06X}',
+                slug=f'tag{number}')
+            for number in range(options['tags'])
+        ])
+        tags = list(Tag.objects.order_by('id'))
+        # Все рецепты ссылаются на один файл картинки, как после загрузки
+        # одинаковых картинок в хранилище по хэшу содержимого.
+        image = Recipe._meta.get_field('image').storage.save(
+            'recipes/benchmark.png',
+            ContentFile(base64.b64decode(png_base64().partition(',')[2])))
+        Recipe.objects.bulk_create([
+            Recipe(
+                name=f'Рецепт {number}',
+                author=rng.choice(users),
+                text=' '.join(name for _, name in rng.sample(ingredients, 10)),
+                cooking_time=rng.randint(5, 120),
+                image=image,
+            )
+            for number in range(options['recipes'])
+        ], batch_size=1000)
+        recipes = list(Recipe.objects.order_by('id').only('id'))
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient_id, _ in rng.sample(
+                ingredients, options['ingredients_per_recipe'])
+        ], batch_size=5000)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, min(2, len(tags)))
+        ], batch_size=5000)
+        favorites, carts, follows = [], [], []
+        for user in users:
+            chosen = rng.sample(recipes,
+                                options['favorites'] + options['carts'])
+            favorites += [Favorite(user=user, recipe=recipe)
+                          for recipe in chosen[:options['favorites']]]
+            carts += [Cart(user=user, recipe=recipe)
+                      for recipe in chosen[options['favorites']:]]
+            follows += [Follow(user=user, author=author) for author in
+                        rng.sample([other for other in users
+                                    if other != user], options['follows'])]
+        Favorite.objects.bulk_create(favorites, batch_size=5000)
+        Cart.objects.bulk_create(carts, batch_size=5000)
+        Follow.objects.bulk_create(follows, batch_size=5000)
+        for command in ('recount', 'rebuild_shopping_list', 'update_scores'):
+            call_command(command, stdout=StringIO())
+
+        # Рецепты и авторы, которых ещё нет у пользователя, - для замеров
+        # добавления в избранное, список покупок и подписки.
+        taken = set(Favorite.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        taken |= set(Cart.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        self.free_recipes = [recipe.id for recipe in recipes
+                             if recipe.id not in taken]
+        followed = set(Follow.objects.filter(
+            user=self.user).values_list('author_id', flat=True))
+        self.free_authors = [user.id for user in users[1:]
+                             if user.id not in followed]
+        sample = Recipe.objects.get(id=recipes[0].id)
+        self.recipe_id = sample.id
+        self.author_id = sample.author_id
+        self.tag_slug = tags[0].slug
+        self.tag_ids = [tag.id for tag in tags[:2]]
+        self.search = sample.text.split()[0]
+        self.ingredient_ids = list(RecipeIngredient.objects.filter(
+            recipe=sample).values_list('ingredient_id', flat=True))
+        self.ingredient_prefix = ingredients[0][1][:2]
+        self.created = {}
+        return {
+            'users': len(users),
+            'recipes': len(recipes),
+            'tags': len(tags),
+            'ingredients': len(ingredients),
+            'recipe_ingredients': len(recipes)
+            * options['ingredients_per_recipe'],
+            'favorites': len(favorites),
+            'carts': len(carts),
+            'follows': len(follows),
+        }
+
+    def recipe_payload(self, number):
+        return {
+            'name': f'Новый рецепт {number}',
+            'text': 'Описание нового рецепта',
+            'cooking_time': 15,
+            'image': png_base64(),
+            'tags': self.tag_ids,
+            'ingredients': [{'id': ingredient_id, 'amount': 10}
+                            for ingredient_id in self.ingredient_ids],
+        }
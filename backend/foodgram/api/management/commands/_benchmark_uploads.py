@@ -0,0 +1,67 @@
+import base64
+import random
+from io import BytesIO
+
+from PIL import Image
+
+from api.fields import StreamingBase64ImageField
+from api.management.commands._benchmark_measure import peak_memory
+
+
+def jpeg_base64(size, rng):
+    '''JPEG из шума размером около size байт в base64 с заголовком.'''
+
+    side = 64
+    for _ in range(3):
+        output = BytesIO()
+        Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3)
+                        ).save(output, 'JPEG', quality=95)
+        side = max(8, round(side * (size / output.tell()) ** 0.5))
+    return ('data:image/jpeg;base64,'
+            + base64.b64encode(output.getvalue()).decode())
+
+
+class UploadsMixin:
+    '''Разбор загружаемых картинок рецептов из base64.'''
+
+    def run_uploads(self, sizes, options):
+        '''Разбор картинки рецепта из base64 по размеру загрузки (КиБ):
+           StreamingBase64ImageField против декодирования целиком в
+           памяти, как в Base64ImageField. Пик памяти считается
+           tracemalloc и не включает буфер пикселей Pillow, поэтому его
+           размер для декодирования целиком приводится отдельно.'''
+
+        rng = random.Random(options['seed'])
+        field = StreamingBase64ImageField()
+        results = {}
+        for size in sizes:
+            data = jpeg_base64(size * 1024, rng)
+
+            def streaming():
+                field.to_internal_value(data).close()
+
+            def in_memory():
+                decoded = base64.b64decode(data.partition(';base64,')[2])
+                with Image.open(BytesIO(decoded)) as image:
+                    image.load()
+                    return image.size
+            width, height = in_memory()
+            results[str(size)] = {
+                'upload_kib': round(len(data) / 1024, 1),
+                'streaming': {
+                    **self.time_calls(streaming, options['warmup']),
+                    'peak_kib': round(peak_memory(streaming) / 1024, 1),
+                },
+                'in_memory': {
+                    **self.time_calls(in_memory, options['warmup']),
+                    'peak_kib': round(peak_memory(in_memory) / 1024, 1),
+                    'pixels_kib': round(width * height * 4 / 1024, 1),
+                },
+            }
+            if self.verbosity > 1:
+                self.stderr.write(
+                    f'upload {size} КиБ: пик '
+                    f'{results[str(size)]["streaming"]["peak_kib"]} КиБ, '
+                    f'целиком {results[str(size)]["in_memory"]["peak_kib"]} '
+                    f'КиБ')
+        return results
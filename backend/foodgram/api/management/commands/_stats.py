@@ -0,0 +1,7 @@
+def percentile(values, share):
+    '''Перцентиль share (0.5 - медиана) отсортированных значений, None
+       для пустого списка. Для отчётов benchmark и loadtest.'''
+
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * share))]
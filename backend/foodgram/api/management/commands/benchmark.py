@@ -0,0 +1,230 @@
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from api.management.commands._benchmark_lists import ListsMixin
+from api.management.commands._benchmark_measure import MeasureMixin
+from api.management.commands._benchmark_routes import BULK_SIZE, RoutesMixin
+from api.management.commands._benchmark_scores import ScoresMixin
+from api.management.commands._benchmark_search import SearchMixin
+from api.management.commands._benchmark_seed import SeedMixin
+from api.management.commands._benchmark_uploads import UploadsMixin
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-versions',
+        'TIMEOUT': None,
+    },
+}
+
+
+def numbers(value, option):
+    '''Числа через запятую из значения параметра, по возрастанию.'''
+
+    try:
+        return sorted({int(item) for item in value.split(',')
+                       if item.strip()})
+    except ValueError:
+        raise CommandError(f'{option} - числа через запятую.')
+
+
+class Command(MeasureMixin, SeedMixin, RoutesMixin, ListsMixin,
+              SearchMixin, ScoresMixin, UploadsMixin, BaseCommand):
+    help = ('Бенчмарк API: во временной тестовой базе (SQLite или '
+            'Postgres из настроек) создаёт синтетические данные и замеряет '
+            'задержку, число SQL-запросов и пик памяти для каждого маршрута '
+            'API. Результат - JSON, который можно сравнить с результатом '
+            'другого коммита через --compare.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Число пользователей.')
+        parser.add_argument('--recipes', type=int, default=1000,
+                            help='Число рецептов.')
+        parser.add_argument('--tags', type=int, default=6,
+                            help='Число тегов.')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8,
+                            help='Ингредиентов в рецепте.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Рецептов в избранном у пользователя.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в списке покупок у пользователя.')
+        parser.add_argument('--follows', type=int, default=5,
+                            help='Подписок у пользователя.')
+        parser.add_argument(
+            '--feed-follows',
+            default='10,100,1000',
+            help='Числа подписок через запятую для замера ленты подписок '
+                 'по мере роста подписок; пустая строка - не замерять.',
+        )
+        parser.add_argument('--feed-recipes-per-author', type=int,
+                            default=3,
+                            help='Рецептов у каждого автора для замера '
+                                 'ленты.')
+        parser.add_argument(
+            '--cart-sizes',
+            default='100,1000,10000',
+            help='Числа рецептов в списке покупок через запятую для замера '
+                 'выгрузки большого списка, недостающие рецепты создаются; '
+                 'пустая строка - не замерять.',
+        )
+        parser.add_argument(
+            '--deep-page',
+            type=int,
+            default=10000,
+            help='Номер глубокой страницы списка рецептов для сравнения '
+                 'пагинации page и cursor с первой страницей; недостающие '
+                 'рецепты создаются; 0 - не замерять.',
+        )
+        parser.add_argument(
+            '--score-favorites',
+            default='10000,100000',
+            help='Числа добавлений в избранное через запятую для замера '
+                 'пересчёта рейтинга трендов (update_scores); пустая '
+                 'строка - не замерять.',
+        )
+        parser.add_argument(
+            '--search-recipes',
+            type=int,
+            default=100000,
+            help='Рецептов в базе для замера полнотекстового поиска '
+                 '(недостающие создаются); 0 - не замерять.',
+        )
+        parser.add_argument(
+            '--index-recipes',
+            default='100000,1000000',
+            help='Числа рецептов через запятую для замера индекса подбора '
+                 'по ингредиентам на синтетических данных; пустая строка - '
+                 'не замерять.',
+        )
+        parser.add_argument(
+            '--upload-sizes',
+            default='512,2048,8192',
+            help='Размеры загружаемых картинок в КиБ через запятую для '
+                 'замера пика памяти при разборе base64; пустая строка - '
+                 'не замерять.',
+        )
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Замеров на маршрут.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Прогревочных запросов на маршрут.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Начальное значение генератора данных.')
+        parser.add_argument(
+            '--route',
+            action='append',
+            dest='routes',
+            help='Замерять только маршруты, в имени которых есть эта '
+                 'строка, можно указать несколько раз.',
+        )
+        parser.add_argument('--label', default='',
+                            help='Метка результата, например хэш коммита.')
+        parser.add_argument('--output',
+                            help='Файл для JSON (по умолчанию stdout).')
+        parser.add_argument(
+            '--compare',
+            help='JSON предыдущего запуска: отметить маршруты, где p50 '
+                 'вырос больше порога или стало больше SQL-запросов.',
+        )
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Порог роста p50 для --compare (0.2 = 20%%).')
+        parser.add_argument('--noinput', '--no-input', action='store_false',
+                            dest='interactive',
+                            help='Не спрашивать перед удалением старой '
+                                 'тестовой базы.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('--repeat должен быть больше 0, '
+                               '--warmup - не меньше 0.')
+        # Запрос для замера памяти, прогрев и замеры: для каждого нужен
+        # свой рецепт или автор, которых ещё нет у пользователя.
+        self.iterations = 1 + options['warmup'] + options['repeat']
+        self.verbosity = options['verbosity']
+        if options['users'] < options['follows'] + self.iterations + 1:
+            raise CommandError(
+                f'Для подписок нужно не меньше '
+                f'{options["follows"] + self.iterations + 1} пользователей.')
+        if options['recipes'] < (options['favorites'] + options['carts']
+                                 + self.iterations * (BULK_SIZE + 1)):
+            raise CommandError('Слишком мало рецептов для замеров.')
+        feed_follows = numbers(options['feed_follows'], '--feed-follows')
+        cart_sizes = numbers(options['cart_sizes'], '--cart-sizes')
+        score_favorites = numbers(options['score_favorites'],
+                                  '--score-favorites')
+        index_recipes = numbers(options['index_recipes'], '--index-recipes')
+        upload_sizes = numbers(options['upload_sizes'], '--upload-sizes')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+
+        setup_test_environment()
+        database = connection.settings_dict['NAME']
+        media_root = tempfile.mkdtemp(prefix='foodgram-benchmark-')
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=not options['interactive'])
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES,
+                                   MEDIA_ROOT=media_root):
+                started = time.monotonic()
+                dataset = self.seed(options)
+                seed_seconds = time.monotonic() - started
+                routes = self.run_routes(options)
+                feed = self.run_feed(feed_follows, options)
+                carts = self.run_carts(cart_sizes, options)
+                autocomplete = self.run_autocomplete(options)
+                deep_pages = self.run_deep_pages(options)
+                scores = self.run_scores(score_favorites)
+                search = self.run_search(options)
+                recipe_index = self.run_recipe_index(index_recipes, options)
+                uploads = self.run_uploads(upload_sizes, options)
+        finally:
+            connection.creation.destroy_test_db(database, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'label': options['label'],
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': sys.version.split()[0],
+            'dataset': dataset,
+            'seed_seconds': round(seed_seconds, 2),
+            'repeat': options['repeat'],
+            'warmup': options['warmup'],
+            'routes': routes,
+            'feed': feed,
+            'carts': carts,
+            'autocomplete': autocomplete,
+            'deep_pages': deep_pages,
+            'scores': scores,
+            'search': search,
+            'recipe_index': recipe_index,
+            'uploads': uploads,
+        }
+        if baseline is not None:
+            report['regressions'] = self.compare(
+                routes, baseline.get('routes', {}), options['threshold'])
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connections
+from recipes.models import Recipe
+
+from api.images import IMAGE_WORKERS, build_variants
+
+
+class Command(BaseCommand):
+    help = ('Строит варианты картинок рецептов (thumb, card, full в WebP '
+            'и JPEG) для рецептов, у которых их ещё нет. С --watch '
+            'работает постоянно и строит варианты новых картинок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить варианты у всех рецептов с картинкой.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=IMAGE_WORKERS,
+            help='Число потоков.',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Не завершаться: проверять новые картинки каждые '
+                 '--interval секунд.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Пауза между проверками в режиме --watch, секунд.',
+        )
+
+    def handle(self, *args, **options):
+        # Картинки, которые не удалось обработать, в режиме --watch не
+        # повторяются, пока их не заменят.
+        self.failed = set()
+        self.build(options['force'], options['workers'])
+        while options['watch']:
+            time.sleep(options['interval'])
+            close_old_connections()
+            self.build(False, options['workers'], quiet=True)
+
+    def build(self, force, workers, quiet=False):
+        recipes = Recipe.objects.exclude(image='')
+        if not force:
+            recipes = recipes.filter(image_hash='')
+        pending = [recipe for recipe in recipes.values_list('id', 'image')
+                   if recipe not in self.failed]
+        if quiet and not pending:
+            return
+
+        def build(recipe):
+            try:
+                return build_variants(recipe[0], force=force)
+            except Exception as error:
+                self.failed.add(recipe)
+                self.stderr.write(f'Рецепт {recipe[0]}: {error}')
+
+        def build_in_thread(recipe):
+            try:
+                return build(recipe)
+            finally:
+                connections.close_all()
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                hashes = list(pool.map(build_in_thread, pending))
+        else:
+            hashes = [build(recipe) for recipe in pending]
+        built = sum(1 for image_hash in hashes if image_hash)
+        self.stdout.write(self.style.SUCCESS(
+            f'Варианты построены: {built} из {len(pending)}.'))
@@ -0,0 +1,194 @@
+import os
+import posixpath
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from recipes.models import Recipe, StoredFile
+
+from api.images import VARIANTS_DIR, delete_variants
+from api.storage import content_hash, hash_from_name
+from api.utils import recount_references
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки рецептов, на которые не осталось ссылок, '
+            'вместе с их вариантами. С --scan также ищет на диске файлы '
+            'и варианты, о которых не знает база.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='Не трогать файлы, изменённые за последние N часов.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов обрабатывать за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--scan',
+            action='store_true',
+            help='Искать на диске файлы без записей в базе.',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Перед сборкой пересчитать ссылки по рецептам.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько файлов будет удалено.',
+        )
+
+    def handle(self, *args, **options):
+        self.storage = Recipe._meta.get_field('image').storage
+        self.cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        self.deleted = self.freed = 0
+        if options['recount'] and not self.dry_run:
+            fixed = recount_references()
+            self.stdout.write(f'Исправлено счётчиков ссылок: {fixed}.')
+        self.collect_unreferenced()
+        if options['scan']:
+            self.collect_unknown_files()
+            self.collect_unknown_variants()
+        prefix = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} файлов: {self.deleted}, '
+            f'{self.freed / 1024 / 1024:.1f} МБ.'))
+
+    def is_stale(self, path):
+        try:
+            modified = os.path.getmtime(path)
+        except FileNotFoundError:
+            return True
+        return modified < self.cutoff.timestamp()
+
+    def delete_file(self, name):
+        '''Удаляет оригинал и его варианты, если они никому не нужны.'''
+
+        path = self.storage.path(name)
+        exists = os.path.exists(path)
+        self.deleted += exists
+        if exists:
+            self.freed += os.path.getsize(path)
+        if self.dry_run:
+            return
+        image_hash = hash_from_name(name)
+        if len(image_hash) != 64 and exists:
+            # Файл загружен до хранилища по содержимому.
+            with self.storage.open(name) as image:
+                image_hash = content_hash(image)
+        self.storage.delete(name)
+        self.freed += delete_variants(image_hash)
+
+    def collect_unreferenced(self):
+        '''Файлы со счётчиком ссылок 0. Строки блокируются до удаления
+           файла: новая ссылка (change_references) и повторная загрузка
+           того же файла (ContentAddressedStorage.claim) ждут конца пачки
+           и после удаления строки создают её и файл заново.'''
+
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(StoredFile.objects.select_for_update(
+                    skip_locked=True
+                ).filter(
+                    id__gt=last_id, references=0, updated__lt=self.cutoff
+                ).order_by('id')[:self.batch_size])
+                if not batch:
+                    return
+                last_id = batch[-1].id
+                stale = {stored.name: stored for stored in batch
+                         if self.is_stale(self.storage.path(stored.name))}
+                # Рецепты проверяются уже под блокировкой и после даты
+                # файлов: видны все ссылки, закоммиченные до неё.
+                used = set(Recipe.objects.filter(
+                    image__in=[stored.name for stored in batch]
+                ).values_list('image', flat=True))
+                if not self.dry_run:
+                    # Ссылки, не учтённые счётчиком (например, после
+                    # bulk_create), исправляем.
+                    for name in used:
+                        StoredFile.objects.filter(name=name).update(
+                            references=Recipe.objects.filter(
+                                image=name).count())
+                orphans = [stored for name, stored in stale.items()
+                           if name not in used]
+                for stored in orphans:
+                    self.delete_file(stored.name)
+                if not self.dry_run:
+                    StoredFile.objects.filter(
+                        id__in=[stored.id for stored in orphans]).delete()
+
+    def iter_stale_files(self, directory, skip=()):
+        root = self.storage.path('')
+        for path, directories, files in os.walk(self.storage.path(directory)):
+            directories[:] = [name for name in directories
+                              if os.path.join(path, name) not in skip]
+            for filename in files:
+                full_path = os.path.join(path, filename)
+                if self.is_stale(full_path):
+                    yield os.path.relpath(full_path, root).replace(
+                        os.sep, '/')
+
+    def batches(self, items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def collect_unknown_files(self):
+        '''Оригиналы на диске без записей в базе: например, загрузки из
+           откаченных транзакций.'''
+
+        upload_to = Recipe._meta.get_field('image').upload_to.strip('/')
+        skip = {self.storage.path(VARIANTS_DIR)}
+        for batch in self.batches(self.iter_stale_files(upload_to, skip)):
+            known = set(StoredFile.objects.filter(
+                name__in=batch).values_list('name', flat=True))
+            known.update(Recipe.objects.filter(
+                image__in=batch).values_list('image', flat=True))
+            for name in batch:
+                if name not in known:
+                    self.delete_file(name)
+
+    def collect_unknown_variants(self):
+        '''Каталоги вариантов, хэш которых не принадлежит ни одному
+           рецепту.'''
+
+        root = self.storage.path(VARIANTS_DIR)
+        if not os.path.isdir(root):
+            return
+        stale = (
+            entry.path
+            for prefix in os.scandir(root) if prefix.is_dir()
+            for entry in os.scandir(prefix.path)
+            if entry.is_dir() and self.is_stale(entry.path)
+        )
+        for batch in self.batches(stale):
+            hashes = {posixpath.basename(path): path for path in batch}
+            used = set(Recipe.objects.filter(
+                image_hash__in=hashes).values_list('image_hash', flat=True))
+            for image_hash, path in hashes.items():
+                if image_hash in used:
+                    continue
+                files = [entry.path for entry in os.scandir(path)]
+                self.deleted += len(files)
+                self.freed += sum(map(os.path.getsize, files))
+                if self.dry_run:
+                    continue
+                for file in files:
+                    os.unlink(file)
+                os.rmdir(path)
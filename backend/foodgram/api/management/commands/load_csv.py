@@ -1,28 +1,301 @@
 import csv
+import json
+import time
+from contextlib import contextmanager
+from itertools import groupby, islice
+from pathlib import Path
 
+from django.apps import apps
 from django.conf import settings
-from django.core.management import BaseCommand
-from recipes.models import Ingredient
+from django.core.management import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from recipes.models import (
+    Cart,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingListItem,
+    UnitConversion,
+)
 
+from api.cache import bump_version
+from api.recipe_index import log_recipe_changes
+from api.rows import delete_rows
+from api.units import normalize_units, resolve_base_units
+from api.utils import (
+    COUNTERS,
+    rebuild_shopping_lists,
+    recount_counters,
+    recount_references,
+)
 
-TABLE_DICT = {
-    Ingredient: 'ingredients.csv',
-}
+DATA_DIR = Path(settings.BASE_DIR) / 'data'
+DEFAULT_FILES = ('ingredients.csv',)
+DEFAULT_MODEL = 'recipes.Ingredient'
+CSV_FIELDS = ('name', 'measurement_unit')
+# Загрузка или очистка этих моделей меняет сводные списки покупок.
+SHOPPING_LIST_SOURCES = {
+    Cart, Ingredient, Recipe, RecipeIngredient, ShoppingListItem}
+
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    '''Построчно отдаёт элементы JSON-массива, читая файл частями,
+       без загрузки всего файла в память.'''
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if started and buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if not started and buffer.startswith('['):
+            buffer = buffer[1:].lstrip()
+            started = True
+        if started and buffer.startswith(']'):
+            return
+        try:
+            if not started:
+                raise ValueError
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                raise CommandError(
+                    f'Некорректный JSON-массив в файле {file.name}.')
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+@contextmanager
+def keep_timestamps(model, objects):
+    '''bulk_create вызывает pre_save полей, и auto_now/auto_now_add
+       затирают даты из файла временем загрузки. На время вставки флаги
+       снимаются, а объектам без даты она ставится как при save().'''
+
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False)
+              or getattr(field, 'auto_now_add', False)]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        for instance in objects:
+            if getattr(instance, field.attname) is None:
+                field.pre_save(instance, add=True)
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
 
 
 class Command(BaseCommand):
+    help = ('Загружает данные из CSV или JSON (список объектов или '
+            'фикстура Django) пачками через bulk_create. Повторная загрузка '
+            'пропускает уже существующие записи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='*',
+            default=DEFAULT_FILES,
+            help='Файлы для загрузки (по умолчанию ingredients.csv). '
+                 'Относительные пути ищутся также в каталоге data.',
+        )
+        parser.add_argument(
+            '--model',
+            default=DEFAULT_MODEL,
+            help='Модель для CSV и JSON без поля model '
+                 '(по умолчанию recipes.Ingredient).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки для bulk_create.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Выполнить загрузку и откатить транзакцию.',
+        )
+        parser.add_argument(
+            '--truncate',
+            action='store_true',
+            help='Перед загрузкой удалить существующие записи моделей.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.default_model = apps.get_model(options['model'])
+        except (LookupError, ValueError):
+            raise CommandError(f'Неизвестная модель {options["model"]}.')
+        self.batch_size = options['batch_size']
+        self.truncate = options['truncate']
+        self.truncated = set()
+        self.sequences = set()
+        self.loaded = set()
+        with transaction.atomic():
+            for name in options['files']:
+                self.load_file(self.resolve(name))
+            self.reset_sequences()
+            changed = self.loaded | self.truncated
+            self.rebuild_derived(changed)
+            if options['dry_run']:
+                transaction.set_rollback(True)
+                self.stdout.write(self.style.WARNING(
+                    'Пробный запуск: изменения отменены.'))
+            else:
+                transaction.on_commit(lambda: bump_version(*changed))
+
+    def rebuild_derived(self, changed):
+        '''Загрузка идёт через bulk_create и DELETE без сигналов, поэтому
+           производные данные изменённых моделей пересчитываются целиком:
+           счётчики, базовые единицы ингредиентов (если менялась таблица
+           переводов), сводные списки покупок, ссылки на файлы картинок и
+           индекс рецептов по ингредиентам.'''
+
+        if changed & set(COUNTERS):
+            recount_counters()
+        if UnitConversion in changed:
+            normalize_units()
+        if changed & SHOPPING_LIST_SOURCES:
+            rebuild_shopping_lists(self.batch_size)
+        if Recipe in changed:
+            recount_references()
+        if changed & {Ingredient, Recipe, RecipeIngredient}:
+            log_recipe_changes([None])
+
+    def resolve(self, name):
+        path = Path(name)
+        if not path.exists() and (DATA_DIR / path).exists():
+            path = DATA_DIR / path
+        if not path.exists():
+            raise CommandError(f'Файл {name} не найден.')
+        return path
+
+    def load_file(self, path):
+        started = time.monotonic()
+        rows = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            records = (self.read_json(f) if path.suffix == '.json'
+                       else self.read_csv(f))
+            for model, group in groupby(records, key=lambda row: row[0]):
+                while True:
+                    batch = list(islice(group, self.batch_size))
+                    if not batch:
+                        break
+                    self.load_batch(model, batch)
+                    rows += len(batch)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Файл {path.name} загружен: {rows} строк за {elapsed:.2f} с '
+            f'({rows / elapsed:.0f} строк/с).'))
+
+    def read_csv(self, f):
+        for row in csv.reader(f, delimiter=','):
+            if tuple(row) == CSV_FIELDS:
+                continue
+            yield self.default_model, None, dict(zip(CSV_FIELDS, row))
+
+    def read_json(self, f):
+        for item in iter_json_array(f):
+            if 'model' in item:
+                try:
+                    model = apps.get_model(item['model'])
+                except (LookupError, ValueError):
+                    raise CommandError(
+                        f'Неизвестная модель {item["model"]} в {f.name}.')
+                yield model, item.get('pk'), item.get('fields', {})
+            else:
+                yield self.default_model, item.pop('pk', None), item
+
+    def build(self, model, pk, fields):
+        '''Создаёт объект модели из словаря полей; значения M2M
+           возвращаются отдельно.'''
+
+        instance = model(pk=pk)
+        relations = {}
+        for name, value in fields.items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                relations[field] = value
+            elif field.is_relation:
+                setattr(instance, field.attname, value)
+            else:
+                setattr(instance, field.attname, field.to_python(value))
+        return instance, relations
+
+    def truncate_model(self, model):
+        '''Удаляет все записи модели одним DELETE, без выборки объектов и
+           сигналов. Записи, ссылающиеся на модель с CASCADE, удаляются
+           так же, ссылки с SET_NULL обнуляются.'''
+
+        if model in self.truncated:
+            return
+        self.truncated.add(model)
+        for relation in model._meta.get_fields(include_hidden=True):
+            if relation.concrete or not (relation.one_to_many
+                                         or relation.one_to_one):
+                continue
+            related = relation.related_model
+            if relation.on_delete is models.CASCADE:
+                self.truncate_model(related)
+            elif relation.on_delete is models.SET_NULL:
+                related._default_manager.exclude(
+                    **{relation.field.name: None}
+                ).update(**{relation.field.name: None})
+        delete_rows(model._default_manager.all())
+
+    def load_batch(self, model, batch):
+        if self.truncate:
+            self.truncate_model(model)
+        objects, relations = [], []
+        for _, pk, fields in batch:
+            instance, m2m = self.build(model, pk, fields)
+            objects.append(instance)
+            if m2m:
+                relations.append((instance, m2m))
+            if pk is not None:
+                self.sequences.add(model)
+        if model is Ingredient:
+            # Один запрос к таблице переводов на пачку вместо сигнала
+            # pre_save на каждый ингредиент.
+            resolve_base_units(objects)
+        with keep_timestamps(model, objects):
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+        self.load_relations(relations)
+        self.loaded.add(model)
+
+    def load_relations(self, relations):
+        '''Связи M2M из фикстуры: одна вставка на каждую промежуточную
+           таблицу.'''
+
+        through_objects = {}
+        for instance, m2m in relations:
+            if instance.pk is None:
+                continue
+            for field, values in m2m.items():
+                through = field.remote_field.through
+                source = field.m2m_field_name()
+                target = field.m2m_reverse_field_name()
+                through_objects.setdefault(through, []).extend(
+                    through(**{f'{source}_id': instance.pk,
+                               f'{target}_id': value})
+                    for value in values
+                )
+        for through, objects in through_objects.items():
+            through.objects.bulk_create(objects, ignore_conflicts=True)
+
+    def reset_sequences(self):
+        '''После вставки с явными pk синхронизируем счётчики pk.'''
 
-    def handle(self, *args, **kwargs):
-        for model, csv_f in TABLE_DICT.items():
-            with open(
-                f'{settings.BASE_DIR}/data/{csv_f}',
-                'r',
-                encoding='utf-8'
-            ) as f:
-                reader = csv.DictReader(f, delimiter=',')
-                for row in reader:
-                    name, measurement_unit = row
-                    ingredient = Ingredient(name=name,
-                                            measurement_unit=measurement_unit)
-                    ingredient.save()
-                print(f'Файл {f.name} загружен.')
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), self.sequences)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
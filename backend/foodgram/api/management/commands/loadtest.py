@@ -0,0 +1,164 @@
+import http.client
+import json
+import threading
+import time
+from itertools import cycle
+from urllib.parse import urlsplit
+
+from django.core.management import BaseCommand, CommandError
+
+from api.management.commands._stats import percentile
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?limit=6&cursor=',
+    '/api/tags/',
+    '/api/ingredients/?name=%D0%BA%D0%B0',
+)
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запущенного сервера: параллельные клиенты с '
+            'keep-alive запрашивают пути по кругу, результат - запросы в '
+            'секунду и задержки p50/p90/p99 по каждому пути в JSON. '
+            'Для сравнения режимов запустите сервер с SERVER_MODE=wsgi '
+            'и SERVER_MODE=asgi и сравните результаты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://localhost:8000',
+            help='Адрес сервера.',
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help='Путь для запросов, можно указать несколько раз.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=16,
+            help='Число параллельных клиентов.',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Длительность теста, секунды.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=float,
+            default=1,
+            help='Прогрев перед замером, секунды.',
+        )
+        parser.add_argument(
+            '--token',
+            help='Токен авторизации пользователя.',
+        )
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Метка результата, например wsgi или asgi.',
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError('Поддерживаются только http и https.')
+        self.url = url
+        self.headers = {'Accept': 'application/json'}
+        if options['token']:
+            self.headers['Authorization'] = f'Token {options["token"]}'
+        paths = list(options['paths'] or DEFAULT_PATHS)
+        self.results = {path: [] for path in paths}
+        self.errors = {path: 0 for path in paths}
+        self.lock = threading.Lock()
+
+        started = time.monotonic()
+        self.measure_from = started + options['warmup']
+        self.stop_at = self.measure_from + options['duration']
+        clients = [
+            threading.Thread(target=self.client, args=(paths, number))
+            for number in range(options['concurrency'])
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+
+        report = {
+            'label': options['label'],
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'duration': options['duration'],
+            'paths': {},
+        }
+        total = []
+        for path in paths:
+            latencies = sorted(self.results[path])
+            total.extend(latencies)
+            report['paths'][path] = self.summary(
+                latencies, self.errors[path], options['duration'])
+        report['total'] = self.summary(
+            sorted(total), sum(self.errors.values()), options['duration'])
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    def summary(self, latencies, errors, duration):
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / duration, 1),
+            'p50_ms': self.ms(percentile(latencies, 0.5)),
+            'p90_ms': self.ms(percentile(latencies, 0.9)),
+            'p99_ms': self.ms(percentile(latencies, 0.99)),
+            'max_ms': self.ms(latencies[-1] if latencies else None),
+        }
+
+    @staticmethod
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    def connect(self):
+        connection_class = (http.client.HTTPSConnection
+                            if self.url.scheme == 'https'
+                            else http.client.HTTPConnection)
+        return connection_class(self.url.hostname, self.url.port, timeout=30)
+
+    def client(self, paths, number):
+        '''Один клиент: соединение keep-alive, пути по кругу со сдвигом,
+           чтобы клиенты не запрашивали одно и то же одновременно.'''
+
+        connection = self.connect()
+        shift = number % len(paths)
+        paths = cycle(paths[shift:] + paths[:shift])
+        latencies, errors = [], []
+        while True:
+            path = next(paths)
+            started = time.monotonic()
+            if started >= self.stop_at:
+                break
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = self.connect()
+                ok = False
+            finished = time.monotonic()
+            if started < self.measure_from:
+                continue
+            if ok:
+                latencies.append((path, finished - started))
+            else:
+                errors.append(path)
+        connection.close()
+        with self.lock:
+            for path, latency in latencies:
+                self.results[path].append(latency)
+            for path in errors:
+                self.errors[path] += 1
@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from api.units import normalize_units
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает базовые единицы ингредиентов по таблице '
+            'переводов единиц.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиентов с новой базовой единицей: {normalize_units()}.'))
@@ -0,0 +1,59 @@
+from math import isclose
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.models import ShoppingListItem
+
+from api.utils import rebuild_shopping_lists, shopping_list_totals
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает сводные списки покупок по корзинам '
+            'пользователей. С --check только ищет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки при записи.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_drift()
+        else:
+            self.rebuild(options['batch_size'])
+
+    def check_drift(self):
+        expected = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in shopping_list_totals().iterator()
+        }
+        drift = 0
+        for user_id, ingredient_id, amount in (
+            ShoppingListItem.objects.order_by().values_list(
+                'user_id', 'ingredient_id', 'total_amount').iterator()
+        ):
+            total = expected.pop((user_id, ingredient_id), None)
+            # Количество с учётом порций дробное: сравнение с допуском.
+            if total is None or not isclose(total, amount):
+                drift += 1
+        drift += len(expected)
+        if drift:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {drift}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+
+    @transaction.atomic
+    def rebuild(self, batch_size):
+        created = rebuild_shopping_lists(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Сводные списки покупок пересобраны: {created} позиций.'))
@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from api.utils import recount_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, списков покупок, '
+            'рецептов и подписчиков.')
+
+    def handle(self, *args, **options):
+        for model, fixed in recount_counters().items():
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: '
+                f'исправлено записей - {fixed}.'))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from recipes.models import Cart, Favorite, Recipe
+
+# Вес одного добавления рецепта в избранное и в список покупок.
+WEIGHTS = (
+    (Favorite, 1.0),
+    (Cart, 1.0),
+)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг трендов рецептов (?ordering=trending) '
+            'по добавлениям в избранное и списки покупок с затуханием '
+            'по времени.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life',
+            type=float,
+            default=7,
+            help='Период полураспада веса добавления, дни.',
+        )
+        parser.add_argument(
+            '--horizon',
+            type=int,
+            default=90,
+            help='Учитывать добавления не старше стольких дней.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько рецептов пересчитывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        since = timezone.now() - timedelta(days=options['horizon'])
+        half_life = options['half_life']
+        last_id = 0
+        processed = updated = 0
+        while True:
+            current = dict(
+                Recipe.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'score')[:options['batch_size']]
+            )
+            if not current:
+                break
+            last_id = max(current)
+            scores = dict.fromkeys(current, 0.0)
+            for model, weight in WEIGHTS:
+                # Считаем добавления по дням в БД, затухание - по дням.
+                activity = model.objects.filter(
+                    recipe_id__in=current, created__gte=since
+                ).annotate(
+                    day=TruncDate('created')
+                ).values_list('recipe_id', 'day').annotate(
+                    total=Count('id')
+                ).order_by()
+                for recipe_id, day, total in activity:
+                    age = (today - day).days
+                    scores[recipe_id] += weight * total * 0.5 ** (
+                        age / half_life)
+            changed = [Recipe(id=recipe_id, score=score)
+                       for recipe_id, score in scores.items()
+                       if score != current[recipe_id]]
+            Recipe.objects.bulk_update(changed, ['score'])
+            processed += len(current)
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан: рецептов {processed}, '
+            f'изменено {updated}.'))
@@ -0,0 +1,239 @@
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+from hashlib import sha1
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger('api.metrics')
+
+# Доля запросов, для которых собираются метрики: 0 - выключено, 1 - все.
+SAMPLE_RATE = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.0)
+# Сколько одинаковых SQL-запросов за запрос считать признаком N+1.
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'REQUEST_METRICS_N_PLUS_ONE', 5)
+# Замер времени сериализации подменяет свойство data у Serializer и
+# ListSerializer DRF во всём процессе, поэтому включается отдельно.
+SERIALIZER_TIMING = getattr(settings, 'REQUEST_METRICS_SERIALIZERS', False)
+PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+
+# Значения в IN (...) и VALUES (...) разной длины дают один отпечаток.
+PLACEHOLDERS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+metrics = ContextVar('request_metrics', default=None)
+
+
+def fingerprint(sql):
+    '''Отпечаток SQL без значений: одинаковые запросы с разными
+       параметрами дают один отпечаток.'''
+
+    sql = LITERALS.sub('?', PLACEHOLDERS.sub('(...)', sql))
+    return sha1(' '.join(sql.split()).encode()).hexdigest()[:12], sql
+
+
+def project_frame():
+    '''Ближайшее к запросу место в коде проекта: файл, строка, функция.'''
+
+    for frame in reversed(traceback.extract_stack()):
+        if (frame.filename.startswith(PROJECT_DIR)
+                and not frame.filename.endswith('middleware.py')
+                and 'site-packages' not in frame.filename):
+            path = Path(frame.filename).relative_to(PROJECT_DIR)
+            return f'{path}:{frame.lineno} in {frame.name}'
+    return None
+
+
+class RequestMetrics:
+    '''Метрики одного запроса: SQL-запросы по отпечаткам и время
+       сериализации.'''
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.counts = Counter()
+        self.samples = {}
+        self.locations = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            key, normalized = fingerprint(sql)
+            self.counts[key] += 1
+            if self.counts[key] == 1:
+                self.samples[key] = normalized
+            elif self.counts[key] == 2:
+                # Место в коде ищем только для повторяющихся запросов.
+                self.locations[key] = project_frame()
+
+    def duplicates(self):
+        return [
+            {
+                'fingerprint': key,
+                'count': count,
+                'sql': self.samples[key][:300],
+                'location': self.locations.get(key),
+            }
+            for key, count in self.counts.most_common()
+            if count > 1
+        ]
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    '''Обёртка выполнения SQL, установленная в соединения постоянно:
+       запросы учитываются, только если текущий запрос попал в выборку.'''
+
+    current = metrics.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    return current(execute, sql, params, many, context)
+
+
+def install_wrapper(connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def timed_data(data):
+    '''Свойство data сериализатора с замером времени. Вложенные
+       сериализаторы учитываются в самом внешнем.'''
+
+    def wrapper(self):
+        current = metrics.get()
+        if current is None:
+            return data.fget(self)
+        current.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            current.serializer_depth -= 1
+            if not current.serializer_depth:
+                current.serializer_time += time.perf_counter() - started
+
+    wrapper.timed = True
+    return property(wrapper)
+
+
+def instrument_serializers():
+    for serializer_class in (serializers.Serializer,
+                             serializers.ListSerializer):
+        if not getattr(serializer_class.data.fget, 'timed', False):
+            serializer_class.data = timed_data(serializer_class.data)
+
+
+class RequestMetricsMiddleware:
+    '''Метрики запросов для части запросов (REQUEST_METRICS_SAMPLE_RATE):
+       имя вьюхи, общее время, время и число SQL-запросов, время
+       сериализации (при REQUEST_METRICS_SERIALIZERS), повторяющиеся
+       запросы. Результат - заголовок Server-Timing и строка JSON в
+       логгере api.metrics; повторы одного запроса от
+       N_PLUS_ONE_THRESHOLD раз логируются как N+1 с местом в коде,
+       откуда они выполняются.
+
+       У потоковых ответов запросы и время выдачи частей тоже
+       учитываются: строка в лог пишется после последней части, а
+       заголовок Server-Timing, отправленный до тела, содержит только
+       время до начала выдачи.'''
+
+    def __init__(self, get_response):
+        if SAMPLE_RATE <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if SERIALIZER_TIMING:
+            instrument_serializers()
+        # Соединения потоков, где выполняются вьюхи под ASGI, получают
+        # обёртку при подключении.
+        connection_created.connect(install_wrapper)
+
+    def __call__(self, request):
+        if random.random() >= SAMPLE_RATE:
+            return self.get_response(request)
+        for connection in connections.all():
+            install_wrapper(connection)
+        current = RequestMetrics()
+        token = metrics.set(current)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.reset(token)
+        total = time.perf_counter() - started
+        timings = [f'db;desc="{current.queries} queries";'
+                   f'dur={current.db_time * 1000:.1f}']
+        if SERIALIZER_TIMING:
+            timings.append(
+                f'serializer;dur={current.serializer_time * 1000:.1f}')
+        timings.append(f'total;dur={total * 1000:.1f}')
+        response['Server-Timing'] = ', '.join(timings)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                iter(response.streaming_content),
+                request, response, current, started)
+        else:
+            self.log(request, response, current, total)
+        return response
+
+    def stream(self, chunks, request, response, current, started):
+        '''Части потокового ответа с учётом их SQL-запросов в метриках
+           запроса. Лог пишется, когда ответ выдан или прерван.'''
+
+        try:
+            while True:
+                # Контекст выставляется только на время получения части:
+                # между частями сервер может выполнять другой код.
+                token = metrics.set(current)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    metrics.reset(token)
+                yield chunk
+        finally:
+            self.log(request, response, current,
+                     time.perf_counter() - started)
+
+    def log(self, request, response, current, total):
+        match = request.resolver_match
+        duplicates = current.duplicates()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(current.db_time * 1000, 1),
+            'queries': current.queries,
+            'serializer_ms': (round(current.serializer_time * 1000, 1)
+                              if SERIALIZER_TIMING else None),
+            'streaming': response.streaming,
+            'duplicates': [
+                {key: item[key] for key in ('fingerprint', 'count')}
+                for item in duplicates
+            ],
+        }
+        logger.info(json.dumps(record, ensure_ascii=False))
+        for item in duplicates:
+            if item['count'] >= N_PLUS_ONE_THRESHOLD:
+                logger.warning(json.dumps({
+                    'event': 'n_plus_one',
+                    'view': record['view'],
+                    'path': request.path,
+                    **item,
+                }, ensure_ascii=False))
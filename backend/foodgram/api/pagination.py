@@ -1,6 +1,151 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import BooleanField, F, Func, Q, Value
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RowComparison(Func):
+    '''Сравнение строк (a, b) < (x, y): PostgreSQL и SQLite ищут такое
+       условие по составному индексу, а не фильтруют все строки до
+       курсора, как эквивалентное условие через OR.'''
+
+    output_field = BooleanField()
+
+    def __init__(self, fields, operator, values):
+        self.operator = operator
+        super().__init__(*[F(name) for name in fields],
+                         *[Value(value) for value in values])
+
+    def as_sql(self, compiler, connection):
+        parts, params = [], []
+        for expression in self.source_expressions:
+            sql, expression_params = compiler.compile(expression)
+            parts.append(sql)
+            params.extend(expression_params)
+        half = len(parts) // 2
+        return (f'({", ".join(parts[:half])}) {self.operator} '
+                f'({", ".join(parts[half:])})'), params
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    '''Постраничная пагинация page/limit. С параметром ?cursor=
+       включается курсорная пагинация по сортировке queryset (или по
+       cursor_ordering, если сортировка не задана явно): без OFFSET и
+       COUNT(*), время ответа не зависит от глубины страницы.'''
+
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('id',)
+    cursor_only = False
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Курсор строится по сортировке queryset; списки - только page.
+        self.cursor_mode = (
+            (self.cursor_only
+             or self.cursor_query_param in request.query_params)
+            and hasattr(queryset, 'query'))
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = queryset.query.order_by or self.cursor_ordering
+        cursor = self.decode_cursor(queryset.model, request)
+        queryset = queryset.order_by(*self.ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.cursor_filter(cursor))
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_cursor = (self.encode_cursor(page[-1])
+                            if self.has_next else None)
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor)
+
+    def cursor_fields(self):
+        # До paginate_queryset сортировка - cursor_ordering.
+        ordering = getattr(self, 'ordering', self.cursor_ordering)
+        return [field.lstrip('-') for field in ordering]
+
+    def cursor_filter(self, values):
+        '''Условие "строго после курсора" для текущей сортировки:
+           (a, b) > (x, y) <=> a > x или a = x и b > y. При одном
+           направлении сортировки всех полей - сравнение строк.'''
+
+        directions = {field.startswith('-') for field in self.ordering}
+        if len(directions) == 1:
+            return RowComparison(self.cursor_fields(),
+                                 '<' if directions.pop() else '>', values)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, instance):
+        values = [getattr(instance, name) for name in self.cursor_fields()]
+        # Даты с микросекундами: при округлении курсор пропустит строки.
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value
+                  for value in values]
+        return b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, model, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(b64decode(encoded.encode()).decode())
+            fields = self.cursor_fields()
+            if len(values) != len(fields):
+                raise ValueError
+            return [self.cursor_value(model, name, value)
+                    for name, value in zip(fields, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_value(self, model, name, value):
+        '''Значение из курсора: поля модели приводим к их типу,
+           аннотации (например, rank) оставляем как есть.'''
+
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return value
+
+
+class RecipePagination(LimitPageNumberPagination):
+    '''Пагинация ленты рецептов: курсор по (pub_date, id).'''
+
+    cursor_ordering = ('-pub_date', '-id')
+
+
+class FeedPagination(RecipePagination):
+    '''Пагинация ленты подписок: только курсор, без номеров страниц.'''
+
+    cursor_only = True
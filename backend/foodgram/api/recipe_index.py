@@ -0,0 +1,267 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict, namedtuple
+from collections.abc import Sequence
+from datetime import timedelta
+from itertools import accumulate, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import (
+    Ingredient,
+    Recipe,
+    RecipeIndexChange,
+    RecipeIngredient,
+)
+
+from .cache import bump_version, get_version
+
+RESULTS_CACHE_SIZE = 32
+# Без новой версии индекс всё равно сверяется с журналом изменений не
+# реже, чем раз в столько секунд.
+POLL_SECONDS = getattr(settings, 'RECIPE_INDEX_POLL_SECONDS', 5)
+# Сколько хранится журнал: индекс, который не сверялся дольше, строится
+# заново.
+LOG_RETENTION = timedelta(
+    hours=getattr(settings, 'RECIPE_INDEX_LOG_HOURS', 24))
+# Записи журнала за столько до последней сверки читаются повторно:
+# запись долгой транзакции видна позже, чем создана.
+LOG_OVERLAP = timedelta(seconds=60)
+# Больше изменённых рецептов за одну сверку - индекс строится заново.
+MAX_INCREMENTAL = 500
+
+# Снимок индекса. Не меняется после создания: обновление строит новый
+# снимок, поиск в других потоках дочитывает прежний.
+Snapshot = namedtuple(
+    'Snapshot', 'version checked seen postings sizes results')
+
+
+class Ranking(Sequence):
+    '''Результат подбора: пары (id рецепта, покрытие) по убыванию
+       покрытия, затем id. Рецепты хранятся группами с одинаковым
+       покрытием, пары собираются только для запрошенного среза.'''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.offsets = list(accumulate(len(ids) for _, ids in buckets))
+
+    def __len__(self):
+        return self.offsets[-1] if self.offsets else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        bucket = bisect_right(self.offsets, index)
+        if index < 0 or bucket == len(self.buckets):
+            raise IndexError('Ranking index out of range')
+        coverage, ids = self.buckets[bucket]
+        start = self.offsets[bucket - 1] if bucket else 0
+        return ids[index - start], coverage
+
+
+def build(rows):
+    '''Массивы id рецептов по ингредиентам и число ингредиентов рецептов
+       (массив по id рецепта) из пар (ингредиент, рецепт), упорядоченных
+       по ингредиенту и рецепту.'''
+
+    postings = {
+        ingredient_id: array('i', map(itemgetter(1), group))
+        for ingredient_id, group in groupby(rows, key=itemgetter(0))
+    }
+    counts = Counter()
+    for recipe_ids in postings.values():
+        counts.update(recipe_ids)
+    sizes = array('H', [0]) * (max(counts, default=0) + 1)
+    for recipe_id, size in counts.items():
+        sizes[recipe_id] = size
+    return postings, sizes
+
+
+def apply(postings, sizes, recipes):
+    '''Копия индекса, в которой у рецептов recipes ({рецепт: id
+       ингредиентов}) новые ингредиенты. Меняются копии затронутых
+       массивов, исходные остаются как были.'''
+
+    postings = dict(postings)
+    copied = set()
+
+    def writable(ingredient_id):
+        if ingredient_id not in copied:
+            postings[ingredient_id] = array(
+                'i', postings.get(ingredient_id, ()))
+            copied.add(ingredient_id)
+        return postings[ingredient_id]
+
+    targets = sorted(recipes)
+    for ingredient_id, recipe_ids in list(postings.items()):
+        for recipe_id in targets:
+            position = bisect_left(recipe_ids, recipe_id)
+            if (position < len(recipe_ids)
+                    and recipe_ids[position] == recipe_id):
+                recipe_ids = writable(ingredient_id)
+                del recipe_ids[bisect_left(recipe_ids, recipe_id)]
+    for recipe_id, ingredient_ids in recipes.items():
+        for ingredient_id in set(ingredient_ids):
+            insort(writable(ingredient_id), recipe_id)
+    sizes = array('H', sizes)
+    if targets and targets[-1] >= len(sizes):
+        sizes.extend([0] * (targets[-1] + 1 - len(sizes)))
+    for recipe_id, ingredient_ids in recipes.items():
+        sizes[recipe_id] = len(set(ingredient_ids))
+    return postings, sizes
+
+
+def rank(postings, sizes, ingredient_ids, min_coverage=0.0):
+    '''Рецепты, в которых есть хотя бы один из ингредиентов, по
+       убыванию покрытия - доли ингредиентов рецепта, которые есть
+       среди ingredient_ids. Покрытие не меньше min_coverage.'''
+
+    hits = Counter()
+    for ingredient_id in set(ingredient_ids):
+        hits.update(postings.get(ingredient_id, ()))
+    # Различных значений покрытия немного: группируем по ним вместо
+    # сортировки всех кандидатов.
+    buckets = defaultdict(list)
+    for recipe_id, hit in hits.items():
+        buckets[hit / sizes[recipe_id]].append(recipe_id)
+    return Ranking([
+        (coverage, sorted(buckets[coverage], reverse=True))
+        for coverage in sorted(buckets, reverse=True)
+        if coverage >= min_coverage
+    ])
+
+
+class RecipeIndex:
+    '''Обратный индекс "ингредиент -> рецепты" в памяти процесса для
+       подбора рецептов по имеющимся ингредиентам. Для каждого
+       ингредиента хранится отсортированный массив id рецептов, для
+       каждого рецепта - число его ингредиентов (массив по id рецепта).
+
+       Индекс строится при первом обращении. Изменения рецептов пишутся
+       в журнал RecipeIndexChange в той же транзакции; при новой версии
+       RecipeIngredient в кэше или раз в POLL_SECONDS процесс применяет
+       к индексу записи журнала, которых ещё не видел. Обновление
+       строит новый снимок (copy-on-write) в одном потоке, остальные
+       потоки тем временем ищут по прежнему снимку.'''
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._results_lock = threading.Lock()
+
+    @staticmethod
+    def _changes(since):
+        return list(RecipeIndexChange.objects.filter(
+            created__gte=since
+        ).values_list('id', 'recipe_id', 'created'))
+
+    def _load(self, version):
+        checked = timezone.now()
+        RecipeIndexChange.objects.filter(
+            created__lt=checked - LOG_RETENTION).delete()
+        # Журнал читается до рецептов: изменение между двумя чтениями
+        # будет применено ещё раз, это безопасно.
+        seen = frozenset(
+            change_id for change_id, _, _
+            in self._changes(checked - LOG_OVERLAP))
+        rows = RecipeIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').iterator(chunk_size=10000)
+        return Snapshot(version, checked, seen, *build(rows), {})
+
+    def _refresh(self, snapshot, version):
+        '''Снимок с записями журнала, которых не было в snapshot.'''
+
+        checked = timezone.now()
+        if checked - snapshot.checked > LOG_RETENTION - LOG_OVERLAP:
+            return self._load(version)
+        changes = self._changes(snapshot.checked - LOG_OVERLAP)
+        recipe_ids = {recipe_id for change_id, recipe_id, _ in changes
+                      if change_id not in snapshot.seen}
+        if None in recipe_ids or len(recipe_ids) > MAX_INCREMENTAL:
+            return self._load(version)
+        seen = frozenset(change_id for change_id, _, created in changes
+                         if created >= checked - LOG_OVERLAP)
+        if not recipe_ids:
+            return snapshot._replace(
+                version=version, checked=checked, seen=seen)
+        recipes = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes[recipe_id].append(ingredient_id)
+        return Snapshot(version, checked, seen,
+                        *apply(snapshot.postings, snapshot.sizes, recipes),
+                        {})
+
+    def _get(self):
+        version = get_version(RecipeIngredient)
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Первый снимок строит один поток, остальные дожидаются его.
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load(version)
+                return self._snapshot
+        if snapshot.version == version and (
+                timezone.now() - snapshot.checked).total_seconds() < (
+                POLL_SECONDS):
+            return snapshot
+        if not self._lock.acquire(blocking=False):
+            return snapshot
+        try:
+            self._snapshot = self._refresh(self._snapshot, version)
+        finally:
+            self._lock.release()
+        return self._snapshot
+
+    def search(self, ingredient_ids, min_coverage=0.0):
+        '''Подбор рецептов по ингредиентам (см. rank), последние
+           результаты кэшируются в снимке.'''
+
+        snapshot = self._get()
+        key = (frozenset(ingredient_ids), min_coverage)
+        results = snapshot.results
+        if key in results:
+            return results[key]
+        ranking = rank(snapshot.postings, snapshot.sizes, *key)
+        with self._results_lock:
+            if len(results) >= RESULTS_CACHE_SIZE:
+                results.pop(next(iter(results)))
+            results[key] = ranking
+        return ranking
+
+
+def log_recipe_changes(recipe_ids):
+    '''Записывает в журнал изменение ингредиентов рецептов recipe_ids
+       (None - всех рецептов) в текущей транзакции. После коммита меняет
+       версию, чтобы процессы сверились с журналом сразу.'''
+
+    RecipeIndexChange.objects.bulk_create([
+        RecipeIndexChange(recipe_id=recipe_id) for recipe_id in recipe_ids
+    ])
+    transaction.on_commit(lambda: bump_version(RecipeIngredient))
+
+
+@receiver(post_delete, sender=Recipe)
+def log_recipe_delete(sender, instance, *a, **kw):
+    '''Удалили рецепт - убрать его из индексов.'''
+
+    log_recipe_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Ingredient)
+def log_ingredient_delete(sender, *a, **kw):
+    '''Вместе с ингредиентом удалены его строки во всех рецептах.'''
+
+    log_recipe_changes([None])
+
+
+recipe_index = RecipeIndex()
@@ -0,0 +1,35 @@
+from django.db import router, transaction
+from django.db.models.sql import InsertQuery
+
+# Вставка и удаление строк с числом затронутых строк и без сигналов.
+# Публичный API Django 3.2 этого не даёт: bulk_create(ignore_conflicts=True)
+# не сообщает, добавлена ли строка, а QuerySet.delete() выбирает объекты
+# и отправляет сигналы на каждый. Поэтому здесь - и только здесь -
+# используются InsertQuery и QuerySet._raw_delete; при обновлении Django
+# их нужно проверить первыми.
+
+
+def insert_ignore(model, **values):
+    '''INSERT ... ON CONFLICT DO NOTHING (в SQLite - INSERT OR IGNORE):
+       повтор определяет уникальное ограничение в базе, а не запрос перед
+       вставкой. Сигналы не отправляются. Возвращает True, если строка
+       добавлена.'''
+
+    using = router.db_for_write(model)
+    query = InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(
+        [field for field in model._meta.concrete_fields
+         if not field.primary_key],
+        [model(**values)],
+    )
+    with transaction.get_connection(using).cursor() as cursor:
+        for sql, params in query.get_compiler(using).as_sql():
+            cursor.execute(sql, params)
+        return cursor.rowcount > 0
+
+
+def delete_rows(queryset):
+    '''DELETE без выборки объектов и сигналов на каждую запись.
+       Возвращает число удалённых строк.'''
+
+    return queryset._raw_delete(queryset.db)
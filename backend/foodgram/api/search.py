@@ -0,0 +1,80 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+# Полнотекстовый индекс для SQLite (runserver): таблица FTS5 поверх
+# recipes_recipe и триггеры синхронизации. SQLite пересоздаёт таблицу
+# при изменении схемы и теряет триггеры, поэтому они создаются заново
+# после каждой миграции.
+SQLITE_FTS = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f"name, text, content='recipes_recipe', content_rowid='id')",
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert '
+    f'AFTER INSERT ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete '
+    f'AFTER DELETE ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update '
+    f'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) "
+    f"VALUES ('rank', 'bm25(10.0, 1.0)')",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+
+def create_sqlite_search_index(using='default', **kwargs):
+    '''После миграций создаёт индекс FTS5, если база - SQLite.'''
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in SQLITE_FTS:
+            cursor.execute(statement)
+
+
+def fts5_query(query):
+    '''Запрос пользователя для MATCH: каждое слово в кавычках,
+       последнее - с поиском по началу слова.'''
+
+    words = ['"{}"'.format(word.replace('"', '""'))
+             for word in query.split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def search_recipes(queryset, query):
+    '''Полнотекстовый поиск рецептов по названию и описанию с
+       сортировкой по релевантности (аннотация rank).'''
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), search_query),
+                      FloatField())
+        ).order_by('-rank', '-id')
+    if vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return queryset.none()
+        # Таблица FTS5 присоединяется к рецептам (модель RecipeSearch):
+        # MATCH выполняется один раз, rank берётся из найденных строк.
+        return queryset.filter(search_index__document__match=match).annotate(
+            rank=-F('search_index__rank')
+        ).order_by('-rank', '-id')
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query))
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, exceptions, status
-from rest_framework.validators import UniqueTogetherValidator
 from recipes.models import (
     Tag,
     Ingredient,
@@ -9,20 +10,40 @@ from recipes.models import (
     Favorite,
     RecipeIngredient,
     Cart,
+    ShoppingListItem,
 )
 from users.models import User, Follow
 from users.serializers import UsersSerializer
-from .utils import create_ingredients
+from .fields import StreamingBase64ImageField
+from .images import image_variants, schedule_variants
+from .recipe_index import log_recipe_changes
+from .units import format_amount
+from .utils import (
+    MAX_SERVINGS,
+    create_ingredients,
+    refresh_shopping_list,
+    update_ingredients,
+)
 
 # fmt: off
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    '''Варианты картинки рецепта разных размеров в WebP и JPEG.'''
+
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return image_variants(obj.image_hash, self.context.get('request'))
+
+
+class RecipeShortSerializer(ImageVariantsMixin,
+                            serializers.ModelSerializer):
     '''Сериализатор с краткой информацией о рецепте.'''
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('__all__',)
 
 
@@ -31,31 +52,32 @@ class FollowSerializer(serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'recipes', 'recipes_count')
+                  'last_name', 'is_subscribed', 'recipes', 'recipes_count',
+                  'followers_count')
         read_only_fields = ('email', 'username', 'last_name', 'first_name',
-                            'is_subscribed', 'recipes', 'recipes_count',)
+                            'is_subscribed', 'recipes', 'recipes_count',
+                            'followers_count',)
 
     def get_is_subscribed(self, obj):
         '''Проверка на подписку.'''
 
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (request.user.is_authenticated
                 and Follow.objects.filter(user=request.user, author=obj)
                 .exists())
 
-    def get_recipes_count(self, obj):
-        '''Подсчет количества рецептов.'''
-
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
         '''Получаю список рецептов.'''
 
+        if hasattr(obj, 'recipes_page'):
+            return RecipeShortSerializer(
+                obj.recipes_page, many=True, read_only=True).data
         request = self.context.get('request')
         limit = request.GET.get('recipes_limit')
         recipes = obj.recipes.all()
@@ -64,17 +86,14 @@ class FollowSerializer(serializers.ModelSerializer):
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
+    conflict_message = 'Вы уже подписаны на этого пользователя.'
+
     def validate(self, data):
-        '''Проверка правил подписки: нельзя подписаться второй раз и на
-           самого себя.'''
+        '''Нельзя подписаться на самого себя. Повторную подписку
+           отсекает ограничение уникальности в базе при вставке.'''
 
         author = self.instance
         user = self.context.get('request').user
-        if Follow.objects.filter(user=user, author=author).exists():
-            raise exceptions.ValidationError(
-                detail='Вы уже подписаны на этого пользователя.',
-                code=status.HTTP_400_BAD_REQUEST
-            )
         if user == author:
             raise exceptions.ValidationError(
                 detail='Нельзя подписываться на самого себя.',
@@ -96,7 +115,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class IngredientGetSerializer(serializers.ModelSerializer):
@@ -108,11 +127,18 @@ class IngredientGetSerializer(serializers.ModelSerializer):
         source='ingredient.measurement_unit',
         read_only=True
     )
+    amount = serializers.SerializerMethodField()
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
+    def get_amount(self, obj):
+        '''Количество на запрошенное ?servings= число порций, если оно
+           посчитано в запросе.'''
+
+        return format_amount(getattr(obj, 'scaled_amount', obj.amount))
+
 
 class IngredientPostSerializer(serializers.ModelSerializer):
     '''Сериализатор для добавления ингредиентов в рецепте.'''
@@ -125,7 +151,26 @@ class IngredientPostSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    '''Сериализатор сводного списка покупок.'''
+
+    id = serializers.IntegerField(source='ingredient.id', read_only=True)
+    name = serializers.CharField(source='ingredient.name', read_only=True)
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit',
+        read_only=True
+    )
+    amount = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+    def get_amount(self, obj):
+        return format_amount(obj.total_amount)
+
+
+class RecipeGetSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     ''' Сериализатор для получения информации о рецепте.'''
 
     tags = TagSerializer(many=True, read_only=True)
@@ -135,14 +180,21 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(required=False)
+    servings = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time')
+                  'image', 'image_variants', 'text', 'cooking_time',
+                  'servings', 'favorites_count', 'carts_count')
+
+    def get_servings(self, obj):
+        return getattr(obj, 'scaled_servings', obj.servings)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and Favorite.objects.filter(
@@ -150,6 +202,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
                 ).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and Cart.objects.filter(
@@ -157,6 +211,49 @@ class RecipeGetSerializer(serializers.ModelSerializer):
                 ).exists())
 
 
+class RecipeCoverageSerializer(RecipeGetSerializer):
+    '''Рецепт с долей его ингредиентов, которые есть у пользователя.'''
+
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeGetSerializer.Meta):
+        fields = RecipeGetSerializer.Meta.fields + ('coverage',)
+
+
+class ServingsSerializer(serializers.Serializer):
+    '''Число порций из ?servings= или тела запроса.'''
+
+    servings = serializers.IntegerField(
+        min_value=1, max_value=MAX_SERVINGS, required=False, allow_null=True)
+
+
+class ByIngredientsSerializer(serializers.Serializer):
+    '''Параметры подбора рецептов по имеющимся ингредиентам.'''
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False)
+    min_coverage = serializers.FloatField(
+        min_value=0, max_value=1, default=0)
+
+    def to_internal_value(self, data):
+        '''?ids=1,2,3 и ?ids=1&ids=2 - оба варианта.'''
+
+        ids = [value for item in data.getlist('ids')
+               for value in item.split(',') if value]
+        params = {'ids': ids}
+        if 'min_coverage' in data:
+            params['min_coverage'] = data['min_coverage']
+        return super().to_internal_value(params)
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    '''Список id для пакетного добавления или удаления.'''
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=getattr(settings, 'BULK_MAX_ITEMS', 100))
+
+
 class RecipePostSerializer(serializers.ModelSerializer):
     '''Сериализатор для добаления или обновления рецептов.'''
 
@@ -164,12 +261,12 @@ class RecipePostSerializer(serializers.ModelSerializer):
         many=True, source='recipeingredients')
     tags = serializers.PrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True)
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
 
     class Meta:
         model = Recipe
         fields = ('ingredients', 'tags', 'image',
-                  'name', 'text', 'cooking_time')
+                  'name', 'text', 'cooking_time', 'servings')
 
     def validate(self, data):
         ingredients_list = []
@@ -183,6 +280,12 @@ class RecipePostSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Вы уже добавили этот ингридиент.'
             )
+        found = Ingredient.objects.in_bulk(ingredients_list)
+        missing = [pk for pk in ingredients_list if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}.'
+            )
         return data
 
     @transaction.atomic
@@ -193,22 +296,39 @@ class RecipePostSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(author=request.user, **validated_data)
         recipe.tags.set(tags)
         create_ingredients(ingredients, recipe)
+        log_recipe_changes([recipe.id])
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('recipeingredients')
         tags = validated_data.pop('tags')
-        instance.tags.clear()
         instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
+        servings = instance.servings
         super().update(instance, validated_data)
-        create_ingredients(ingredients, instance)
-        instance.save()
+        if 'image' in validated_data:
+            # До построения новых вариантов отдаём только оригинал.
+            schedule_variants(instance)
+        old_ids = list(instance.ingredient_list.values_list(
+            'ingredient_id', flat=True))
+        new_ids = [ingredient.get('id') for ingredient in ingredients]
+        amounts = update_ingredients(ingredients, instance)
+        log_recipe_changes([instance.id])
+        if instance.servings != servings:
+            # Порции рецепта - делитель для корзин со своими порциями.
+            amounts = set(old_ids) | set(new_ids)
+        if amounts:
+            refresh_shopping_list(
+                list(instance.carts.values_list('user_id', flat=True)),
+                list(amounts))
         return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
+        prefetch_related_objects([instance], 'tags', Prefetch(
+            'ingredient_list',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ))
         return RecipeGetSerializer(
             instance,
             context={'request': request}
@@ -218,16 +338,12 @@ class RecipePostSerializer(serializers.ModelSerializer):
 class FavoriteSerializer(serializers.ModelSerializer):
     '''Сериализатор для рецептов в Избранном.'''
 
+    # Повторное добавление отсекает ограничение уникальности в базе.
+    conflict_message = 'Рецепт уже добавлен в избранное.'
+
     class Meta:
         model = Favorite
         fields = ('user', 'recipe',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже добавлен в избранное.'
-            )
-        ]
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -240,16 +356,12 @@ class FavoriteSerializer(serializers.ModelSerializer):
 class CartSerializer(serializers.ModelSerializer):
     '''Сериализатор списка покупок.'''
 
+    # Повторное добавление отсекает ограничение уникальности в базе.
+    conflict_message = 'Рецепт уже добавлен в список покупок.'
+
     class Meta:
         model = Cart
         fields = ('user', 'recipe',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Cart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже добавлен в список покупок.'
-            )
-        ]
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    '''sha256 содержимого файла, читаемого частями.'''
+
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hash_from_name(name):
+    '''Хэш содержимого из имени файла в ContentAddressedStorage.'''
+
+    return posixpath.splitext(posixpath.basename(name))[0]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''Файловое хранилище, в котором имя файла - хэш его содержимого:
+       <каталог>/<2 символа хэша>/<хэш><расширение>. Одинаковые файлы
+       хранятся один раз. Файлы не удаляются при удалении записей:
+       ссылки на них считаются в StoredFile, а неиспользуемые файлы
+       удаляет команда collect_media.'''
+
+    def claim(self, name):
+        '''Отмечает, что существующий файл снова используется: UPDATE
+           записи StoredFile ждёт, пока collect_media держит её
+           блокировку, и затем держит её сам до конца транзакции.
+           Свежая дата защищает файл от сборщика мусора, пока новая
+           ссылка на него не сохранена.'''
+
+        apps.get_model('recipes', 'StoredFile').objects.filter(
+            name=name).update(updated=timezone.now())
+        os.utime(self.path(name))
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, совпадение имён - это
+        # совпадение содержимого, а не конфликт.
+        return name
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name)
+        digest = content_hash(content)
+        name = posixpath.join(directory, digest[:2],
+                              digest + posixpath.splitext(filename)[1])
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            try:
+                self.claim(name)
+                return name
+            except FileNotFoundError:
+                # Сборщик удалил файл, пока мы ждали его блокировку.
+                pass
+        return self.write(name, content)
+
+    def write(self, name, content):
+        '''Записывает файл под именем name как есть, заменяя
+           существующий: так сохраняются варианты картинок, имена которых
+           уже построены по хэшу оригинала.'''
+
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем: при
+        # одновременной загрузке одинаковых файлов содержимое совпадает.
+        temporary = f'{full_path}.{uuid.uuid4().hex}.tmp'
+        try:
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL
+                         | getattr(os, 'O_BINARY', 0), 0o666)
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        return name
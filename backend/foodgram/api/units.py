@@ -0,0 +1,164 @@
+from django.db.models import (
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, NullIf
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from recipes.models import (
+    Ingredient,
+    RecipeIngredient,
+    ShoppingListItem,
+    UnitConversion,
+)
+
+# Единицы для вывода: базовая единица -> (крупная единица, сколько в ней
+# базовых). Количество от одной крупной единицы выводится в ней.
+DISPLAY_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+# Знаков после запятой в выгрузке списка покупок.
+AMOUNT_PRECISION = 3
+
+
+def conversion(field, default):
+    '''Поле правила перевода для ингредиента: правило для этого
+       ингредиента, затем общее правило для единицы, затем default.'''
+
+    rules = UnitConversion.objects.filter(unit=OuterRef('measurement_unit'))
+    return Coalesce(
+        Subquery(rules.filter(
+            ingredient_name=OuterRef('name')).values(field)[:1]),
+        Subquery(rules.filter(ingredient_name='').values(field)[:1]),
+        default,
+    )
+
+
+def normalize_units(queryset=None):
+    '''Пересчитывает базовую единицу и множитель ингредиентов по таблице
+       переводов одним UPDATE. Возвращает число изменённых ингредиентов.'''
+
+    if queryset is None:
+        queryset = Ingredient.objects.all()
+    fields = {
+        'base_unit': conversion('base_unit', F('measurement_unit')),
+        'base_factor': conversion('factor', Value(1.0)),
+    }
+    return queryset.exclude(**fields).update(**fields)
+
+
+def resolve_base_units(ingredients):
+    '''Базовые единицы и множители для пачки ингредиентов одним
+       запросом к таблице переводов: правило для ингредиента, затем общее
+       правило для единицы, иначе - своя единица.'''
+
+    units = {ingredient.measurement_unit for ingredient in ingredients}
+    if not units:
+        return
+    names = {ingredient.name for ingredient in ingredients} | {''}
+    rules = {
+        (name, unit): (base_unit, factor)
+        for name, unit, base_unit, factor in UnitConversion.objects.filter(
+            unit__in=units, ingredient_name__in=names,
+        ).values_list('ingredient_name', 'unit', 'base_unit', 'factor')
+    }
+    for ingredient in ingredients:
+        unit = ingredient.measurement_unit
+        ingredient.base_unit, ingredient.base_factor = (
+            rules.get((ingredient.name, unit))
+            or rules.get(('', unit))
+            or (unit, 1))
+
+
+@receiver(pre_save, sender=Ingredient)
+def set_base_unit(sender, instance, update_fields=None, *a, **kw):
+    '''Базовая единица нового или изменённого ингредиента. Сохранение
+       без названия и единицы в update_fields таблицу не читает;
+       load_csv вставляет ингредиенты без сигналов и определяет базовые
+       единицы сразу для пачки.'''
+
+    if update_fields is not None and not {
+            'name', 'measurement_unit'} & set(update_fields):
+        return
+    resolve_base_units([instance])
+
+
+@receiver(post_save, sender=UnitConversion)
+@receiver(post_delete, sender=UnitConversion)
+def apply_conversions(sender, instance, *a, **kw):
+    '''Таблица переводов изменилась - пересчитать ингредиенты.'''
+
+    normalize_units()
+
+
+def servings_ratio(servings, recipe='recipe__'):
+    '''Множитель количества для servings порций рецепта.'''
+
+    return ExpressionWrapper(
+        Value(float(servings)) / F(f'{recipe}servings'),
+        output_field=FloatField(),
+    )
+
+
+def totals_by_unit(rows, amount):
+    '''Суммы amount по названию ингредиента и базовой единице одним
+       GROUP BY в базе: (название, единица, количество).'''
+
+    return rows.values(
+        name=F('ingredient__name'),
+        unit=Coalesce(NullIf('ingredient__base_unit', Value('')),
+                      'ingredient__measurement_unit'),
+    ).annotate(amount=Sum(ExpressionWrapper(
+        amount * F('ingredient__base_factor'),
+        output_field=FloatField(),
+    ))).values_list('name', 'unit', 'amount').order_by('name', 'unit')
+
+
+def shopping_list_totals_by_unit(user, servings=None):
+    '''Список покупок в базовых единицах: варианты одного ингредиента
+       в разных единицах (г и кг) складываются в одну строку. Количество
+       переводится и суммируется в базе по всему списку, строки читаются
+       курсором по мере выгрузки. Без servings - из сводного списка с
+       порциями из корзины, с servings - по рецептам корзины, каждый на
+       servings порций.'''
+
+    if servings is None:
+        rows = totals_by_unit(ShoppingListItem.objects.filter(user=user),
+                              F('total_amount'))
+    else:
+        rows = totals_by_unit(
+            RecipeIngredient.objects.filter(recipe__carts__user=user),
+            F('amount') * servings_ratio(servings))
+    return rows.iterator()
+
+
+def format_amount(amount):
+    '''Количество без лишних знаков: 2.0 -> 2, 0.33333 -> 0.333.'''
+
+    amount = round(amount, AMOUNT_PRECISION)
+    if amount == int(amount):
+        return int(amount)
+    return amount
+
+
+def display_amount(amount, unit):
+    '''Количество и единица для человека: 1500 г -> 1.5 кг.'''
+
+    larger = DISPLAY_UNITS.get(unit)
+    if larger is not None and amount >= larger[1]:
+        unit, amount = larger[0], amount / larger[1]
+    return format_amount(amount), unit
+
+
+def shopping_list_rows(user, servings=None):
+    '''Строки выгрузки списка покупок: (название, единица, количество).'''
+
+    for name, unit, amount in shopping_list_totals_by_unit(user, servings):
+        amount, unit = display_amount(amount, unit)
+        yield name, unit, amount
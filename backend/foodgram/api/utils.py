@@ -1,77 +1,613 @@
-from pathlib import Path
+import csv
+import json
+from io import BytesIO
+from itertools import islice
+
+from django.conf import settings
 from django.dispatch import receiver
-from django.db.models.signals import post_delete
+from django.db import transaction
+from django.db.models import (
+    Count,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 from rest_framework import response, status
-from django.shortcuts import get_object_or_404, HttpResponse
-from recipes.models import Recipe, RecipeIngredient, Ingredient
+from rest_framework.settings import api_settings
+from recipes.models import (
+    Cart,
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    ShoppingListItem,
+    StoredFile,
+)
+from users.models import Follow, User
+
+from .feed import drop_feed_window
+from .rows import delete_rows, insert_ignore
+from .units import shopping_list_rows
+
+
+# Наибольшее число порций в ?servings=: больше не помещается в поле
+# порций корзины.
+MAX_SERVINGS = 32767
 
 
 # fmt: off
+def change_references(name, delta):
+    '''Меняет число ссылок на файл хранилища. Сами файлы удаляет
+       команда collect_media, а не запрос.'''
+
+    if not name:
+        return
+    rows = StoredFile.objects.filter(name=name)
+    if delta < 0:
+        rows.filter(references__gte=-delta).update(
+            references=F('references') + delta, updated=timezone.now())
+        return
+    # UPDATE ждёт, пока collect_media держит строку; если сборщик её
+    # удалил, строка создаётся заново и ссылка не теряется.
+    while not rows.update(references=F('references') + delta,
+                          updated=timezone.now()):
+        StoredFile.objects.get_or_create(name=name)
+
+
+def recount_references():
+    '''Пересчитывает ссылки на файлы по картинкам рецептов. Возвращает
+       число исправленных записей.'''
+
+    StoredFile.objects.bulk_create([
+        StoredFile(name=name) for name in Recipe.objects.exclude(
+            image=''
+        ).exclude(
+            image__in=StoredFile.objects.values('name')
+        ).order_by().values_list('image', flat=True).distinct()
+    ], batch_size=1000, ignore_conflicts=True)
+    references = Coalesce(Subquery(
+        Recipe.objects.filter(image=OuterRef('name')).order_by()
+        .values('image').annotate(total=Count('pk')).values('total')
+    ), 0)
+    return StoredFile.objects.exclude(references=references).update(
+        references=references)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_image(sender, instance, update_fields=None, *a, **kw):
+    '''Запоминаем прежнюю картинку рецепта до сохранения новой.'''
+
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = Recipe.objects.filter(pk=instance.pk).values_list(
+            'image', flat=True).first()
+    instance._previous_image = previous or ''
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, *a, **kw):
+    '''Картинку рецепта заменили - переносим ссылку на новый файл.'''
+
+    if '_previous_image' not in instance.__dict__:
+        return
+    previous = instance.__dict__.pop('_previous_image')
+    current = instance.image.name or ''
+    if previous != current:
+        change_references(current, 1)
+        change_references(previous, -1)
+
+
 @receiver(post_delete, sender=Recipe)
-def delete_image(sender, instance, *a, **kw):
-    '''Удаяем рецепт - удаляем картинку.'''
+def release_image(sender, instance, *a, **kw):
+    '''Удаляем рецепт - освобождаем ссылку на картинку.'''
 
-    image = Path(instance.image.path)
-    if image.exists():
-        image.unlink()
+    change_references(instance.image.name, -1)
 
 
-def shopping_list_print(self, request, ingredients):
-    '''Выгружает текстовый файл со списком покупок.'''
+@receiver(pre_delete, sender=Recipe)
+def remember_shopping_lists(sender, instance, *a, **kw):
+    '''Запоминаем, чьи списки покупок и какие позиции в них зависят от
+       удаляемого рецепта.'''
 
-    user = self.request.user
-    filename = f'{user.username}_shopping_list.txt'
-    shopping_list = ('Мой список покупок: \n')
-    shopping_list += '\n'.join([
-        f'- {ingredient["ingredient__name"]} '
-        f'({ingredient["ingredient__measurement_unit"]})'
-        f' - {ingredient["amount"]}'
-        for ingredient in ingredients
-    ])
-    response = HttpResponse(
-        shopping_list, content_type='shopping_list.txt; charset=utf-8'
+    instance._shopping_lists = (
+        list(instance.carts.values_list('user_id', flat=True)),
+        recipes_ingredients([instance.id]),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def clear_shopping_lists(sender, instance, *a, **kw):
+    '''Удалили рецепт вместе с корзинами - пересчитываем его ингредиенты
+       в списках покупок.'''
+
+    if '_shopping_lists' in instance.__dict__:
+        refresh_shopping_list(*instance.__dict__.pop('_shopping_lists'))
+
+
+# Счётчики: модель-источник -> (модель со счётчиком, поле связи, счётчик).
+COUNTERS = {
+    Favorite: (Recipe, 'recipe', 'favorites_count'),
+    Cart: (Recipe, 'recipe', 'carts_count'),
+    Follow: (User, 'author', 'followers_count'),
+    Recipe: (User, 'author', 'recipes_count'),
+}
+
+
+def change_counters(source, ids, delta):
+    '''Атомарно меняет счётчики записей ids выражением F(): UPDATE
+       блокирует строку, и параллельные изменения не теряются.'''
+
+    model, field, counter = COUNTERS[source]
+    rows = model.objects.filter(pk__in=ids)
+    if delta < 0:
+        rows = rows.filter(**{f'{counter}__gte': -delta})
+    rows.update(**{counter: F(counter) + delta})
+
+
+def change_counter(sender, instance, delta):
+    _, field, _ = COUNTERS[sender]
+    change_counters(sender, [getattr(instance, f'{field}_id')], delta)
+
+
+def increment_counter(sender, instance, created, *a, **kw):
+    if created:
+        change_counter(sender, instance, 1)
+
+
+def decrement_counter(sender, instance, *a, **kw):
+    change_counter(sender, instance, -1)
+
+
+for counted_model in COUNTERS:
+    post_save.connect(increment_counter, sender=counted_model)
+    post_delete.connect(decrement_counter, sender=counted_model)
+
+
+def counter_value(source):
+    '''Фактическое значение счётчика подзапросом по модели-источнику.'''
+
+    model, field, counter = COUNTERS[source]
+    return Coalesce(Subquery(
+        source.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount_counters():
+    '''Пересчитывает счётчики по фактическим данным. Возвращает число
+       исправленных записей для каждой модели.'''
+
+    updates = {}
+    for source, (model, field, counter) in COUNTERS.items():
+        updates.setdefault(model, {})[counter] = counter_value(source)
+    return {model: model.objects.exclude(**fields).update(**fields)
+            for model, fields in updates.items()}
+
+
+def refresh_counters(source, ids):
+    '''Пересчитывает счётчики записей ids одним UPDATE - для пакетных
+       операций, которые не отправляют сигналы. Записи сначала
+       блокируются: иначе две транзакции посчитали бы строки без
+       незакоммиченных изменений друг друга, и последняя записала бы
+       устаревшее значение. После блокировки подсчёт видит всё, что
+       закоммитили транзакции, державшие её раньше.'''
+
+    model, field, counter = COUNTERS[source]
+    if ids:
+        list(model.objects.select_for_update().filter(
+            pk__in=ids).order_by('pk').values_list('pk', flat=True))
+        model.objects.filter(pk__in=ids).update(
+            **{counter: counter_value(source)})
+
+
+def recipes_ingredients(recipe_ids):
+    '''id ингредиентов нескольких рецептов.'''
+
+    return list(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', flat=True).order_by().distinct())
+
+
+def servings_scale(cart, recipe):
+    '''Множитель количества по числу порций записи корзины: порции в
+       корзине к порциям рецепта, без порций в корзине - 1.'''
+
+    return Coalesce(
+        Cast(f'{cart}servings', FloatField()) / F(f'{recipe}servings'),
+        Value(1.0),
+    )
+
+
+def shopping_list_totals(user_ids=None, ingredient_ids=None):
+    '''Пересчёт сводных списков покупок по корзинам пользователей с
+       учётом порций: кортежи (пользователь, ингредиент, количество).
+       Без аргументов - по всем пользователям и ингредиентам.'''
+
+    # Одним filter(): условия на корзины относятся к одному JOIN.
+    conditions = {'recipe__carts__isnull': False}
+    if user_ids is not None:
+        conditions['recipe__carts__user_id__in'] = user_ids
+    if ingredient_ids is not None:
+        conditions['ingredient_id__in'] = ingredient_ids
+    return RecipeIngredient.objects.filter(**conditions).values_list(
+        'recipe__carts__user', 'ingredient'
+    ).annotate(total_amount=Sum(ExpressionWrapper(
+        F('amount') * servings_scale('recipe__carts__', 'recipe__'),
+        output_field=FloatField(),
+    ))).order_by()
+
+
+def lock_users(user_ids):
+    '''Блокирует записи пользователей до конца транзакции (по порядку
+       id, чтобы не было взаимных блокировок): изменения корзин и списков
+       покупок одного пользователя выполняются по очереди.'''
+
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+
+@transaction.atomic(savepoint=False)
+def refresh_shopping_list(user_ids, ingredient_ids):
+    '''Пересчитывает позиции ingredient_ids сводных списков покупок
+       пользователей по их корзинам: один DELETE и один INSERT с
+       количеством, посчитанным в базе. Пересчёт, а не прибавление
+       разницы: дробные количества от порций не накапливают ошибку.'''
+
+    if not user_ids or not ingredient_ids:
+        return
+    lock_users(user_ids)
+    delete_rows(ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=ingredient_ids))
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         total_amount=amount)
+        for user_id, ingredient_id, amount
+        in shopping_list_totals(user_ids, ingredient_ids)
+    ], batch_size=1000)
+
+
+def rebuild_shopping_lists(batch_size=1000):
+    '''Пересобирает сводные списки покупок всех пользователей по их
+       корзинам. Возвращает число позиций.'''
+
+    delete_rows(ShoppingListItem.objects.all())
+    created = 0
+    rows = shopping_list_totals().iterator()
+    while True:
+        batch = [
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             total_amount=amount)
+            for user_id, ingredient_id, amount in islice(rows, batch_size)
+        ]
+        if not batch:
+            return created
+        ShoppingListItem.objects.bulk_create(batch)
+        created += len(batch)
+
+
+class Echo:
+    '''Псевдобуфер для csv.writer: возвращает строку вместо записи.'''
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(rows):
+    yield 'Мой список покупок:\n'
+    for name, unit, amount in rows:
+        yield f'\n{name} - {amount}, {unit}'
+
+
+def shopping_list_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def shopping_list_json(rows):
+    yield '['
+    separator = ''
+    for name, unit, amount in rows:
+        yield separator + json.dumps({
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+def pdf_font():
+    '''Шрифт с кириллицей для PDF (settings.PDF_FONT), регистрируется
+       один раз на процесс.'''
+
+    name = 'ShoppingList'
+    if name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(name, settings.PDF_FONT))
+    return name
+
+
+def shopping_list_pdf(rows):
+    '''Список покупок в PDF (A4, по строке на ингредиент). Таблица
+       ссылок PDF пишется в конце документа, поэтому файл отдаётся
+       одним куском после чтения всех строк.'''
+
+    font = pdf_font()
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    width, height = A4
+    top = bottom = left = 20 * mm
+    line = 7 * mm
+    pdf.setFont(font, 16)
+    pdf.drawString(left, height - top, 'Мой список покупок:')
+    y = height - top - 2 * line
+    pdf.setFont(font, 12)
+    for name, unit, amount in rows:
+        if y < bottom:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = height - top
+        pdf.drawString(left, y, f'{name} - {amount}, {unit}')
+        y -= line
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_EXPORTS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+    'pdf': shopping_list_pdf,
+}
+
+
+def shopping_list_download(request, servings=None):
+    '''Потоковая выгрузка списка покупок в формате, выбранном
+       через ?format= (txt, csv, json или pdf). Количество - в крупных
+       единицах, где это уместно (кг, л); с servings - для этого числа
+       порций каждого рецепта.'''
+
+    renderer = request.accepted_renderer
+    export = SHOPPING_LIST_EXPORTS[renderer.format]
+    response = StreamingHttpResponse(
+        export(shopping_list_rows(request.user, servings)),
+        content_type=f'{renderer.media_type}; charset=utf-8'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_cart.{renderer.format}"'
     )
-    response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
 
 def create_ingredients(ingredients, recipe):
-    '''Функция добавления ингредиентов для создания или
-       редктирования рецепта. '''
-
-    ingredient_list = []
-    for ingredient in ingredients:
-        current_ingredient = get_object_or_404(Ingredient,
-                                               id=ingredient.get('id'))
-        amount = ingredient.get('amount')
-        ingredient_list.append(
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=current_ingredient,
-                amount=amount
-            )
+    '''Функция добавления ингредиентов для создания рецепта.
+       Существование ингредиентов проверяется при валидации.'''
+
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient_id=ingredient.get('id'),
+            amount=ingredient.get('amount')
         )
-    RecipeIngredient.objects.bulk_create(ingredient_list)
+        for ingredient in ingredients
+    ])
 
 
-def create_model_instance(request, instance, serializer_name):
-    '''Функция для добавления рецептов в избранное или в список покупок.'''
+def update_ingredients(ingredients, recipe):
+    '''Функция редактирования ингредиентов рецепта: добавляет, изменяет
+       и удаляет только отличающиеся строки. Возвращает изменение
+       количества в виде {id ингредиента: разница}.'''
 
-    serializer = serializer_name(
-        data={'user': request.user.id, 'recipe': instance.id, },
-        context={'request': request}
+    current = {item.ingredient_id: item
+               for item in recipe.ingredient_list.all()}
+    amounts = {ingredient.get('id'): ingredient.get('amount')
+               for ingredient in ingredients}
+    changes = {}
+    to_create, to_update = [], []
+    for ingredient_id, amount in amounts.items():
+        item = current.pop(ingredient_id, None)
+        if item is None:
+            to_create.append(RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount))
+            changes[ingredient_id] = amount
+        elif item.amount != amount:
+            changes[ingredient_id] = amount - item.amount
+            item.amount = amount
+            to_update.append(item)
+    for ingredient_id, item in current.items():
+        changes[ingredient_id] = -item.amount
+    if current:
+        RecipeIngredient.objects.filter(
+            id__in=[item.id for item in current.values()]).delete()
+    if to_update:
+        RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+    if to_create:
+        RecipeIngredient.objects.bulk_create(to_create)
+    return changes
+
+
+def recipes_limit(request):
+    '''Значение ?recipes_limit= или None, если лимит не задан.'''
+
+    limit = request.query_params.get('recipes_limit')
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
+
+
+def annotate_authors(queryset, request):
+    '''Авторы с флагом подписки и последними recipes_limit рецептами:
+       по одному запросу на страницу авторов и на все их рецепты.'''
+
+    recipes = Recipe.objects.only(
+        'id', 'name', 'image', 'image_hash', 'cooking_time', 'author_id',
+        'pub_date')
+    limit = recipes_limit(request)
+    if limit is not None:
+        recipes = recipes.filter(id__in=Subquery(
+            Recipe.objects.filter(
+                author_id=OuterRef('author_id')
+            ).order_by('-pub_date', '-id').values('id')[:limit]
+        ))
+    return queryset.annotate(
+        is_subscribed=Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef('pk'))),
+    ).prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='recipes_page')
     )
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
+
+
+def create_model_instance(request, instance, serializer_name, **values):
+    '''Функция для добавления рецептов в избранное или в список покупок:
+       одна вставка, повторное добавление отсекает ограничение
+       уникальности, в том числе при одновременных запросах. values -
+       остальные поля записи, например число порций в корзине.'''
+
+    source = serializer_name.Meta.model
+    with transaction.atomic():
+        if not insert_ignore(source, user=request.user, recipe=instance,
+                             **values):
+            return response.Response(
+                {api_settings.NON_FIELD_ERRORS_KEY: [
+                    serializer_name.conflict_message]},
+                status=status.HTTP_400_BAD_REQUEST)
+        update_derived(request.user, source, [instance.id], 1)
+    serializer = serializer_name(
+        source(user=request.user, recipe=instance, **values),
+        context={'request': request})
     return response.Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-def delete_model_instance(request, model_name, instance, error_message):
-    '''Функция удаления рецепта из избранного или из списка покупок.'''
+def bulk_add(user, source, ids):
+    '''Пакетно добавляет в избранное, список покупок (рецепты) или
+       подписки (авторы) одним INSERT. Возвращает статус каждого id:
+       created, exists, not_found или self (подписка на себя).'''
+
+    target, field, _ = COUNTERS[source]
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic():
+        lock_users([user.pk])
+        found = set(target.objects.filter(pk__in=ids).values_list(
+            'pk', flat=True))
+        existing = set(source.objects.filter(
+            user=user, **{f'{field}_id__in': found}
+        ).values_list(f'{field}_id', flat=True))
+        statuses = {}
+        for pk in ids:
+            if pk not in found:
+                statuses[pk] = 'not_found'
+            elif source is Follow and pk == user.pk:
+                statuses[pk] = 'self'
+            elif pk in existing:
+                statuses[pk] = 'exists'
+            else:
+                statuses[pk] = 'created'
+        created = [pk for pk, value in statuses.items() if value == 'created']
+        source.objects.bulk_create([
+            source(user=user, **{f'{field}_id': pk}) for pk in created
+        ], ignore_conflicts=True)
+        update_derived(user, source, created)
+    return [{'id': pk, 'status': value} for pk, value in statuses.items()]
+
+
+def bulk_remove(user, source, ids=None):
+    '''Пакетно удаляет записи пользователя одним DELETE; без ids -
+       все. Возвращает статус каждого id: deleted или not_found.'''
+
+    _, field, _ = COUNTERS[source]
+    with transaction.atomic():
+        lock_users([user.pk])
+        rows = source.objects.filter(user=user)
+        if ids is not None:
+            ids = list(dict.fromkeys(ids))
+            rows = rows.filter(**{f'{field}_id__in': ids})
+        # Блокировка строк: одновременное удаление той же записи по
+        # одной дождётся этой транзакции и ничего не удалит.
+        removed = list(rows.select_for_update().values_list(
+            f'{field}_id', flat=True))
+        # Счётчики и списки покупок обновляются ниже одним запросом.
+        delete_rows(rows)
+        update_derived(user, source, removed)
+    if ids is None:
+        return [{'id': pk, 'status': 'deleted'} for pk in removed]
+    removed = set(removed)
+    return [{'id': pk, 'status': 'deleted' if pk in removed else 'not_found'}
+            for pk in ids]
+
+
+def update_derived(user, source, ids, delta=None):
+    '''То, что при сохранении и удалении моделей делают сигналы, для
+       вставок и удалений без сигналов: счётчики, сводный список покупок,
+       окно ленты подписок. delta - изменение счётчиков, если известно,
+       что строки ids действительно добавлены (1) или удалены (-1);
+       без него счётчики пересчитываются.'''
+
+    if not ids:
+        return
+    if delta is None:
+        refresh_counters(source, ids)
+    else:
+        change_counters(source, ids, delta)
+    if source is Cart:
+        refresh_shopping_list([user.id], recipes_ingredients(ids))
+    if source is Follow:
+        drop_feed_window(user.id)
+
+
+def bulk_model_instances(request, source, serializer_name):
+    '''Пакетное добавление (POST) или удаление (DELETE) по списку ids
+       из тела запроса; DELETE без ids удаляет все записи пользователя.
+       В ответе - статус каждого id.'''
+
+    if request.method == 'DELETE' and 'ids' not in request.data:
+        return response.Response(
+            {'results': bulk_remove(request.user, source)})
+    serializer = serializer_name(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    if request.method == 'POST':
+        results = bulk_add(request.user, source, ids)
+    else:
+        results = bulk_remove(request.user, source, ids)
+    return response.Response({'results': results})
+
+
+def delete_model_instance(request, model_name, recipe_id, error_message):
+    '''Функция удаления рецепта из избранного или из списка покупок:
+       ответ определяет число удалённых строк, без проверки перед
+       удалением.'''
 
-    if not model_name.objects.filter(user=request.user,
-                                     recipe=instance).exists():
+    with transaction.atomic():
+        deleted = delete_rows(model_name.objects.filter(
+            user=request.user, recipe_id=recipe_id))
+        if deleted:
+            update_derived(request.user, model_name, [recipe_id], -1)
+    if not deleted:
+        if not Recipe.objects.filter(id=recipe_id).exists():
+            raise Http404
         return response.Response({'errors': error_message},
                                  status=status.HTTP_400_BAD_REQUEST)
-    model_name.objects.filter(user=request.user, recipe=instance).delete()
     return response.Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,23 +1,48 @@
-from django.db.models import Sum
+from django.db.models import (
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Prefetch,
+    Value,
+)
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter
-from django.shortcuts import get_object_or_404, HttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from rest_framework import decorators
+from rest_framework import decorators, response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 
+from .cache import VersionedCacheMixin
+from .feed import feed_queryset
 from .permissions import AuthorOrReadOnly
 from .filters import RecipeFilter, IngredientFilter
-from .pagination import LimitPageNumberPagination
-from .utils import create_model_instance, delete_model_instance
+from .ingredient_index import ingredient_index
+from .pagination import FeedPagination, RecipePagination
+from .recipe_index import recipe_index
+from .renderers import PlainTextRenderer, CSVRenderer, PDFRenderer
+from .units import servings_ratio
+from .utils import (
+    bulk_model_instances,
+    create_model_instance,
+    delete_model_instance,
+    shopping_list_download,
+)
 
 from api.serializers import (
+    BulkIdsSerializer,
+    ByIngredientsSerializer,
+    RecipeCoverageSerializer,
     FavoriteSerializer,
     RecipeGetSerializer,
     RecipePostSerializer,
+    ServingsSerializer,
     TagSerializer,
     IngredientSerializer,
     CartSerializer,
+    ShoppingListItemSerializer,
 )
 from recipes.models import (
     Recipe,
@@ -25,12 +50,27 @@ from recipes.models import (
     Cart,
     RecipeIngredient,
     Ingredient,
+    ShoppingListItem,
     Tag,
 )
+from users.models import User, Follow
+
+
+def requested_servings(request):
+    '''Число порций из ?servings= (или из тела запроса) или None, если
+       не задано. Неверное значение - ошибка 400.'''
+
+    data = request.query_params
+    if 'servings' not in data and isinstance(request.data, dict):
+        data = request.data
+    params = ServingsSerializer(data={
+        key: data[key] for key in ('servings',) if key in data})
+    params.is_valid(raise_exception=True)
+    return params.validated_data.get('servings')
 
 
 # fmt: off
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(VersionedCacheMixin, ModelViewSet):
     '''Вьюсет списка ингредиентов.'''
 
     queryset = Ingredient.objects.all()
@@ -40,15 +80,30 @@ class IngredientViewSet(ModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ('^name',)
     pagination_class = None
+    cache_models = (Ingredient,)
+
+    def list(self, request, *args, **kwargs):
+        '''Автодополнение по ?name= обслуживается индексом в памяти.
+           Ответ кэшируется и сверяется по ETag так же, как список, по
+           версии справочника ингредиентов.'''
 
+        if request.query_params.get('name'):
+            return self.cached_response(request, self.autocomplete)
+        return super().list(request, *args, **kwargs)
 
-class TagViewSet(ReadOnlyModelViewSet):
+    def autocomplete(self, request):
+        return response.Response(
+            ingredient_index.search(request.query_params['name']))
+
+
+class TagViewSet(VersionedCacheMixin, ReadOnlyModelViewSet):
     '''Вьюсет тэгов.'''
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_models = (Tag,)
 
 
 class RecipeViewSet(ModelViewSet):
@@ -61,10 +116,50 @@ class RecipeViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'delete']
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        '''Для чтения рецептов подтягиваем связанные объекты и флаги
+           избранного/списка покупок/подписки одним набором запросов.
+           С ?servings= количество ингредиентов пересчитывается на это
+           число порций в том же запросе ингредиентов.'''
+
+        if self.action not in ('list', 'retrieve', 'by_ingredients', 'feed'):
+            return Recipe.objects.all()
+        user = self.request.user
+        if user.is_authenticated:
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_in_shopping_cart = Exists(Cart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')))
+        else:
+            is_favorited = is_in_shopping_cart = is_subscribed = Value(False)
+        recipes = Recipe.objects.defer('search_vector')
+        ingredients = RecipeIngredient.objects.select_related('ingredient')
+        servings = requested_servings(self.request)
+        if servings is not None:
+            recipes = recipes.annotate(scaled_servings=Value(servings))
+            ingredients = ingredients.annotate(
+                scaled_amount=ExpressionWrapper(
+                    F('amount') * servings_ratio(servings),
+                    output_field=FloatField(),
+                ))
+        return recipes.prefetch_related(
+            'tags',
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed)
+            ),
+            Prefetch('ingredient_list', queryset=ingredients),
+        ).annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        )
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeGetSerializer
         return RecipePostSerializer
 
@@ -76,14 +171,14 @@ class RecipeViewSet(ModelViewSet):
     def favorite(self, request, pk):
         '''Добавление или удаление рецептов в избранном.'''
 
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=pk)
             return create_model_instance(request, recipe, FavoriteSerializer)
 
         if request.method == 'DELETE':
             error_message = 'Даного рецепта нет в избранном.'
             return delete_model_instance(request, Favorite,
-                                         recipe, error_message)
+                                         pk, error_message)
 
     @decorators.action(
         detail=True,
@@ -91,38 +186,112 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=[IsAuthenticated, ]
     )
     def shopping_cart(self, request, pk):
-        '''Добавление или удаление записей в списке покупок.'''
+        '''Добавление или удаление записей в списке покупок. При
+           добавлении можно указать число порций рецепта (servings).'''
 
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
-            return create_model_instance(request, recipe,
-                                         CartSerializer)
+            recipe = get_object_or_404(Recipe, id=pk)
+            return create_model_instance(
+                request, recipe, CartSerializer,
+                servings=requested_servings(request))
 
         if request.method == 'DELETE':
             error_message = 'Данного рецепта нет в списке покупок.'
             return delete_model_instance(request, Cart,
-                                         recipe, error_message)
+                                         pk, error_message)
+
+    @decorators.action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[IsAuthenticated, ]
+    )
+    def favorite_bulk(self, request):
+        '''Пакетное добавление или удаление рецептов в избранном по
+           списку ids. DELETE без ids очищает избранное.'''
+
+        return bulk_model_instances(request, Favorite, BulkIdsSerializer)
+
+    @decorators.action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=[IsAuthenticated, ]
+    )
+    def shopping_cart_bulk(self, request):
+        '''Пакетное добавление или удаление рецептов в списке покупок по
+           списку ids. DELETE без ids очищает список покупок.'''
+
+        return bulk_model_instances(request, Cart, BulkIdsSerializer)
 
     @decorators.action(
         detail=False,
         methods=['get'],
+        permission_classes=[AllowAny, ]
+    )
+    def by_ingredients(self, request):
+        '''Что приготовить из имеющихся ингредиентов ?ids=: рецепты по
+           убыванию доли их ингредиентов, которые есть у пользователя,
+           не меньше ?min_coverage=. Подбор - по индексу в памяти.'''
+
+        params = ByIngredientsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(recipe_index.search(
+            params.validated_data['ids'],
+            params.validated_data['min_coverage'],
+        ))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page])
+        results = []
+        for recipe_id, coverage in page:
+            recipe = recipes.get(recipe_id)
+            # Рецепт могли удалить после построения индекса.
+            if recipe is not None:
+                recipe.coverage = coverage
+                results.append(recipe)
+        serializer = RecipeCoverageSerializer(
+            results, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @decorators.action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated, ],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        '''Лента подписок: рецепты авторов, на которых подписан
+           пользователь, от новых к старым. Пагинация - только курсор.'''
+
+        page = self.paginate_queryset(
+            feed_queryset(self.get_queryset(), request, self.paginator))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @decorators.action(
+        detail=False,
+        methods=['get'],
+        url_path='shopping_cart/summary',
         permission_classes=[IsAuthenticated, ]
     )
+    def shopping_cart_summary(self, request):
+        '''Сводный список покупок: ингредиенты и их общее количество.'''
+
+        items = ShoppingListItem.objects.filter(
+            user=request.user).select_related('ingredient')
+        return response.Response(
+            ShoppingListItemSerializer(items, many=True).data)
+
+    @decorators.action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated, ],
+        renderer_classes=[
+            PlainTextRenderer, CSVRenderer, JSONRenderer, PDFRenderer],
+    )
     def download_shopping_cart(self, request):
         '''Функция выгрузки списка покупок.'''
 
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__carts__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(ingredient_amount=Sum('amount'))
-        shopping_list = ['Мой список покупок:\n']
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['ingredient_amount']
-            shopping_list.append(f'\n{name} - {amount}, {unit}')
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = \
-            'attachment; filename="shopping_cart.txt"'
-        return response
+        return shopping_list_download(request, requested_servings(request))
@@ -1,3 +1,18 @@
 #!/bin/bash
 set -e
-exec bash -c "gunicorn --bind 0.0.0.0:8000 foodgram.wsgi"
\ No newline at end of file
+# Команда из docker-compose (например, построение вариантов картинок)
+# выполняется вместо веб-сервера.
+if [ "$#" -gt 0 ]; then
+    exec "$@"
+fi
+# SERVER_MODE=asgi - воркеры uvicorn и асинхронное чтение API,
+# иначе синхронный gunicorn. Число воркеров - WEB_WORKERS.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec gunicorn --bind 0.0.0.0:8000 \
+        --workers "${WEB_WORKERS:-$(nproc)}" \
+        --worker-class uvicorn.workers.UvicornWorker \
+        foodgram.asgi:application
+fi
+exec gunicorn --bind 0.0.0.0:8000 \
+    --workers "${WEB_WORKERS:-$(( $(nproc) * 2 + 1 ))}" \
+    foodgram.wsgi
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 import os
 import sys
+import tempfile
 
 from pathlib import Path
 from dotenv import load_dotenv
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,7 +86,10 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-if 'runserver' in sys.argv:
+# DB_ENGINE=django.db.backends.sqlite3 - локальная база SQLite (тесты).
+DB_ENGINE = os.getenv('DB_ENGINE', default='django.db.backends.postgresql')
+
+if 'runserver' in sys.argv or DB_ENGINE == 'django.db.backends.sqlite3':
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -94,7 +99,7 @@ if 'runserver' in sys.argv:
 else:
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': DB_ENGINE,
             'NAME': os.getenv('POSTGRES_DB', default='django'),
             'USER': os.getenv('POSTGRES_USER', default='django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', default=''),
@@ -110,6 +115,110 @@ else:
 #     }
 # }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    # Версии справочников для ETag и сброса кэшей: хранятся без срока и
+    # общие для всех воркеров (по умолчанию - файлы на диске сервера).
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSION_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram-versions')
+        ),
+        'TIMEOUT': None,
+    },
+}
+
+# Время жизни закэшированных ответов справочников, секунды.
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default=300))
+
+# Наибольшее число id в пакетных операциях с избранным, списком покупок
+# и подписками.
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', default=100))
+
+# Лента подписок: пользователям с числом подписок от FEED_CACHE_MIN_FOLLOWS
+# начало ленты (FEED_WINDOW рецептов) кэшируется на FEED_CACHE_TIMEOUT
+# секунд.
+FEED_CACHE_MIN_FOLLOWS = int(os.getenv('FEED_CACHE_MIN_FOLLOWS',
+                                       default=1000))
+FEED_WINDOW = int(os.getenv('FEED_WINDOW', default=300))
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', default=60))
+
+# Индекс подбора рецептов по ингредиентам сверяется с журналом изменений
+# при новой версии и не реже, чем раз в RECIPE_INDEX_POLL_SECONDS секунд.
+# Журнал хранится RECIPE_INDEX_LOG_HOURS часов.
+RECIPE_INDEX_POLL_SECONDS = int(os.getenv('RECIPE_INDEX_POLL_SECONDS',
+                                          default=5))
+RECIPE_INDEX_LOG_HOURS = int(os.getenv('RECIPE_INDEX_LOG_HOURS', default=24))
+
+# Режим сервера: wsgi (gunicorn) или asgi (gunicorn с воркерами uvicorn).
+# В режиме asgi чтение рецептов, тегов и ингредиентов - асинхронное.
+# asgi - экспериментальный режим, по умолчанию выключен: в Django 3.2 нет
+# асинхронного ORM, каждый запрос к базе уходит в поток через
+# sync_to_async, и под нагрузкой asgi медленнее wsgi (37 против 44
+# запросов в секунду, p99 1236 против 520 мс).
+SERVER_MODE = os.getenv('SERVER_MODE', default='wsgi')
+ASYNC_VIEWS = SERVER_MODE == 'asgi'
+
+# Шрифт TrueType с кириллицей для выгрузки списка покупок в PDF.
+PDF_FONT = os.getenv('PDF_FONT',
+                     default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+# Потоков для построения вариантов картинок рецептов в команде
+# build_image_variants.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+# Ограничения загружаемых картинок и число потоков для их декодирования.
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', default=10 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', default=25_000_000))
+IMAGE_DECODE_WORKERS = int(os.getenv('IMAGE_DECODE_WORKERS', default=2))
+
+# Метрики запросов (Server-Timing и лог api.metrics): доля запросов в
+# выборке, 0 - выключено. Повторы одного SQL-запроса от
+# REQUEST_METRICS_N_PLUS_ONE раз логируются как N+1. Время сериализации
+# замеряется при REQUEST_METRICS_SERIALIZERS=True.
+REQUEST_METRICS_SAMPLE_RATE = float(
+    os.getenv('REQUEST_METRICS_SAMPLE_RATE', default=0))
+REQUEST_METRICS_N_PLUS_ONE = int(
+    os.getenv('REQUEST_METRICS_N_PLUS_ONE', default=5))
+REQUEST_METRICS_SERIALIZERS = (
+    os.getenv('REQUEST_METRICS_SERIALIZERS', 'False') == 'True')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.getenv('LOG_LEVEL', default='WARNING'),
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 # Password validation
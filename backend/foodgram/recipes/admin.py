@@ -1,7 +1,12 @@
 from django.contrib import admin
+from django.db import transaction
 
+from api.images import schedule_variants
+from api.recipe_index import log_recipe_changes
+from api.utils import recipes_ingredients, refresh_shopping_list
 from recipes.models import (Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Cart, Tag)
+                            RecipeIngredient, Cart, ShoppingListItem,
+                            StoredFile, Tag, UnitConversion)
 
 
 @admin.register(Tag)
@@ -14,24 +19,56 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'measurement_unit')
+    list_display = ('pk', 'name', 'measurement_unit', 'base_unit',
+                    'base_factor')
     search_fields = ('name',)
     list_filter = ('name',)
     empty_value_display = 'нет значения'
 
 
+@admin.register(UnitConversion)
+class UnitConversionAdmin(admin.ModelAdmin):
+    list_display = ('ingredient_name', 'unit', 'base_unit', 'factor')
+    search_fields = ('ingredient_name', 'unit')
+    list_filter = ('unit', 'base_unit')
+    empty_value_display = 'все ингредиенты'
+
+
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'author', 'text', 'get_ingredients',)
+    list_display = ('pk', 'name', 'author', 'text', 'get_ingredients',
+                    'favorites_count', 'carts_count',)
+    readonly_fields = ('favorites_count', 'carts_count',)
     search_fields = ('name', 'author',)
     list_filter = ('name', 'author', 'tags',)
     empty_value_display = 'нет данных'
     inlines = (RecipeIngredientInline,)
 
+    def save_model(self, request, obj, form, change):
+        obj._old_ingredients = (
+            recipes_ingredients([obj.pk]) if change else [])
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        '''Ингредиенты из админки - перестроить индекс по ингредиентам и
+           списки покупок с этим рецептом, новая картинка - поставить в
+           очередь на построение вариантов.'''
+
+        super().save_related(request, form, formsets, change)
+        log_recipe_changes([form.instance.pk])
+        if 'servings' in form.changed_data or any(
+                formset.has_changed() for formset in formsets):
+            refresh_shopping_list(
+                list(form.instance.carts.values_list('user_id', flat=True)),
+                set(form.instance._old_ingredients).union(
+                    recipes_ingredients([form.instance.pk])))
+        if 'image' in form.changed_data:
+            schedule_variants(form.instance)
+
     @admin.display(description='Ингредиенты')
     def get_ingredients(self, obj):
         '''Вывожу ингредиенты.'''
@@ -53,5 +90,48 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 @admin.register(Cart)
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe',)
+    '''Изменения корзин из админки пересчитывают списки покупок
+       их владельцев.'''
+
+    list_display = ('user', 'recipe', 'servings',)
+    empty_value_display = 'нет данных'
+
+    def refresh(self, carts):
+        '''Пересчитать списки покупок по парам (пользователь, рецепт).'''
+
+        carts = list(carts)
+        refresh_shopping_list(
+            {user_id for user_id, _ in carts},
+            recipes_ingredients({recipe_id for _, recipe_id in carts}))
+
+    def save_model(self, request, obj, form, change):
+        carts = [(obj.user_id, obj.recipe_id)]
+        if change:
+            carts += Cart.objects.filter(pk=obj.pk).values_list(
+                'user_id', 'recipe_id')
+        super().save_model(request, obj, form, change)
+        self.refresh(carts)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.refresh([(obj.user_id, obj.recipe_id)])
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            carts = list(queryset.values_list('user_id', 'recipe_id'))
+            super().delete_queryset(request, queryset)
+            self.refresh(carts)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount',)
+    list_filter = ('user',)
     empty_value_display = 'нет данных'
+
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'references', 'updated',)
+    readonly_fields = ('name', 'references', 'updated',)
+    search_fields = ('name',)
@@ -0,0 +1,79 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:28
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# Метрические единицы переводятся для всех ингредиентов, ложки и стаканы -
+# только для ингредиентов, которые встречаются и в граммах: вес ложки
+# зависит от продукта.
+CONVERSIONS = (
+    ('', 'кг', 'г', 1000),
+    ('', 'л', 'мл', 1000),
+    ('пекарский порошок', 'ч. л.', 'г', 5),
+)
+
+
+def conversion(UnitConversion, field, default):
+    rules = UnitConversion.objects.filter(unit=models.OuterRef('measurement_unit'))
+    return Coalesce(
+        models.Subquery(rules.filter(
+            ingredient_name=models.OuterRef('name')).values(field)[:1]),
+        models.Subquery(rules.filter(ingredient_name='').values(field)[:1]),
+        default,
+    )
+
+
+def fill_conversions(apps, schema_editor):
+    UnitConversion = apps.get_model('recipes', 'UnitConversion')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    UnitConversion.objects.bulk_create([
+        UnitConversion(ingredient_name=name, unit=unit, base_unit=base_unit,
+                       factor=factor)
+        for name, unit, base_unit, factor in CONVERSIONS
+    ])
+    Ingredient.objects.update(
+        base_unit=conversion(UnitConversion, 'base_unit',
+                             models.F('measurement_unit')),
+        base_factor=conversion(UnitConversion, 'factor', models.Value(1.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitConversion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_name', models.CharField(blank=True, max_length=200, verbose_name='Ингредиент')),
+                ('unit', models.CharField(max_length=200, verbose_name='Единица измерения')),
+                ('base_unit', models.CharField(max_length=200, verbose_name='Базовая единица')),
+                ('factor', models.FloatField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='Базовых единиц в единице измерения')),
+            ],
+            options={
+                'verbose_name': 'Перевод единиц',
+                'verbose_name_plural': 'Переводы единиц',
+                'ordering': ('ingredient_name', 'unit'),
+            },
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='base_factor',
+            field=models.FloatField(default=1, editable=False, verbose_name='Базовых единиц в единице измерения'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='base_unit',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Базовая единица'),
+        ),
+        migrations.AddConstraint(
+            model_name='unitconversion',
+            constraint=models.UniqueConstraint(fields=('ingredient_name', 'unit'), name='unique_unit_conversion'),
+        ),
+        migrations.RunPython(fill_conversions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.3 on 2026-10-18 06:33
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_unit_conversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='servings',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Пусто - как в рецепте.', null=True, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Число порций'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, 'Число порций д.б. не меньше 1.')], verbose_name='Число порций'),
+        ),
+        migrations.AlterField(
+            model_name='shoppinglistitem',
+            name='total_amount',
+            field=models.FloatField(verbose_name='Количество'),
+        ),
+    ]
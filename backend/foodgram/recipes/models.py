@@ -1,6 +1,9 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
+from api.search import FTS_TABLE
+from api.storage import ContentAddressedStorage
 from users.models import User
 
 
@@ -41,6 +44,17 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         max_length=200,
     )
+    base_unit = models.CharField(
+        verbose_name='Базовая единица',
+        max_length=200,
+        blank=True,
+        editable=False,
+    )
+    base_factor = models.FloatField(
+        verbose_name='Базовых единиц в единице измерения',
+        default=1,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -53,6 +67,40 @@ class Ingredient(models.Model):
         return self.name
 
 
+class UnitConversion(models.Model):
+    '''Перевод единицы измерения в базовую: 1 unit = factor base_unit.
+       Правило с названием ингредиента действует только для него, без
+       названия - для всех ингредиентов с этой единицей.'''
+
+    ingredient_name = models.CharField(
+        verbose_name='Ингредиент',
+        max_length=200,
+        blank=True,
+    )
+    unit = models.CharField(
+        verbose_name='Единица измерения',
+        max_length=200,
+    )
+    base_unit = models.CharField(
+        verbose_name='Базовая единица',
+        max_length=200,
+    )
+    factor = models.FloatField(
+        verbose_name='Базовых единиц в единице измерения',
+        validators=[MinValueValidator(0)],
+    )
+
+    class Meta:
+        verbose_name = 'Перевод единиц'
+        verbose_name_plural = 'Переводы единиц'
+        ordering = ('ingredient_name', 'unit')
+        constraints = [models.UniqueConstraint(
+            fields=['ingredient_name', 'unit'], name='unique_unit_conversion')]
+
+    def __str__(self) -> str:
+        return f'{self.unit} = {self.factor:g} {self.base_unit}'
+
+
 class Recipe(models.Model):
     '''Модель списка рецептов.'''
     name = models.CharField(
@@ -72,7 +120,8 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         blank=True,
-        upload_to='recipes/'
+        upload_to='recipes/',
+        storage=ContentAddressedStorage(),
     )
     text = models.TextField(
         verbose_name='Описание',
@@ -88,15 +137,54 @@ class Recipe(models.Model):
         verbose_name='Список ингредиентов',
         through='RecipeIngredient',
     )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Число порций',
+        default=1,
+        validators=[MinValueValidator(1, 'Число порций д.б. не меньше 1.')]
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации рецепта.',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном',
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В списках покупок',
+    )
+    score = models.FloatField(
+        default=0,
+        verbose_name='Рейтинг популярности',
+    )
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Хэш картинки',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', 'pub_date', 'id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['favorites_count', 'id'],
+                         name='recipe_favorites_id_idx'),
+            models.Index(fields=['score', 'id'],
+                         name='recipe_score_id_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'name'],
@@ -154,6 +242,10 @@ class Favorite(models.Model):
         related_name='favorites',
         on_delete=models.CASCADE,
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
+    )
 
     class Meta:
         ordering = ['-id']
@@ -185,6 +277,17 @@ class Cart(models.Model):
         related_name='carts',
         on_delete=models.CASCADE,
     )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Число порций',
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1)],
+        help_text='Пусто - как в рецепте.',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
+    )
 
     class Meta:
         constraints = [
@@ -199,3 +302,128 @@ class Cart(models.Model):
     def __str__(self):
         return (f'{self.user.username} добавил'
                 f'{self.recipe.name} в список покупок')
+
+
+class ShoppingListItem(models.Model):
+    '''Сводный список покупок: суммарное количество ингредиента по всем
+       рецептам в корзине пользователя с учётом числа порций. Обновляется
+       при изменении корзины и рецептов в ней.'''
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+    )
+    total_amount = models.FloatField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        ordering = ('ingredient__name',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+
+    def __str__(self):
+        return f'{self.user.username}: {self.ingredient.name}'
+
+
+class StoredFile(models.Model):
+    '''Файл в хранилище с именем по содержимому и числом ссылок на него.
+       Файлы без ссылок удаляет команда collect_media.'''
+
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=255,
+        unique=True,
+    )
+    references = models.PositiveIntegerField(
+        verbose_name='Число ссылок',
+        default=0,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Изменён',
+        auto_now=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['references', 'id'],
+                         name='storedfile_references_id_idx'),
+        ]
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIndexChange(models.Model):
+    '''Журнал изменений ингредиентов рецептов для индексов в памяти
+       процессов: запись добавляется в транзакции изменения, процессы
+       применяют к своим индексам записи, которых ещё не видели. Запись
+       без рецепта - индекс нужно перестроить целиком.'''
+
+    recipe_id = models.BigIntegerField(
+        verbose_name='Рецепт',
+        null=True,
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Изменение индекса рецептов'
+        verbose_name_plural = 'Изменения индекса рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id or "все рецепты"} ({self.created})'
+
+
+class SearchDocumentField(models.TextField):
+    '''Скрытый столбец таблицы FTS5 с её именем: по нему ищут MATCH.'''
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class RecipeSearch(models.Model):
+    '''Полнотекстовый индекс рецептов в SQLite: таблица FTS5, которую
+       api.search создаёт после миграций. rank - релевантность bm25,
+       чем меньше, тем выше.'''
+
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+        on_delete=models.DO_NOTHING,
+    )
+    document = SearchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
@@ -0,0 +1,90 @@
+import pytest
+from django.core.cache import caches
+from django.test import Client
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def local_caches(settings):
+    '''Кэши в памяти процесса: тесты не видят версий других запусков.'''
+
+    settings.CACHES = {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'tests-{alias}', 'TIMEOUT': None}
+        for alias in ('default', 'versions')
+    }
+    yield
+    for cache in caches.all():
+        cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(
+        email='user@foodgram.ru', username='user', password='password',
+        first_name='Иван', last_name='Иванов')
+
+
+@pytest.fixture
+def author(db):
+    return User.objects.create_user(
+        email='author@foodgram.ru', username='author', password='password',
+        first_name='Пётр', last_name='Петров')
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def admin_client(db):
+    admin = User.objects.create_superuser(
+        email='admin@foodgram.ru', username='admin', password='password',
+        first_name='Админ', last_name='Админов')
+    client = Client()
+    client.force_login(admin)
+    return client
+
+
+@pytest.fixture
+def tags(db):
+    return [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}') for i in range(3)]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(10)]
+
+
+@pytest.fixture
+def make_recipes(author, tags, ingredients):
+    '''Создаёт count рецептов автора с тегами и тремя ингредиентами.'''
+
+    def make(count, author=author, tags=tags):
+        recipes = []
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10)
+            recipe.tags.set(tags[:1 + i % len(tags)])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, amount=10 + j,
+                                 ingredient=ingredients[(i + j) % 10])
+                for j in range(3))
+            recipes.append(recipe)
+        return recipes
+    return make
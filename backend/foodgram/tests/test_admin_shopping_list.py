@@ -0,0 +1,83 @@
+import pytest
+
+from recipes.models import Cart, ShoppingListItem
+
+
+def shopping_list(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount'))
+
+
+def recipe_form(recipe, amounts):
+    '''Данные формы рецепта в админке: ингредиенты рецепта заменяются
+       на amounts ({ингредиент: количество}).'''
+
+    amounts = dict(amounts)
+    data = {
+        'name': recipe.name, 'author': recipe.author_id, 'text': recipe.text,
+        'cooking_time': recipe.cooking_time, 'servings': recipe.servings,
+        'score': recipe.score,
+        'tags': [tag.id for tag in recipe.tags.all()],
+        'ingredient_list-MIN_NUM_FORMS': 0,
+        'ingredient_list-MAX_NUM_FORMS': 1000,
+    }
+    forms = []
+    for item in recipe.ingredient_list.all():
+        form = {'id': item.id, 'ingredient': item.ingredient_id,
+                'amount': item.amount}
+        if item.ingredient in amounts:
+            form['amount'] = amounts.pop(item.ingredient)
+        else:
+            form['DELETE'] = 'on'
+        forms.append(form)
+    data['ingredient_list-INITIAL_FORMS'] = len(forms)
+    forms += [{'ingredient': ingredient.id, 'amount': amount}
+              for ingredient, amount in amounts.items()]
+    data['ingredient_list-TOTAL_FORMS'] = len(forms)
+    for i, form in enumerate(forms):
+        data.update({f'ingredient_list-{i}-{name}': value
+                     for name, value in form.items()})
+        data[f'ingredient_list-{i}-recipe'] = recipe.id
+    return data
+
+
+@pytest.mark.django_db
+def test_cart_admin_add_and_delete(admin_client, user, make_recipes):
+    recipe, = make_recipes(1)
+    response = admin_client.post('/admin/recipes/cart/add/', {
+        'user': user.id, 'recipe': recipe.id})
+    assert response.status_code == 302
+    cart = Cart.objects.get(user=user)
+    assert shopping_list(user) == {
+        item.ingredient_id: item.amount
+        for item in recipe.ingredient_list.all()}
+    admin_client.post(f'/admin/recipes/cart/{cart.id}/delete/',
+                      {'post': 'yes'})
+    assert shopping_list(user) == {}
+
+
+@pytest.mark.django_db
+def test_cart_admin_bulk_delete(admin_client, user, make_recipes):
+    recipes = make_recipes(2)
+    for recipe in recipes:
+        admin_client.post('/admin/recipes/cart/add/', {
+            'user': user.id, 'recipe': recipe.id})
+    assert shopping_list(user)
+    admin_client.post('/admin/recipes/cart/', {
+        'action': 'delete_selected', 'post': 'yes',
+        '_selected_action': list(Cart.objects.values_list('id', flat=True)),
+    })
+    assert shopping_list(user) == {}
+
+
+@pytest.mark.django_db
+def test_recipe_admin_inline_refreshes_carts(admin_client, user,
+                                             make_recipes, ingredients):
+    recipe, = make_recipes(1)
+    admin_client.post('/admin/recipes/cart/add/', {
+        'user': user.id, 'recipe': recipe.id})
+    response = admin_client.post(
+        f'/admin/recipes/recipe/{recipe.id}/change/',
+        recipe_form(recipe, {ingredients[0]: 5, ingredients[9]: 7}))
+    assert response.status_code == 302
+    assert shopping_list(user) == {ingredients[0].id: 5, ingredients[9].id: 7}
@@ -0,0 +1,135 @@
+import pytest
+
+from recipes.models import Cart, Favorite, Recipe, ShoppingListItem
+from users.models import Follow, User
+
+MISSING = 10 ** 6
+
+
+@pytest.fixture
+def recipes(make_recipes):
+    return make_recipes(3)
+
+
+def statuses(response, status_code=200):
+    assert response.status_code == status_code, response.data
+    return {item['id']: item['status'] for item in response.data['results']}
+
+
+def counters(field):
+    return dict(Recipe.objects.values_list('id', field))
+
+
+def shopping_list(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'total_amount'))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('suffix, model, field', [
+    ('favorite', Favorite, 'favorites_count'),
+    ('shopping_cart', Cart, 'carts_count'),
+])
+def test_bulk_add_and_remove_recipes(user_client, user, recipes, suffix,
+                                     model, field):
+    url = f'/api/recipes/{suffix}/'
+    first, second, third = (recipe.id for recipe in recipes)
+    user_client.post(f'/api/recipes/{first}/{suffix}/')
+
+    response = user_client.post(
+        url, {'ids': [first, second, MISSING, second]}, format='json')
+    assert statuses(response) == {
+        first: 'exists', second: 'created', MISSING: 'not_found'}
+    assert set(model.objects.filter(user=user).values_list(
+        'recipe_id', flat=True)) == {first, second}
+    assert counters(field) == {first: 1, second: 1, third: 0}
+
+    response = user_client.delete(url, {'ids': [second, third]},
+                                  format='json')
+    assert statuses(response) == {second: 'deleted', third: 'not_found'}
+    assert counters(field) == {first: 1, second: 0, third: 0}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('data', [{}, {'ids': []}, {'ids': ['abc']},
+                                  {'ids': [0]}, {'ids': list(range(1, 102))}])
+def test_bulk_rejects_invalid_ids(user_client, recipes, data):
+    response = user_client.post('/api/recipes/favorite/', data,
+                                format='json')
+    assert response.status_code == 400
+    assert 'ids' in response.data
+    assert not Favorite.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bulk_requires_authentication(client, recipes):
+    response = client.post('/api/recipes/shopping_cart/',
+                           {'ids': [recipes[0].id]}, format='json')
+    assert response.status_code == 401
+    assert not Cart.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bulk_cart_resyncs_shopping_list(user_client, user, recipes):
+    url = '/api/recipes/shopping_cart/'
+    ids = [recipe.id for recipe in recipes[:2]]
+    statuses(user_client.post(url, {'ids': ids}, format='json'))
+    # Рецепты 0 и 1 пересекаются по ингредиентам 1 и 2.
+    assert shopping_list(user) == {
+        'Ингредиент 0': 10, 'Ингредиент 1': 21,
+        'Ингредиент 2': 23, 'Ингредиент 3': 12}
+
+    response = user_client.delete(url, {'ids': ids[:1]}, format='json')
+    assert statuses(response) == {ids[0]: 'deleted'}
+    assert shopping_list(user) == {
+        'Ингредиент 1': 10, 'Ингредиент 2': 11, 'Ингредиент 3': 12}
+
+
+@pytest.mark.django_db
+def test_delete_without_ids_clears_cart(user_client, user, recipes):
+    url = '/api/recipes/shopping_cart/'
+    ids = [recipe.id for recipe in recipes]
+    statuses(user_client.post(url, {'ids': ids}, format='json'))
+    other = User.objects.create_user(
+        email='other@foodgram.ru', username='other', password='password',
+        first_name='Олег', last_name='Олегов')
+    Cart.objects.create(user=other, recipe=recipes[0])
+
+    response = user_client.delete(url)
+    assert statuses(response) == {pk: 'deleted' for pk in ids}
+    assert not Cart.objects.filter(user=user).exists()
+    assert not ShoppingListItem.objects.filter(user=user).exists()
+    assert counters('carts_count') == {ids[0]: 1, ids[1]: 0, ids[2]: 0}
+    assert statuses(user_client.delete(url)) == {}
+
+
+@pytest.mark.django_db
+def test_bulk_subscriptions(user_client, user, author):
+    url = '/api/users/subscriptions/'
+    others = [
+        User.objects.create_user(
+            email=f'chef{number}@foodgram.ru', username=f'chef{number}',
+            password='password', first_name='Имя', last_name='Фамилия')
+        for number in range(2)
+    ]
+    user_client.post(f'/api/users/{author.id}/subscribe/')
+
+    response = user_client.post(url, {'ids': [
+        author.id, others[0].id, user.id, MISSING]}, format='json')
+    assert statuses(response) == {
+        author.id: 'exists', others[0].id: 'created', user.id: 'self',
+        MISSING: 'not_found'}
+    assert set(Follow.objects.filter(user=user).values_list(
+        'author_id', flat=True)) == {author.id, others[0].id}
+    assert User.objects.get(pk=others[0].pk).followers_count == 1
+    assert User.objects.get(pk=user.pk).followers_count == 0
+
+    response = user_client.delete(url, {'ids': [others[0].id, others[1].id]},
+                                  format='json')
+    assert statuses(response) == {
+        others[0].id: 'deleted', others[1].id: 'not_found'}
+    assert User.objects.get(pk=others[0].pk).followers_count == 0
+
+    assert statuses(user_client.delete(url)) == {author.id: 'deleted'}
+    assert not Follow.objects.filter(user=user).exists()
+    assert User.objects.get(pk=author.pk).followers_count == 0
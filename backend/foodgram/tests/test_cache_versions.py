@@ -0,0 +1,63 @@
+import time
+
+import pytest
+from django.core.cache import cache, caches
+
+from api.cache import bump_version
+from recipes.models import Ingredient, Tag
+
+URL = '/api/tags/'
+
+
+@pytest.mark.django_db
+def test_etag_survives_response_cache_expiry(client, tags, monkeypatch):
+    etag = client.get(URL)['ETag']
+    modified = client.get(URL)['Last-Modified']
+    # Ответы истекли, другой воркер с пустым кэшем ответов.
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 10 ** 6)
+    cache.clear()
+    response = client.get(URL)
+    assert (response['ETag'], response['Last-Modified']) == (etag, modified)
+    assert client.get(URL, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_versions_are_stored_without_expiry(client, tags):
+    client.get(URL)
+    versions = caches['versions']
+    key = 'api:version:recipes.tag'
+    assert versions.get(key) is not None
+    assert versions._expire_info[versions.make_key(key)] is None
+
+
+@pytest.mark.django_db
+def test_bump_changes_etag(client, tags):
+    etag = client.get(URL)['ETag']
+    bump_version(Tag)
+    response = client.get(URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_ingredient_autocomplete_cached_by_version(
+        client, ingredients, django_assert_num_queries,
+        django_capture_on_commit_callbacks):
+    url = '/api/ingredients/'
+    response = client.get(url, {'name': 'ингредиент 1'})
+    assert [item['name'] for item in response.data] == ['Ингредиент 1']
+    etag = response['ETag']
+    assert client.get(url, {'name': 'ингредиент 1'},
+                      HTTP_IF_NONE_MATCH=etag).status_code == 304
+    with django_assert_num_queries(0):
+        assert client.get(url, {'name': 'ингредиент 1'}).data == response.data
+    assert client.get(url, {'name': 'ингредиент 2'})['ETag'] != etag
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Ingredient.objects.create(name='Ингредиент 10', measurement_unit='г')
+    response = client.get(url, {'name': 'ингредиент 1'},
+                          HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert [item['name'] for item in response.data] == [
+        'Ингредиент 1', 'Ингредиент 10']
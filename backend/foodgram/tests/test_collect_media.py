@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from api.utils import change_references
+from recipes.models import Recipe, StoredFile
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def storage(media):
+    return Recipe._meta.get_field('image').storage
+
+
+@pytest.fixture
+def make_recipe(author, media):
+    def make(content=b'image', name='Рецепт'):
+        return Recipe.objects.create(
+            author=author, name=name, text='Текст', cooking_time=10,
+            image=ContentFile(content, name='photo.png'))
+    return make
+
+
+def references(name):
+    return StoredFile.objects.filter(name=name).values_list(
+        'references', flat=True).first()
+
+
+def age(storage, name, hours=48):
+    '''Делает файл и его запись старше срока collect_media.'''
+
+    past = time.time() - hours * 3600
+    os.utime(storage.path(name), (past, past))
+    StoredFile.objects.filter(name=name).update(
+        updated=timezone.now() - timedelta(hours=hours))
+
+
+def collect():
+    call_command('collect_media', stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_references_follow_recipes(make_recipe):
+    first = make_recipe()
+    name = first.image.name
+    second = make_recipe(name='Другой')
+    assert second.image.name == name
+    assert references(name) == 2
+    second.delete()
+    assert references(name) == 1
+    first.image = ContentFile(b'other', name='photo.png')
+    first.save()
+    assert references(name) == 0
+    assert references(first.image.name) == 1
+
+
+@pytest.mark.django_db
+def test_reference_to_collected_row_recreates_it(make_recipe):
+    name = make_recipe().image.name
+    StoredFile.objects.filter(name=name).delete()
+    change_references(name, 1)
+    assert references(name) == 1
+
+
+@pytest.mark.django_db
+def test_collect_deletes_only_stale_orphans(make_recipe, storage):
+    orphan = make_recipe(b'orphan')
+    orphan_name = orphan.image.name
+    orphan.delete()
+    fresh = make_recipe(b'fresh')
+    fresh_name = fresh.image.name
+    fresh.delete()
+    used = make_recipe(b'used').image.name
+    # Ссылка, которую счётчик не учёл.
+    StoredFile.objects.filter(name=used).update(references=0)
+    for name in (orphan_name, used):
+        age(storage, name)
+
+    collect()
+
+    assert not storage.exists(orphan_name)
+    assert references(orphan_name) is None
+    assert storage.exists(fresh_name) and references(fresh_name) == 0
+    assert storage.exists(used) and references(used) == 1
+
+
+@pytest.mark.django_db
+def test_reupload_of_collected_file_rewrites_it(make_recipe, storage,
+                                                monkeypatch):
+    '''Сборщик удалил файл, пока повторная загрузка ждала блокировку его
+       записи: файл записывается заново.'''
+
+    recipe = make_recipe(b'again')
+    name = recipe.image.name
+    recipe.delete()
+    claim = storage.claim
+
+    def collected_while_waiting(claimed):
+        os.unlink(storage.path(claimed))
+        claim(claimed)
+    monkeypatch.setattr(storage, 'claim', collected_while_waiting)
+
+    assert make_recipe(b'again').image.name == name
+    with storage.open(name) as image:
+        assert image.read() == b'again'
+    assert references(name) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor == 'sqlite',
+                    reason='параллельная запись - только в Postgres')
+def test_reference_waits_for_collector(make_recipe):
+    '''Новая ссылка ждёт транзакцию сборщика, удалившего строку, и
+       создаёт строку заново.'''
+
+    recipe = make_recipe()
+    name = recipe.image.name
+    Recipe.objects.filter(pk=recipe.pk).delete()
+    locked, done = threading.Event(), threading.Event()
+
+    def collector():
+        try:
+            with transaction.atomic():
+                list(StoredFile.objects.select_for_update().filter(
+                    name=name))
+                StoredFile.objects.filter(name=name).delete()
+                locked.set()
+                done.wait(1)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=collector)
+    thread.start()
+    locked.wait(5)
+    change_references(name, 1)
+    done.set()
+    thread.join()
+    assert references(name) == 1
@@ -0,0 +1,115 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from api.rows import delete_rows
+from api.utils import change_counters, refresh_counters
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Follow, User
+
+
+@pytest.fixture
+def recipes(make_recipes):
+    return make_recipes(3)
+
+
+@pytest.fixture
+def fans(db):
+    return [
+        User.objects.create_user(
+            email=f'fan{number}@foodgram.ru', username=f'fan{number}',
+            password='password', first_name='Имя', last_name='Фамилия')
+        for number in range(3)
+    ]
+
+
+def recipe_counters(recipe):
+    recipe = Recipe.objects.get(pk=recipe.pk)
+    return recipe.favorites_count, recipe.carts_count
+
+
+def user_counters(user):
+    user = User.objects.get(pk=user.pk)
+    return user.recipes_count, user.followers_count
+
+
+@pytest.mark.django_db
+def test_counters_follow_create_and_delete(recipes, fans):
+    recipe = recipes[0]
+    for fan in fans:
+        Favorite.objects.create(user=fan, recipe=recipe)
+    Cart.objects.create(user=fans[0], recipe=recipe)
+    assert recipe_counters(recipe) == (3, 1)
+
+    Favorite.objects.filter(user=fans[0]).delete()
+    Cart.objects.get(user=fans[0]).delete()
+    assert recipe_counters(recipe) == (2, 0)
+    # Удаление пользователя каскадом удаляет его избранное.
+    fans[1].delete()
+    assert recipe_counters(recipe) == (1, 0)
+
+
+@pytest.mark.django_db
+def test_author_counters(author, recipes, fans):
+    assert user_counters(author) == (3, 0)
+    for fan in fans:
+        Follow.objects.create(user=fan, author=author)
+    assert user_counters(author) == (3, 3)
+
+    recipes[0].delete()
+    fans[0].delete()
+    Follow.objects.filter(user=fans[1]).delete()
+    assert user_counters(author) == (2, 1)
+
+
+@pytest.mark.django_db
+def test_change_counters_never_below_zero(recipes):
+    change_counters(Favorite, [recipe.id for recipe in recipes[:2]], 2)
+    change_counters(Favorite, [recipe.id for recipe in recipes], -1)
+    assert [recipe_counters(recipe)[0] for recipe in recipes] == [1, 1, 0]
+
+
+@pytest.mark.django_db
+def test_refresh_counters_after_bulk_operations(author, recipes, fans):
+    '''bulk_create и delete_rows не шлют сигналов: счётчики
+       пересчитываются по фактическим строкам.'''
+
+    Favorite.objects.bulk_create(
+        Favorite(user=fan, recipe=recipe)
+        for fan in fans for recipe in recipes[:2])
+    Follow.objects.bulk_create(Follow(user=fan, author=author)
+                               for fan in fans)
+    assert recipe_counters(recipes[0]) == (0, 0)
+
+    refresh_counters(Favorite, [recipe.id for recipe in recipes])
+    refresh_counters(Follow, [author.id])
+    assert [recipe_counters(recipe)[0] for recipe in recipes] == [3, 3, 0]
+    assert user_counters(author) == (3, 3)
+
+    delete_rows(Favorite.objects.filter(user=fans[0]))
+    refresh_counters(Favorite, [recipes[0].id])
+    assert recipe_counters(recipes[0])[0] == 2
+    assert recipe_counters(recipes[1])[0] == 3
+
+
+@pytest.mark.django_db
+def test_recount_repairs_drift(author, recipes, fans):
+    Favorite.objects.create(user=fans[0], recipe=recipes[0])
+    Cart.objects.create(user=fans[0], recipe=recipes[1])
+    Follow.objects.create(user=fans[0], author=author)
+    Recipe.objects.update(favorites_count=7, carts_count=0)
+    User.objects.filter(pk=author.pk).update(recipes_count=0,
+                                             followers_count=5)
+
+    output = StringIO()
+    call_command('recount', stdout=output)
+
+    assert 'Рецепты: исправлено записей - 3.' in output.getvalue()
+    assert 'Пользователи: исправлено записей - 1.' in output.getvalue()
+    assert [recipe_counters(recipe) for recipe in recipes] == [
+        (1, 0), (0, 1), (0, 0)]
+    assert user_counters(author) == (3, 1)
+    output = StringIO()
+    call_command('recount', stdout=output)
+    assert output.getvalue().count('исправлено записей - 0.') == 2
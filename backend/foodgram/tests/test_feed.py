@@ -0,0 +1,42 @@
+import pytest
+from django.core.cache import cache
+
+from api import feed
+from users.models import Follow
+
+URL = '/api/recipes/feed/'
+
+
+@pytest.fixture
+def cached_feed(user, author, make_recipes, monkeypatch):
+    '''Лента из восьми рецептов автора, новые первыми, с окном в кэше.'''
+
+    monkeypatch.setattr(feed, 'FEED_CACHE_MIN_FOLLOWS', 1)
+    Follow.objects.create(user=user, author=author)
+    return make_recipes(8)[::-1]
+
+
+def ids(response):
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+@pytest.mark.django_db
+def test_deleted_recipes_do_not_shorten_page(user_client, user,
+                                             cached_feed):
+    assert ids(user_client.get(URL, {'limit': 3})) == [
+        recipe.id for recipe in cached_feed[:3]]
+    assert cache.get(feed.feed_key(user.id)) is not None
+    for recipe in cached_feed[:2]:
+        recipe.delete()
+    assert ids(user_client.get(URL, {'limit': 3})) == [
+        recipe.id for recipe in cached_feed[2:5]]
+
+
+@pytest.mark.django_db
+def test_deleted_recipes_on_cursor_page(user_client, cached_feed):
+    response = user_client.get(URL, {'limit': 3})
+    for recipe in cached_feed[3:5]:
+        recipe.delete()
+    assert ids(user_client.get(response.data['next'])) == [
+        recipe.id for recipe in cached_feed[5:8]]
@@ -0,0 +1,97 @@
+import base64
+import tracemalloc
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from api.fields import CHUNK_SIZE, StreamingBase64ImageField
+
+
+def image_bytes(size, image_format='JPEG'):
+    output = BytesIO()
+    Image.effect_noise((size, size), 64).convert('RGB').save(
+        output, image_format, quality=95)
+    return output.getvalue()
+
+
+def jpeg(size):
+    return base64.b64encode(image_bytes(size)).decode()
+
+
+def decode(data):
+    return StreamingBase64ImageField().to_internal_value(data)
+
+
+@pytest.mark.parametrize('prefix', ['', 'data:image/jpeg;base64,'])
+def test_decodes_with_and_without_header(prefix):
+    data = jpeg(32)
+    upload = StreamingBase64ImageField().to_internal_value(prefix + data)
+    with Image.open(upload) as image:
+        assert (image.format, image.size) == ('JPEG', (32, 32))
+
+
+def test_decodes_base64_with_line_breaks():
+    '''base64 с переносами строк, как у base64.encodebytes, и с
+       пробелами на границе частей декодирования.'''
+
+    raw = image_bytes(400)
+    wrapped = base64.encodebytes(raw).decode()
+    spaced = base64.b64encode(raw).decode()
+    spaced = ' \r\n'.join(spaced[i:i + 1001]
+                          for i in range(0, len(spaced), 1001))
+    assert len(spaced) > 2 * CHUNK_SIZE
+    for data in (wrapped, 'data:image/jpeg;base64,' + spaced):
+        with decode(data) as upload:
+            assert upload.read() == raw
+
+
+@pytest.mark.parametrize('data', ['abc!', 'abcde', '\u0444' * 8])
+def test_rejects_invalid_base64(data):
+    with pytest.raises(ValidationError):
+        decode(data)
+
+
+@pytest.mark.parametrize('image_format', ['JPEG', 'PNG', 'GIF'])
+def test_rejects_truncated_image(image_format):
+    raw = image_bytes(64, image_format)
+    with Image.open(BytesIO(raw[:len(raw) // 2])) as image:
+        assert image.size == (64, 64)
+    with pytest.raises(ValidationError):
+        decode(base64.b64encode(raw[:len(raw) // 2]).decode())
+
+
+def test_strips_jpeg_with_fill_bytes():
+    '''Перед маркерами JPEG допускаются байты-заполнители 0xFF.'''
+
+    output = BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'Камера'
+    Image.new('RGB', (16, 16), 'red').save(output, 'JPEG', exif=exif)
+    raw = output.getvalue()
+    filled = raw[:2] + raw[2:].replace(b'\xff\xe1', b'\xff\xff\xff\xe1', 1)
+    with decode(base64.b64encode(filled).decode()) as upload:
+        stripped = upload.read()
+    assert b'Exif' not in stripped
+    with Image.open(BytesIO(stripped)) as image:
+        assert image.size == (16, 16)
+
+
+def test_rejects_payload_over_limit_before_decoding():
+    field = StreamingBase64ImageField(max_bytes=1000)
+    with pytest.raises(ValidationError, match='1000'):
+        field.to_internal_value('data:image/jpeg;base64,' + 'A' * 1400)
+
+
+def test_peak_memory_does_not_grow_with_upload():
+    '''Строка base64 не копируется: пик памяти - порядка одной части.'''
+
+    field = StreamingBase64ImageField()
+    data = 'data:image/jpeg;base64,' + jpeg(1024)
+    tracemalloc.start()
+    field.to_internal_value(data).close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert len(data) > 1024 * 1024
+    assert peak < len(data) / 2
@@ -0,0 +1,140 @@
+import base64
+import os
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.utils import timezone
+from PIL import Image
+
+from api.images import VARIANTS, VARIANTS_DIR, storage, variant_names
+from api.storage import hash_from_name
+from recipes.models import Recipe, StoredFile
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+def png(width, height, color='red'):
+    output = BytesIO()
+    Image.new('RGB', (width, height), color).save(output, 'PNG')
+    return output.getvalue()
+
+
+def payload(tags, ingredients, image):
+    return {
+        'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+        'tags': [tags[0].id],
+        'ingredients': [{'id': ingredients[0].id, 'amount': 10}],
+        'image': 'data:image/png;base64,' + base64.b64encode(image).decode(),
+    }
+
+
+def build():
+    output = StringIO()
+    call_command('build_image_variants', '--workers', '1',
+                 stdout=output, stderr=output)
+    return output.getvalue()
+
+
+def age(path, hours=48):
+    past = time.time() - hours * 3600
+    os.utime(path, (past, past))
+
+
+@pytest.mark.django_db
+def test_variants_built_by_command_not_request(
+        user_client, tags, ingredients, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.post(
+            '/api/recipes/', payload(tags, ingredients, png(2000, 1000)),
+            format='json')
+    assert response.status_code == 201, response.data
+    assert response.data['image_variants'] is None
+    recipe = Recipe.objects.get()
+    image_hash = hash_from_name(recipe.image.name)
+    assert recipe.image_hash == ''
+    assert not any(map(storage.exists, variant_names(image_hash)))
+
+    assert 'Варианты построены: 1 из 1.' in build()
+    recipe.refresh_from_db()
+    assert recipe.image_hash == image_hash
+    for (variant, size), index in zip(VARIANTS, range(0, 6, 2)):
+        webp, jpg = variant_names(image_hash)[index:index + 2]
+        for name in (webp, jpg):
+            with Image.open(storage.path(name)) as image:
+                assert image.size == (size, size // 2)
+    variants = user_client.get(
+        f'/api/recipes/{recipe.id}/').data['image_variants']
+    assert variants['thumb']['webp'].endswith(
+        variant_names(image_hash)[-2])
+    assert 'Варианты построены: 0 из 0.' in build()
+
+
+@pytest.mark.django_db
+def test_new_image_queued_for_variants(user_client, user, tags,
+                                       ingredients):
+    response = user_client.post(
+        '/api/recipes/', payload(tags, ingredients, png(40, 40)),
+        format='json')
+    recipe_id = response.data['id']
+    build()
+    old_hash = Recipe.objects.get(pk=recipe_id).image_hash
+
+    response = user_client.patch(
+        f'/api/recipes/{recipe_id}/',
+        payload(tags, ingredients, png(40, 40, 'blue')), format='json')
+    assert response.status_code == 200, response.data
+    assert response.data['image_variants'] is None
+    assert Recipe.objects.get(pk=recipe_id).image_hash == ''
+    build()
+    new_hash = Recipe.objects.get(pk=recipe_id).image_hash
+    assert new_hash and new_hash != old_hash
+    assert all(map(storage.exists, variant_names(new_hash)))
+
+
+@pytest.mark.django_db
+def test_broken_image_reported(author):
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт', text='Текст', cooking_time=10,
+        image=ContentFile(b'not an image', name='photo.png'))
+    output = build()
+    assert f'Рецепт {recipe.id}:' in output
+    assert 'Варианты построены: 0 из 1.' in output
+    assert Recipe.objects.get(pk=recipe.pk).image_hash == ''
+
+
+@pytest.mark.django_db
+def test_collect_media_deletes_variants(author):
+    '''Варианты лежат в хранилище оригиналов: сборщик удаляет их вместе
+       с оригиналом, а с --scan - и варианты без рецепта.'''
+
+    recipe = Recipe.objects.create(
+        author=author, name='Рецепт', text='Текст', cooking_time=10,
+        image=ContentFile(png(40, 40), name='photo.png'))
+    build()
+    recipe.refresh_from_db()
+    names = variant_names(recipe.image_hash)
+    assert all(map(storage.exists, names))
+    unknown = variant_names('f' * 64)
+    for name in unknown:
+        storage.write(name, ContentFile(b'variant'))
+    age(storage.path(os.path.dirname(unknown[0])))
+    original = recipe.image.name
+    recipe.delete()
+    age(storage.path(original))
+    StoredFile.objects.filter(name=original).update(
+        updated=timezone.now() - timedelta(hours=48))
+
+    call_command('collect_media', '--scan', stdout=StringIO())
+
+    assert not storage.exists(original)
+    assert not any(map(storage.exists, names + unknown))
+    assert not os.path.exists(storage.path(os.path.dirname(unknown[0])))
+    assert os.path.isdir(storage.path(VARIANTS_DIR))
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from recipes.models import (Cart, Favorite, Recipe, ShoppingListItem,
+                            StoredFile)
+
+
+def load(tmp_path, records, *args):
+    path = tmp_path / 'data.json'
+    path.write_text(json.dumps(records), encoding='utf-8')
+    call_command('load_csv', str(path), *args, stdout=StringIO())
+
+
+def shopping_list(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount'))
+
+
+@pytest.mark.django_db
+def test_load_rebuilds_shopping_lists_and_counters(tmp_path, user,
+                                                   make_recipes, ingredients):
+    recipe, = make_recipes(1)
+    load(tmp_path, [
+        {'model': 'recipes.cart',
+         'fields': {'user': user.id, 'recipe': recipe.id}},
+        {'model': 'recipes.recipeingredient',
+         'fields': {'recipe': recipe.id, 'ingredient': ingredients[9].id,
+                    'amount': 4}},
+    ])
+    assert shopping_list(user) == {
+        item.ingredient_id: item.amount
+        for item in recipe.ingredient_list.all()}
+    assert shopping_list(user)[ingredients[9].id] == 4
+    recipe.refresh_from_db()
+    assert recipe.carts_count == 1
+
+
+@pytest.mark.django_db
+def test_truncate_cascades_and_rebuilds(tmp_path, user, author,
+                                        make_recipes):
+    old, new = make_recipes(2)
+    Cart.objects.create(user=user, recipe=old)
+    Recipe.objects.filter(pk=old.pk).update(image='recipes/old.png')
+    load(tmp_path, [
+        {'model': 'recipes.recipe', 'pk': new.pk + 1, 'fields': {
+            'name': 'Загруженный', 'author': author.id, 'text': 'Текст',
+            'cooking_time': 5, 'image': 'recipes/new.png'}},
+    ], '--truncate')
+    assert list(Recipe.objects.values_list('name', flat=True)) == [
+        'Загруженный']
+    assert not Cart.objects.exists()
+    assert shopping_list(user) == {}
+    author.refresh_from_db()
+    assert author.recipes_count == 1
+    assert dict(StoredFile.objects.values_list('name', 'references')) == {
+        'recipes/new.png': 1}
+
+
+@pytest.mark.django_db
+def test_load_keeps_dates_from_file(tmp_path, user, author):
+    '''Даты из файла не затираются временем загрузки, а записи без
+       даты получают текущее время.'''
+
+    published = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    started = timezone.now()
+    load(tmp_path, [
+        {'model': 'recipes.recipe', 'pk': 1, 'fields': {
+            'name': 'Старый', 'author': author.id, 'text': 'Текст',
+            'cooking_time': 5, 'pub_date': published.isoformat()}},
+        {'model': 'recipes.recipe', 'pk': 2, 'fields': {
+            'name': 'Без даты', 'author': author.id, 'text': 'Текст',
+            'cooking_time': 5}},
+        {'model': 'recipes.favorite', 'fields': {
+            'user': user.id, 'recipe': 1, 'created': published.isoformat()}},
+    ])
+    assert Recipe.objects.get(pk=1).pub_date == published
+    assert Recipe.objects.get(pk=2).pub_date >= started
+    assert Favorite.objects.get().created == published
+    field = Recipe._meta.get_field('pub_date')
+    assert field.auto_now_add and not field.auto_now
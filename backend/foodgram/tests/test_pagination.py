@@ -0,0 +1,57 @@
+import pytest
+
+from recipes.models import Recipe
+
+URL = '/api/recipes/'
+
+
+def walk(client, params):
+    '''id рецептов всех страниц курсорной пагинации.'''
+
+    ids = []
+    response = client.get(URL, {**params, 'cursor': '', 'limit': 4})
+    while True:
+        ids += [recipe['id'] for recipe in response.data['results']]
+        if response.data['next'] is None:
+            return ids
+        response = client.get(response.data['next'])
+
+
+@pytest.mark.django_db
+def test_cursor_walks_all_recipes_in_order(client, make_recipes):
+    make_recipes(15)
+    expected = list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+        'id', flat=True))
+    assert walk(client, {}) == expected
+
+
+@pytest.mark.django_db
+def test_cursor_with_ties(client, make_recipes):
+    recipes = make_recipes(15)
+    for number, recipe in enumerate(recipes):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=number % 3)
+    expected = list(Recipe.objects.order_by(
+        '-favorites_count', '-id').values_list('id', flat=True))
+    assert walk(client, {'ordering': 'popular'}) == expected
+
+
+@pytest.mark.django_db
+def test_deep_cursor_matches_offset_page(client, make_recipes):
+    make_recipes(20)
+    by_page = client.get(URL, {'page': 4, 'limit': 4}).data['results']
+    ids = walk(client, {})
+    assert [recipe['id'] for recipe in by_page] == ids[12:16]
+
+
+@pytest.mark.django_db
+def test_cursor_by_search_rank(client, make_recipes):
+    recipes = make_recipes(12)
+    for number, recipe in enumerate(recipes):
+        Recipe.objects.filter(pk=recipe.pk).update(
+            text=' '.join(['суп'] * (1 + number % 4) + ['вода'] * number))
+        Recipe.objects.get(pk=recipe.pk).save()
+    full = client.get(URL, {'search': 'суп', 'limit': 100}).data['results']
+    assert len(full) == 12
+    assert walk(client, {'search': 'суп'}) == [
+        recipe['id'] for recipe in full]
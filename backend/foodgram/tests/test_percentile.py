@@ -0,0 +1,14 @@
+import pytest
+
+from api.management.commands._stats import percentile
+
+
+@pytest.mark.parametrize('values, share, expected', [
+    ([], 0.5, None),
+    ([7], 0.99, 7),
+    (list(range(10)), 0.5, 5),
+    (list(range(10)), 0.9, 9),
+    (list(range(100)), 0.99, 99),
+])
+def test_percentile(values, share, expected):
+    assert percentile(values, share) == expected
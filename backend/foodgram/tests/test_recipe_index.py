@@ -0,0 +1,87 @@
+import pytest
+
+from api import recipe_index
+from api.recipe_index import RecipeIndex, apply, build, log_recipe_changes
+from recipes.models import RecipeIndexChange, RecipeIngredient
+
+
+def ids(ranking):
+    return sorted(recipe_id for recipe_id, _ in ranking)
+
+
+@pytest.fixture
+def index(db):
+    return RecipeIndex()
+
+
+def test_apply_leaves_previous_arrays_unchanged():
+    postings, sizes = build([(1, 1), (1, 2), (2, 1), (3, 2)])
+    before = {key: list(value) for key, value in postings.items()}
+    arrays = dict(postings)
+    new_postings, new_sizes = apply(postings, sizes, {1: [3], 4: [1, 2]})
+    assert {key: list(value) for key, value in postings.items()} == before
+    assert all(postings[key] is arrays[key] for key in arrays)
+    assert list(sizes) == [0, 2, 2]
+    assert {key: list(value) for key, value in new_postings.items()} == {
+        1: [2, 4], 2: [4], 3: [1, 2]}
+    assert list(new_sizes) == [0, 1, 2, 0, 2]
+
+
+@pytest.mark.django_db
+def test_logged_change_is_applied_without_rebuild(
+        index, make_recipes, ingredients, monkeypatch,
+        django_capture_on_commit_callbacks):
+    first, second = make_recipes(2)
+    assert first.id in ids(index.search([ingredients[0].id]))
+    previous = index._snapshot
+    monkeypatch.setattr(index, '_load', None)
+    with django_capture_on_commit_callbacks(execute=True):
+        RecipeIngredient.objects.filter(recipe=first).delete()
+        RecipeIngredient.objects.create(
+            recipe=first, ingredient=ingredients[9], amount=1)
+        log_recipe_changes([first.id])
+    assert first.id not in ids(index.search([ingredients[0].id]))
+    assert index.search([ingredients[9].id])[0] == (first.id, 1.0)
+    assert list(previous.postings[ingredients[0].id]) == [first.id]
+
+
+@pytest.mark.django_db
+def test_deleted_recipe_leaves_index(
+        index, make_recipes, ingredients,
+        django_capture_on_commit_callbacks):
+    first, second = make_recipes(2)
+    assert ids(index.search([ingredients[1].id])) == [first.id, second.id]
+    with django_capture_on_commit_callbacks(execute=True):
+        first.delete()
+    assert ids(index.search([ingredients[1].id])) == [second.id]
+
+
+@pytest.mark.django_db
+def test_log_is_polled_without_new_version(
+        index, make_recipes, ingredients, monkeypatch):
+    '''Версия в кэше не изменилась (сбой кэша, другой узел): изменения
+       приходят из журнала при следующей сверке.'''
+
+    first, = make_recipes(1)
+    index.search([ingredients[0].id])
+    RecipeIngredient.objects.filter(recipe=first).delete()
+    log_recipe_changes([first.id])
+    assert ids(index.search([ingredients[0].id])) == [first.id]
+    monkeypatch.setattr(recipe_index, 'POLL_SECONDS', 0)
+    assert ids(index.search([ingredients[0].id])) == []
+
+
+@pytest.mark.django_db
+def test_full_change_rebuilds(index, make_recipes, ingredients, monkeypatch,
+                              django_capture_on_commit_callbacks):
+    first, = make_recipes(1)
+    index.search([ingredients[0].id])
+    loads = []
+    load = index._load
+    monkeypatch.setattr(
+        index, '_load', lambda version: loads.append(version) or load(version))
+    with django_capture_on_commit_callbacks(execute=True):
+        ingredients[0].delete()
+    assert RecipeIndexChange.objects.filter(recipe_id=None).exists()
+    assert ids(index.search([ingredients[1].id])) == [first.id]
+    assert len(loads) == 1
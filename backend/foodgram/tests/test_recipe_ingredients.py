@@ -0,0 +1,90 @@
+import base64
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from api.utils import create_ingredients, update_ingredients
+from recipes.models import Ingredient, Recipe
+
+SIZES = [2, 6, 20]
+
+
+@pytest.fixture
+def many_ingredients(db):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Продукт {i}', measurement_unit='г')
+        for i in range(3 * SIZES[-1]))
+    return list(Ingredient.objects.order_by('id').values_list(
+        'id', flat=True))
+
+
+@pytest.fixture
+def recipe(author):
+    return Recipe.objects.create(author=author, name='Рецепт', text='Текст',
+                                 cooking_time=10)
+
+
+def png_base64():
+    output = BytesIO()
+    Image.new('RGB', (2, 2), 'red').save(output, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(output.getvalue()).decode())
+
+
+def amounts(ids, amount=10):
+    return [{'id': pk, 'amount': amount} for pk in ids]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('size', SIZES)
+def test_create_ingredients_single_insert(recipe, many_ingredients, size,
+                                          django_assert_num_queries):
+    with django_assert_num_queries(1):
+        create_ingredients(amounts(many_ingredients[:size]), recipe)
+    assert recipe.ingredient_list.count() == size
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('size', SIZES)
+def test_update_ingredients_queries(recipe, many_ingredients, size,
+                                    django_assert_num_queries):
+    '''Чтение текущих строк, DELETE, UPDATE и INSERT - независимо от
+       числа ингредиентов.'''
+
+    create_ingredients(amounts(many_ingredients[:2 * size]), recipe)
+    kept = many_ingredients[size:2 * size]
+    changed = amounts(kept[:size // 2], 20) + amounts(kept[size // 2:])
+    added = amounts(many_ingredients[2 * size:3 * size])
+    with django_assert_num_queries(4):
+        changes = update_ingredients(changed + added, recipe)
+    assert dict(recipe.ingredient_list.values_list(
+        'ingredient_id', 'amount')) == {
+            item['id']: item['amount'] for item in changed + added}
+    assert changes == {
+        **{pk: -10 for pk in many_ingredients[:size]},
+        **{pk: 10 for pk in kept[:size // 2]},
+        **{item['id']: 10 for item in added},
+    }
+
+
+@pytest.mark.django_db
+def test_update_ingredients_unchanged_no_writes(recipe, many_ingredients,
+                                                django_assert_num_queries):
+    create_ingredients(amounts(many_ingredients[:5]), recipe)
+    with django_assert_num_queries(1):
+        assert update_ingredients(amounts(many_ingredients[:5]),
+                                  recipe) == {}
+
+
+@pytest.mark.django_db
+def test_unknown_ingredients_listed(user_client, tags, ingredients):
+    response = user_client.post('/api/recipes/', {
+        'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+        'tags': [tags[0].id], 'image': png_base64(),
+        'ingredients': amounts([ingredients[0].id, 99998, 99999]),
+    }, format='json')
+    assert response.status_code == 400
+    message = str(response.data)
+    assert '99998' in message and '99999' in message
+    assert str(ingredients[0].id) + ',' not in message
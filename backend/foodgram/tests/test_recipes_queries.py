@@ -0,0 +1,53 @@
+import pytest
+
+from recipes.models import Cart, Favorite
+from users.models import Follow
+
+URL = '/api/recipes/'
+
+
+def list_queries(client, limit, django_assert_num_queries, expected):
+    with django_assert_num_queries(expected):
+        response = client.get(URL, {'limit': limit})
+    assert response.status_code == 200
+    assert len(response.data['results']) == limit
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('limit', [1, 6, 30])
+def test_recipe_list_anonymous_queries(client, make_recipes, limit,
+                                       django_assert_num_queries):
+    '''COUNT, страница рецептов и по запросу на теги, авторов и
+       ингредиенты - независимо от размера страницы.'''
+
+    make_recipes(30)
+    list_queries(client, limit, django_assert_num_queries, 5)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('limit', [1, 6, 30])
+def test_recipe_list_user_queries(user, author, user_client, make_recipes,
+                                  limit, django_assert_num_queries):
+    recipes = make_recipes(30)
+    Follow.objects.create(user=user, author=author)
+    for recipe in recipes[::2]:
+        Favorite.objects.create(user=user, recipe=recipe)
+        Cart.objects.create(user=user, recipe=recipe)
+    list_queries(user_client, limit, django_assert_num_queries, 5)
+
+
+@pytest.mark.django_db
+def test_recipe_list_flags(user, author, user_client, make_recipes):
+    recipes = make_recipes(2)
+    Follow.objects.create(user=user, author=author)
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    Cart.objects.create(user=user, recipe=recipes[1])
+    results = {recipe['id']: recipe
+               for recipe in user_client.get(URL).data['results']}
+    first, second = results[recipes[0].id], results[recipes[1].id]
+    assert (first['is_favorited'], first['is_in_shopping_cart']) == (
+        True, False)
+    assert (second['is_favorited'], second['is_in_shopping_cart']) == (
+        False, True)
+    assert first['author']['is_subscribed'] is True
+    assert len(first['ingredients']) == 3
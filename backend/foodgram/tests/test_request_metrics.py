@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from rest_framework import serializers
+
+from api import middleware
+from recipes.models import Tag
+
+
+@pytest.fixture
+def sampled(monkeypatch):
+    monkeypatch.setattr(middleware, 'SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(serializers.Serializer, 'data',
+                        serializers.Serializer.data)
+    monkeypatch.setattr(serializers.ListSerializer, 'data',
+                        serializers.ListSerializer.data)
+
+
+def records(caplog):
+    return [json.loads(record.message) for record in caplog.records
+            if record.name == 'api.metrics']
+
+
+@pytest.mark.django_db
+def test_streamed_queries_are_logged_after_body(sampled, caplog):
+    def rows():
+        for _ in range(3):
+            yield f'{Tag.objects.count()}\n'
+
+    metrics = middleware.RequestMetricsMiddleware(
+        lambda request: StreamingHttpResponse(rows()))
+    caplog.set_level('INFO', logger='api.metrics')
+    response = metrics(RequestFactory().get('/api/export/'))
+    assert 'db;desc="0 queries"' in response['Server-Timing']
+    assert records(caplog) == []
+    assert b''.join(response.streaming_content) == b'0\n0\n0\n'
+    record, = records(caplog)
+    assert (record['queries'], record['streaming']) == (3, True)
+
+
+@pytest.mark.django_db
+def test_serializers_are_not_patched_by_default(sampled, caplog):
+    data = serializers.Serializer.data
+    metrics = middleware.RequestMetricsMiddleware(
+        lambda request: HttpResponse(Tag.objects.count()))
+    caplog.set_level('INFO', logger='api.metrics')
+    response = metrics(RequestFactory().get('/api/tags/'))
+    assert serializers.Serializer.data is data
+    assert 'serializer' not in response['Server-Timing']
+    record, = records(caplog)
+    assert (record['queries'], record['serializer_ms']) == (1, None)
+
+
+def test_serializer_timing_setting_patches_data(sampled, monkeypatch):
+    monkeypatch.setattr(middleware, 'SERIALIZER_TIMING', True)
+    middleware.RequestMetricsMiddleware(HttpResponse)
+    assert serializers.Serializer.data.fget.timed
+    assert serializers.ListSerializer.data.fget.timed
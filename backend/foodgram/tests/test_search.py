@@ -0,0 +1,25 @@
+import pytest
+
+from recipes.models import Recipe
+
+URL = '/api/recipes/'
+
+
+def found(client, query):
+    response = client.get(URL, {'search': query, 'limit': 100})
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+@pytest.mark.django_db
+def test_search_ranks_name_above_text(client, author):
+    in_text, in_name, other = (
+        Recipe.objects.create(author=author, name=name, text=text,
+                              cooking_time=10)
+        for name, text in [('Обед', 'Горячий борщ со сметаной'),
+                           ('Борщ', 'Свёкла, капуста и картофель'),
+                           ('Салат', 'Огурцы и помидоры')])
+    assert found(client, 'борщ') == [in_name.id, in_text.id]
+
+    in_name.delete()
+    assert found(client, 'борщ') == [in_text.id]
+    assert found(client, 'нет такого') == []
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from recipes.models import Cart, Recipe, ShoppingListItem
+
+INVALID = ['abc', '0', '-1', '1.5', '32768']
+EXPORT_URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.fixture
+def recipe(make_recipes):
+    '''Рецепт на 2 порции с ингредиентами по 10, 11 и 12 г.'''
+
+    recipe, = make_recipes(1)
+    Recipe.objects.filter(pk=recipe.pk).update(servings=2)
+    return recipe
+
+
+def amounts(response):
+    assert response.status_code == 200, response.data
+    return {item['id']: item['amount']
+            for item in response.data['ingredients']}
+
+
+def amounts_of(recipe):
+    return {item['id']: item['amount'] for item in recipe['ingredients']}
+
+
+def shopping_list(user):
+    return dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount'))
+
+
+@pytest.mark.django_db
+def test_amounts_scaled_in_query(client, recipe):
+    url = f'/api/recipes/{recipe.id}/'
+    base = amounts(client.get(url))
+    response = client.get(url, {'servings': 3})
+    assert response.data['servings'] == 3
+    assert amounts(response) == {
+        pk: round(amount * 1.5, 3) for pk, amount in base.items()}
+    listed = client.get('/api/recipes/', {'servings': 4}).data['results']
+    assert amounts_of(listed[0]) == {
+        pk: amount * 2 for pk, amount in base.items()}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('servings', INVALID)
+def test_invalid_servings_rejected(client, user_client, recipe, servings):
+    assert client.get(f'/api/recipes/{recipe.id}/',
+                      {'servings': servings}).status_code == 400
+    assert client.get('/api/recipes/',
+                      {'servings': servings}).status_code == 400
+    response = user_client.post(
+        f'/api/recipes/{recipe.id}/shopping_cart/', {'servings': servings},
+        format='json')
+    assert response.status_code == 400
+    assert 'servings' in response.data
+    assert not Cart.objects.exists()
+    assert user_client.get(EXPORT_URL, {
+        'format': 'json', 'servings': servings}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_cart_servings_feed_shopping_list(user_client, user, recipe):
+    url = f'/api/recipes/{recipe.id}/shopping_cart/'
+    assert user_client.post(url).status_code == 201
+    base = shopping_list(user)
+    assert sorted(base.values()) == [10, 11, 12]
+    user_client.delete(url)
+    response = user_client.post(url, {'servings': 6}, format='json')
+    assert response.status_code == 201
+    assert Cart.objects.get(user=user).servings == 6
+    assert shopping_list(user) == {
+        pk: amount * 3 for pk, amount in base.items()}
+
+
+@pytest.mark.django_db
+def test_export_with_servings(user_client, recipe):
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def export(**params):
+        response = user_client.get(EXPORT_URL, {'format': 'json', **params})
+        assert response.status_code == 200
+        return json.loads(b''.join(response.streaming_content))
+
+    def totals(rows):
+        return sorted(row['amount'] for row in rows)
+
+    assert totals(export()) == [10, 11, 12]
+    assert totals(export(servings=1)) == [5, 5.5, 6]
+    assert totals(export(servings=8)) == [40, 44, 48]
@@ -0,0 +1,26 @@
+import pytest
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('export_format, content_type', [
+    ('txt', 'text/plain'),
+    ('csv', 'text/csv'),
+    ('json', 'application/json'),
+    ('pdf', 'application/pdf'),
+])
+def test_download_formats(user_client, make_recipes, export_format,
+                          content_type):
+    for recipe in make_recipes(2):
+        user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    response = user_client.get(URL, {'format': export_format})
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith(content_type)
+    assert response['Content-Disposition'] == (
+        f'attachment; filename="shopping_cart.{export_format}"')
+    content = b''.join(response.streaming_content)
+    if export_format == 'pdf':
+        assert content.startswith(b'%PDF')
+    else:
+        assert 'Ингредиент 1'.encode() in content
@@ -0,0 +1,48 @@
+import pytest
+
+from users.models import Follow, User
+
+URL = '/api/users/subscriptions/'
+
+
+@pytest.fixture
+def follow_authors(user, make_recipes):
+    '''Подписывает пользователя на count авторов с тремя рецептами.'''
+
+    def follow(count):
+        for number in range(count):
+            author = User.objects.create_user(
+                email=f'author{number}@foodgram.ru',
+                username=f'author{number}', password='password',
+                first_name='Имя', last_name='Фамилия')
+            make_recipes(3, author=author)
+            Follow.objects.create(user=user, author=author)
+    return follow
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 5, 20])
+def test_subscriptions_queries(user_client, follow_authors, count,
+                               django_assert_num_queries):
+    '''COUNT, страница авторов и их рецепты - независимо от числа
+       авторов и recipes_limit.'''
+
+    follow_authors(count)
+    with django_assert_num_queries(3):
+        response = user_client.get(URL, {'limit': 100, 'recipes_limit': 2})
+    assert response.status_code == 200
+    authors = response.data['results']
+    assert len(authors) == count
+    for author in authors:
+        assert author['is_subscribed'] is True
+        assert author['recipes_count'] == 3
+        assert len(author['recipes']) == 2
+
+
+@pytest.mark.django_db
+def test_recipes_limit_keeps_latest(user_client, follow_authors):
+    follow_authors(2)
+    for author in user_client.get(URL, {'recipes_limit': 1}).data['results']:
+        latest = User.objects.get(pk=author['id']).recipes.order_by(
+            '-pub_date', '-id').first()
+        assert [recipe['id'] for recipe in author['recipes']] == [latest.id]
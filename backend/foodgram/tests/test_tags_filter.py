@@ -0,0 +1,46 @@
+import pytest
+
+from recipes.models import Recipe
+
+URL = '/api/recipes/'
+
+
+def listed(client, slugs):
+    response = client.get(URL, {'tags': slugs, 'limit': 100})
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.data['results']]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 2, 3])
+def test_tags_filter_matches_join(client, make_recipes, tags, count):
+    '''Тот же набор рецептов, что у фильтра через JOIN с DISTINCT, и
+       без дублей для рецептов с несколькими тегами.'''
+
+    make_recipes(12)
+    slugs = [tag.slug for tag in tags[:count]]
+    ids = listed(client, slugs)
+    assert len(ids) == len(set(ids))
+    assert set(ids) == set(Recipe.objects.filter(
+        tags__slug__in=slugs).distinct().values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+def test_unknown_tag_rejected(client, make_recipes):
+    make_recipes(2)
+    response = client.get(URL, {'tags': 'unknown'})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('count', [1, 3])
+def test_tags_filter_queries(client, make_recipes, tags, count,
+                             django_assert_num_queries):
+    '''Слаги тегов берутся из кэша: число запросов не зависит от
+       числа тегов в фильтре.'''
+
+    make_recipes(12)
+    slugs = [tag.slug for tag in tags[:count]]
+    listed(client, slugs)
+    with django_assert_num_queries(5):
+        listed(client, slugs)
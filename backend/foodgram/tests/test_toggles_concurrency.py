@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Follow, User
+
+THREADS = 8
+pytestmark = [
+    pytest.mark.django_db(transaction=True),
+    # Тестовая база SQLite в памяти с общим кэшем сразу отвечает
+    # "table is locked" на параллельную запись вместо ожидания.
+    pytest.mark.skipif(connection.vendor == 'sqlite',
+                       reason='параллельная запись - только в Postgres'),
+]
+
+
+def run_parallel(calls):
+    '''Выполняет вызовы одновременно в пуле потоков, у каждого потока -
+       своё соединение с базой.'''
+
+    def run(call):
+        try:
+            return call()
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(run, calls))
+
+
+def request(user, method, path, data=None):
+    def call():
+        client = APIClient()
+        client.force_authenticate(user)
+        response = getattr(client, method)(path, data, format='json')
+        body = response.json() if response.content else None
+        return response.status_code, body
+    return call
+
+
+@pytest.fixture
+def users(db):
+    return [
+        User.objects.create_user(
+            email=f'fan{number}@foodgram.ru', username=f'fan{number}',
+            password='password', first_name='Имя', last_name='Фамилия')
+        for number in range(THREADS)
+    ]
+
+
+@pytest.fixture
+def recipes(make_recipes):
+    return make_recipes(3)
+
+
+def counters(recipe):
+    recipe = Recipe.objects.get(pk=recipe.pk)
+    return recipe.favorites_count, recipe.carts_count
+
+
+@pytest.mark.parametrize('suffix, model', [('favorite', Favorite),
+                                           ('shopping_cart', Cart)])
+def test_double_click_adds_and_removes_once(user, recipes, suffix, model):
+    path = f'/api/recipes/{recipes[0].id}/{suffix}/'
+    results = run_parallel([request(user, 'post', path)] * THREADS)
+    statuses = sorted(status for status, _ in results)
+    assert statuses == [201] + [400] * (THREADS - 1)
+    assert all(set(body) == {'non_field_errors'}
+               for status, body in results if status == 400)
+    assert model.objects.filter(user=user).count() == 1
+    assert counters(recipes[0]) == (
+        (1, 0) if model is Favorite else (0, 1))
+
+    results = run_parallel([request(user, 'delete', path)] * THREADS)
+    assert sorted(status for status, _ in results) == (
+        [204] + [400] * (THREADS - 1))
+    assert not model.objects.filter(user=user).exists()
+    assert counters(recipes[0]) == (0, 0)
+
+
+def test_different_users_on_one_recipe(users, recipes):
+    '''Каждый пользователь добавляет рецепт в избранное и корзину,
+       половина затем удаляет: счётчики равны числу строк.'''
+
+    recipe = recipes[0]
+
+    def toggle(user, remove):
+        def call():
+            for suffix in ('favorite', 'shopping_cart'):
+                path = f'/api/recipes/{recipe.id}/{suffix}/'
+                assert request(user, 'post', path)()[0] == 201
+                if remove:
+                    assert request(user, 'delete', path)()[0] == 204
+        return call
+
+    run_parallel([toggle(user, number % 2)
+                  for number, user in enumerate(users)])
+    favorites = Favorite.objects.filter(recipe=recipe).count()
+    carts = Cart.objects.filter(recipe=recipe).count()
+    assert favorites == carts == THREADS // 2
+    assert counters(recipe) == (favorites, carts)
+
+
+def test_bulk_and_single_toggles_keep_counters(users, recipes):
+    ids = [recipe.id for recipe in recipes]
+
+    def mixed(number, user):
+        def call():
+            if number % 2:
+                request(user, 'post', '/api/recipes/favorite/',
+                        {'ids': ids})()
+                request(user, 'delete', '/api/recipes/favorite/',
+                        {'ids': ids[:1]})()
+            else:
+                for recipe_id in ids:
+                    request(user, 'post',
+                            f'/api/recipes/{recipe_id}/favorite/')()
+                request(user, 'delete', '/api/recipes/favorite/')()
+                request(user, 'post', '/api/recipes/favorite/',
+                        {'ids': ids[1:]})()
+        return call
+
+    run_parallel([mixed(number, user) for number, user in enumerate(users)])
+    for recipe in recipes:
+        assert counters(recipe)[0] == Favorite.objects.filter(
+            recipe=recipe).count()
+    assert counters(recipes[0])[0] == 0
+    assert counters(recipes[1])[0] == THREADS
+
+
+def test_duplicate_subscribe(user, author):
+    path = f'/api/users/{author.id}/subscribe/'
+    results = run_parallel([request(user, 'post', path)] * THREADS)
+    assert sorted(status for status, _ in results) == (
+        [201] + [400] * (THREADS - 1))
+    assert all(set(body) == {'non_field_errors'}
+               for status, body in results if status == 400)
+    assert Follow.objects.filter(user=user).count() == 1
+    assert User.objects.get(pk=author.pk).followers_count == 1
@@ -0,0 +1,91 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from api.units import display_amount, totals_by_unit
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+EXPORT_URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.fixture
+def recipe(author):
+    '''Рецепт, в котором мука - в граммах и килограммах, пекарский
+       порошок - в ложках и граммах, соль - в ложках (без перевода).'''
+
+    recipe = Recipe.objects.create(author=author, name='Пирог',
+                                   text='Текст', cooking_time=30)
+    amounts = [('мука', 'г', 500), ('мука', 'кг', 1),
+               ('пекарский порошок', 'ч. л.', 2),
+               ('пекарский порошок', 'г', 3), ('соль', 'ч. л.', 1)]
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, amount=amount,
+                         ingredient=Ingredient.objects.create(
+                             name=name, measurement_unit=unit))
+        for name, unit, amount in amounts)
+    return recipe
+
+
+def units(name):
+    return set(Ingredient.objects.filter(name=name).values_list(
+        'measurement_unit', 'base_unit', 'base_factor'))
+
+
+@pytest.mark.django_db
+def test_base_unit_set_on_save(recipe):
+    assert units('мука') == {('г', 'г', 1), ('кг', 'г', 1000)}
+    assert units('пекарский порошок') == {('ч. л.', 'г', 5), ('г', 'г', 1)}
+    # Правило для ложек задано только для пекарского порошка.
+    assert units('соль') == {('ч. л.', 'ч. л.', 1)}
+
+
+@pytest.mark.django_db
+def test_totals_by_unit_merges_units(recipe):
+    rows = totals_by_unit(RecipeIngredient.objects.filter(recipe=recipe),
+                          F('amount'))
+    assert list(rows) == [('мука', 'г', 1500), ('пекарский порошок', 'г', 13),
+                          ('соль', 'ч. л.', 1)]
+
+
+@pytest.mark.parametrize('amount, unit, expected', [
+    (999, 'г', (999, 'г')),
+    (1000, 'г', (1, 'кг')),
+    (1500.0, 'г', (1.5, 'кг')),
+    (2500, 'мл', (2.5, 'л')),
+    (1 / 3, 'г', (0.333, 'г')),
+    (5000, 'шт', (5000, 'шт')),
+])
+def test_display_amount(amount, unit, expected):
+    assert display_amount(amount, unit) == expected
+
+
+@pytest.mark.django_db
+def test_export_in_display_units(user_client, recipe):
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    response = user_client.get(EXPORT_URL, {'format': 'json'})
+    rows = json.loads(b''.join(response.streaming_content))
+    assert [(row['name'], row['amount'], row['measurement_unit'])
+            for row in rows] == [('мука', 1.5, 'кг'),
+                                 ('пекарский порошок', 13, 'г'),
+                                 ('соль', 1, 'ч. л.')]
+
+
+@pytest.mark.django_db
+def test_load_csv_resolves_units_per_batch(tmp_path):
+    path = tmp_path / 'ingredients.csv'
+    path.write_text('\n'.join(
+        f'продукт {number},{("г", "кг", "ч. л.")[number % 3]}'
+        for number in range(30)), encoding='utf-8')
+    with CaptureQueriesContext(connection) as queries:
+        call_command('load_csv', str(path), '--batch-size', '10',
+                     stdout=StringIO())
+    assert sum('recipes_unitconversion' in query['sql']
+               for query in queries.captured_queries) == 3
+    assert set(Ingredient.objects.values_list(
+        'measurement_unit', 'base_unit', 'base_factor')) == {
+            ('г', 'г', 1), ('кг', 'г', 1000), ('ч. л.', 'ч. л.', 1)}
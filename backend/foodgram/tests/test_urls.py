@@ -0,0 +1,40 @@
+import importlib
+import re
+
+import pytest
+from django.urls import clear_url_caches, resolve
+
+from api import urls
+
+SAMPLE_VALUES = {'pk': '1', 'id': '1', 'format': 'json'}
+
+
+def sample_path(pattern):
+    '''Путь, подходящий под регулярное выражение маршрута роутера.'''
+
+    path = re.sub(r'\(\?P<(\w+)>[^)]+\)',
+                  lambda match: SAMPLE_VALUES[match[1]], pattern)
+    return '/api/' + path.lstrip('^').rstrip('$').replace(
+        '/?', '/').replace('\\.', '.')
+
+
+def reload_urls(settings):
+    importlib.reload(urls)
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@pytest.fixture(params=[False, True], ids=['wsgi', 'asgi'])
+def server_urls(request, settings):
+    async_views = settings.ASYNC_VIEWS
+    settings.ASYNC_VIEWS = request.param
+    reload_urls(settings)
+    yield request.param
+    settings.ASYNC_VIEWS = async_views
+    reload_urls(settings)
+
+
+def test_every_router_url_resolves_to_its_view(server_urls):
+    for pattern in urls.router.urls:
+        path = sample_path(pattern.pattern.regex.pattern)
+        assert resolve(path).url_name == pattern.name, path
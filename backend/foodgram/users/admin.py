@@ -4,7 +4,9 @@ from .models import User, Follow
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'email', 'username', 'first_name', 'last_name')
+    list_display = ('pk', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
+    readonly_fields = ('recipes_count', 'followers_count')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     list_filter = ('username', 'email')
     empty_value_display = 'нет данных'
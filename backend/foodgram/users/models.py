@@ -35,6 +35,14 @@ class User(AbstractUser):
         default=USER,
         verbose_name='Роль в системе'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков',
+    )
 
     class Meta:
         ordering = ['id']
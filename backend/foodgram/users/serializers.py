@@ -29,6 +29,8 @@ class UsersSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         '''Проверка на подписку.'''
 
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (request.user.is_authenticated
                 and Follow.objects.filter(user=request.user, author=obj)
@@ -1,11 +1,17 @@
 from djoser.views import UserViewSet
 from rest_framework import status, decorators, permissions, response
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from users.models import User, Follow
 from users.serializers import UsersSerializer
-from api.serializers import FollowSerializer
+from api.serializers import BulkIdsSerializer, FollowSerializer
 from api.pagination import LimitPageNumberPagination
+from api.rows import delete_rows, insert_ignore
+from api.utils import annotate_authors, bulk_model_instances, update_derived
 
 
 # fmt: off
@@ -26,31 +32,49 @@ class MyUserViewSet(UserViewSet):
 
         user = request.user
         author_id = self.kwargs.get('id')
-        author = get_object_or_404(User, id=author_id)
         if request.method == 'POST':
+            author = get_object_or_404(User, id=author_id)
             serializer = FollowSerializer(author, data=request.data,
                                           context={'request': request})
-            serializer.is_valid()
-            Follow.objects.create(user=user, author=author)
-            return response.Response(serializer.data,
-                                     status=status.HTTP_201_CREATED)
-        get_object_or_404(Follow, user=user, author=author).delete()
+            serializer.is_valid(raise_exception=True)
+            with transaction.atomic():
+                if not insert_ignore(Follow, user=user, author=author):
+                    raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                        FollowSerializer.conflict_message]})
+                update_derived(user, Follow, [author.id], 1)
+            author = annotate_authors(
+                User.objects.filter(id=author.id), request).get()
+            return response.Response(
+                FollowSerializer(author, context={'request': request}).data,
+                status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            deleted = delete_rows(Follow.objects.filter(
+                user=user, author_id=author_id))
+            if deleted:
+                update_derived(user, Follow, [author_id], -1)
+        if not deleted:
+            raise Http404
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
     @decorators.action(
         detail=False,
-        methods=['GET'],
+        methods=['GET', 'POST', 'DELETE'],
         permission_classes=(permissions.IsAuthenticated,)
     )
     def subscriptions(self, request):
         '''Возвращаем список авторов, на которых
-           подписан текущий пользователь.'''
+           подписан текущий пользователь. POST и DELETE - пакетная
+           подписка и отписка по списку ids, DELETE без ids - отписка
+           от всех.'''
 
+        if request.method != 'GET':
+            return bulk_model_instances(request, Follow, BulkIdsSerializer)
         return self.get_paginated_response(
             FollowSerializer(
-                self.paginate_queryset(
-                    User.objects.filter(following__user=request.user)
-                ),
+                self.paginate_queryset(annotate_authors(
+                    User.objects.filter(following__user=request.user),
+                    request
+                ).order_by('id')),
                 many=True,
                 context={'request': request},
             ).data